@@ -1,8 +1,12 @@
 import os
-import json
-from typing import List, Optional, Tuple
+import sys
+from typing import Dict, List, Optional, Tuple
 from pydantic import BaseModel, Field, ValidationError, model_validator
 
+# shared validation engine, see custom-models/dataset-validation-engine
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "dataset-validation-engine"))
+from validation_engine import PydanticRecordSchema, TokenCounter, TokenStats, ValidationEngine
+
 # Constants
 MIN_LINES = 32
 MAX_TRAINING_LINES = 10000
@@ -13,6 +17,7 @@ CHARS_PER_TOKEN = 3
 MAX_TRAINING_SIZE_GB = 10
 MAX_VALIDATION_SIZE_GB = 1
 RESERVED_KEYWORDS = ["\nHuman:", "\nAssistant:"]
+DEDUP_THRESHOLD = 0.8
 
 class Message(BaseModel):
     role: str = Field(..., pattern="^(user|assistant)$")
@@ -44,28 +49,44 @@ class DataEntry(BaseModel):
                 
         return self
 
+def format_error(error: Dict) -> str:
+    """Format an error of the validation report"""
+    if error["type"] == "json_invalid":
+        return "Invalid JSON"
+    if error["type"] == "value_error":
+        return f"Structure error: {error['msg']}"
+    location = ".".join(str(loc) for loc in error["loc"])
+    return f"Field '{location}': {error['msg']}"
+
 def validate_data_entry(entry: dict) -> Tuple[bool, List[str]]:
     try:
         DataEntry(**entry)
         return True, []
     except ValidationError as e:
-        errors = []
-        for error in e.errors():
-            if error["type"] == "value_error":
-                errors.append(f"Structure error: {error['msg']}")
-            else:
-                location = ".".join(str(loc) for loc in error["loc"])
-                errors.append(f"Field '{location}': {error['msg']}")
+        errors = [format_error(error) for error in e.errors()]
         return False, errors     
 
-def count_tokens(text: str) -> int:
-    """Estimate the number of tokens in a given text."""
-    return len(text) // CHARS_PER_TOKEN
+def entry_texts(entry: DataEntry) -> List[str]:
+    """The texts of a valid entry that count towards its tokens"""
+    return ([entry.system] if entry.system else []) + [msg.content for msg in entry.messages]
+
+def entry_texts_from_json(entry) -> List[str]:
+    """The texts of a parsed JSON entry compared for duplicates, leaving out the system prompt"""
+    messages = entry.get("messages") if isinstance(entry, dict) else None
+    if not isinstance(messages, list):
+        return []
+    return [msg["content"] for msg in messages if isinstance(msg, dict) and isinstance(msg.get("content"), str)]
+
+def validate_file(file_path: str, is_training: bool = True, workers: Optional[int] = None,
+                  tokenizer: Optional[str] = None, output_file: Optional[str] = None) -> Tuple[List[str], int, TokenStats]:
+    """
+    Validate a JSONL file with the shared validation engine, reporting the errors of up to 100 invalid lines.
 
-def validate_file(file_path: str, is_training: bool = True) -> Tuple[List[str], int]:
-    """Validate a JSONL file"""
+    The token counts of the valid entries are computed in the same pass, estimated from CHARS_PER_TOKEN or with a
+    `tokenizers` tokenizer (tokenizer.json file or Hugging Face Hub model id). With an output_file, the valid
+    entries within MAX_TOKENS are written to it.
+    """
     errors = []
-    line_count = 0
     
     file_size_gb = os.path.getsize(file_path)/(1024*1024*1024)
     if is_training:
@@ -75,22 +96,22 @@ def validate_file(file_path: str, is_training: bool = True) -> Tuple[List[str],
         if file_size_gb > MAX_VALIDATION_SIZE_GB:
             errors.append(f"Validation file size ({file_size_gb:.2f} GB) exceeds the maximum allowed size ({MAX_VALIDATION_SIZE_GB} GB)")
     
-    with open(file_path, 'r', encoding='utf-8') as f:
-        for line_num, line in enumerate(f, 1):
-            line_count += 1
-            try:
-                data = json.loads(line)
-            except json.JSONDecodeError:
-                errors.append(f"Line {line_num}: Invalid JSON")
-                continue
-            is_valid, entry_errors = validate_data_entry(data)
-            if not is_valid:
-                for error in entry_errors:
-                    errors.append(f"Line {line_num}: {error}")
-            total_tokens = (count_tokens(data.get('system', '')) + 
-                        sum(count_tokens(msg['content']) for msg in data['messages']))
-            if total_tokens > MAX_TOKENS:
-                errors.append(f"Line {line_num}: Exceeds maximum token count ({total_tokens} > {MAX_TOKENS})")
+    token_counter = TokenCounter(tokenizer, max_tokens=MAX_TOKENS, chars_per_token=CHARS_PER_TOKEN, texts=entry_texts)
+    engine = ValidationEngine(PydanticRecordSchema(DataEntry), workers=workers, token_counter=token_counter,
+                              output_file=output_file)
+    report = engine.validate_file(file_path)
+    for record in report.invalid_records:
+        for error in record.errors:
+            errors.append(f"Line {record.line}: {format_error(error)}")
+    if report.truncated:
+        errors.append(f"... and {report.num_invalid_records - len(report.invalid_records)} more invalid lines")
+    token_stats = report.token_stats
+    for line, num_tokens in token_stats.over_limit_lines:
+        errors.append(f"Line {line}: Exceeds maximum token count ({num_tokens} > {MAX_TOKENS})")
+    if token_stats.num_over_limit > len(token_stats.over_limit_lines):
+        errors.append(f"... and {token_stats.num_over_limit - len(token_stats.over_limit_lines)} more lines exceeding "
+                      f"the maximum token count")
+    line_count = report.num_records
 
     if is_training:
         if line_count > MAX_TRAINING_LINES or line_count < MIN_LINES:
@@ -99,10 +120,13 @@ def validate_file(file_path: str, is_training: bool = True) -> Tuple[List[str],
         if line_count > MAX_VALIDATION_LINES or line_count < MIN_LINES:
             errors.append(f"File has {line_count} lines. Validation data should have between {MIN_LINES} and {MAX_VALIDATION_LINES} lines.")
 
-    return errors, line_count
+    return errors, line_count, token_stats
 
-def print_validation_results(file_path: str, errors: List[str]) -> None:
-    """Print the validation results."""
+def print_validation_results(file_path: str, errors: List[str], token_stats: Optional[TokenStats] = None,
+                             price_per_1k_tokens: Optional[float] = None, epochs: int = 1) -> None:
+    """Print the validation results, with the token statistics of the valid entries."""
+    if token_stats:
+        print("\n".join(token_stats.format(price_per_1k_tokens, epochs)))
     if errors:
         print(f"Validation FAILED for {file_path}. Errors:")
         for error in errors:
@@ -110,19 +134,38 @@ def print_validation_results(file_path: str, errors: List[str]) -> None:
     else:
         print(f"Validation SUCCESSFUL for {file_path}.")
 
-def validate_data(training_path: str, validation_path: Optional[str] = None) -> None:
-    """Validate training data and optionally validation data."""
+def validate_data(training_path: str, validation_path: Optional[str] = None, tokenizer: Optional[str] = None,
+                  price_per_1k_tokens: Optional[float] = None, epochs: int = 1, deduplicate: bool = False,
+                  dedup_threshold: Optional[float] = DEDUP_THRESHOLD, dedup_output_dir: Optional[str] = None) -> None:
+    """
+    Validate training data and optionally validation data.
+
+    Token counts are estimated from the number of characters unless a tokenizer is given; with a price per 1000
+    tokens, the training cost of the training data is estimated too. With deduplicate, exact and near-duplicate
+    entries (estimated similarity >= dedup_threshold, None for exact duplicates only) are reported, as well as
+    validation entries that duplicate training entries; the deduplicated files are written to dedup_output_dir.
+    """
     print("Validating Training Data...")
-    training_errors, training_lines = validate_file(training_path)
-    print_validation_results(training_path, training_errors)
+    training_errors, training_lines, training_tokens = validate_file(training_path, tokenizer=tokenizer)
+    print_validation_results(training_path, training_errors, training_tokens, price_per_1k_tokens, epochs)
     
     total_lines = training_lines
     if validation_path:
         print("\nValidating Validation Data...")
-        validation_errors, validation_lines = validate_file(validation_path)
-        print_validation_results(validation_path, validation_errors)
+        validation_errors, validation_lines, validation_tokens = validate_file(validation_path, is_training=False,
+                                                                               tokenizer=tokenizer)
+        print_validation_results(validation_path, validation_errors, validation_tokens)
         total_lines = total_lines + validation_lines
         
+    if deduplicate:
+        # deduplication needs numpy, only imported when it is used
+        from validation_engine.dedup import Deduplicator
+
+        print("\nChecking for duplicates...")
+        dedup_report = Deduplicator(threshold=dedup_threshold, texts=entry_texts_from_json).run(
+            training_path, validation_path, dedup_output_dir)
+        print("\n".join(dedup_report.format()))
+
     if total_lines > MAX_TOTAL_LINES:
         print(f"\nError: Total number of lines ({total_lines}) exceeds the maximum allowed ({MAX_TOTAL_LINES}.")
     elif not training_errors and (not validation_path or not validation_errors):
@@ -1,12 +1,14 @@
 import argparse
-import json
-from jsonschema import validate, ValidationError
+import os
+import sys
 
 from utils.constants import *
 from utils.model_config.models_registry import MODELS
-from utils.model_config.input_type import InputType
 from utils.exceptions.invalid_row_exception import InvalidRowException
-from utils.schema import Schema
+
+# shared validation engine, see custom-models/dataset-validation-engine
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "dataset-validation-engine"))
+from validation_engine import ValidationEngine, add_token_arguments, token_counter_from_args
 
 
 def validate_record_count(record_count, dataset_type):
@@ -32,63 +34,29 @@ def validate_record_count(record_count, dataset_type):
         )
 
 
-def validate_converse(row, index):
+def validate_dataset(file_path, model_name, dataset_type, workers=None, token_counter=None, output_file=None):
     """
-    Validates a single row of conversational data against the Converse schema.
-
-    Checks for:
-    - Compliance with Schema.Converse JSON schema
-    - Valid message roles
-    - Proper image handling (assistants cannot include images)
-
-    Args:
-        row (dict): A dictionary containing the conversation data
-        index (int): The row index in the dataset for error reporting
+    Validates every row of the dataset with the shared validation engine, using the record schema of the model's
+    input type (see utils/model_config/models_registry.py). With a token counter, the token lengths of the rows are
+    computed in the same pass; with an output file, the valid rows within the token limit are written to it.
 
     Raises:
-        InvalidRowException: If the row fails validation, with details about the error
-        ValidationError: If the JSON schema validation fails
+        Exception: If the record count exceeds the limit for the dataset type or any row is invalid
     """
-    try:
-        validate(row, Schema.Converse)
-        dialogue = row[Keys.MESSAGES]
-        for message in dialogue:
-            role = message[Keys.ROLE]
-            supported_roles = [member.value for member in list(Roles)]
-            if role not in supported_roles:
-                raise InvalidRowException(
-                    f"The role '{role}' is not supported. Supported roles are: {supported_roles}. ",
-                    index,
-                )
-
-            for content in message[Keys.CONTENT]:
-                if Keys.IMAGE in content:
-                    if role == Roles.ASSISTANT:
-                        raise InvalidRowException(
-                            f"A message with the role '{Roles.ASSISTANT}' should not contain any images. ",
-                            index,
-                        )
-    except ValidationError as e:
-        raise InvalidRowException(f"{e}\n\n", index)
-
-
-def validate_prompt_completion(row, index):
-    """
-    Validates a single row of prompt-completion data against the PROMPT_COMPLETION schema.
-
-    Args:
-        row (dict): A dictionary containing the prompt-completion data
-        index (int): The row index in the dataset for error reporting
-
-    Raises:
-        InvalidRowException: If the row fails validation, with details about the error
-        ValidationError: If the JSON schema validation fails
+    engine = ValidationEngine(
+        MODELS[model_name].record_schema, workers=workers, token_counter=token_counter, output_file=output_file
+    )
+    report = engine.validate_file(file_path)
+    validate_record_count(report.num_records, dataset_type)
 
-    """
-    try:
-        validate(row, Schema.PROMPT_COMPLETION)
-    except ValidationError as e:
-        raise InvalidRowException(f"{e}\n\n", index)
+    if not report.valid:
+        for record in report.invalid_records:
+            for error in record.errors:
+                print(InvalidRowException(f"{error['msg']}\n", record.line - 1))
+        if report.truncated:
+            print(f"... and {report.num_invalid_records - len(report.invalid_records)} more invalid rows.")
+        raise Exception(f"{report.num_invalid_records} out of {report.num_records} rows are invalid.")
+    return report
 
 
 def main():
@@ -116,6 +84,14 @@ def main():
         required=True,
         help="Specify the model name.",
     )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of worker processes (default: number of CPUs).",
+    )
+    add_token_arguments(parser)
 
     args = parser.parse_args()
     dataset_type, file_path, model_name = (
@@ -124,17 +100,12 @@ def main():
         args.model_name,
     )
 
-    model = MODELS[model_name]
-
-    with open(file_path, "r") as file:
-        dataset = [json.loads(line) for line in file]
-        validate_record_count(len(dataset), dataset_type)
-        for index, row in enumerate(dataset):
-            if model.input_type == InputType.CONVERSE:
-                validate_converse(row, index)
-            if model.input_type == InputType.PROMPT_COMPLETION:
-                validate_prompt_completion(row, index)
+    token_counter = token_counter_from_args(args, MODELS[model_name].max_tokens)
+    report = validate_dataset(file_path, model_name, dataset_type, args.workers, token_counter, args.drop_over_limit)
 
+    print("\n".join(report.token_stats.format(args.price_per_1k_tokens, args.epochs)))
+    if args.drop_over_limit:
+        print(f"Wrote the rows within the token limit to {args.drop_over_limit}.")
     print("Validation complete.")
 
 
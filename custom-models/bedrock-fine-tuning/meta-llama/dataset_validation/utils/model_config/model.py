@@ -7,6 +7,15 @@ class Model:
         self,
         model_type: ModelType,
         input_type: list[InputType],
+        max_tokens: int = 16000,
     ):
         self.model_type = model_type
         self.input_type = input_type
+        self.max_tokens = max_tokens
+
+    @property
+    def record_schema(self):
+        """The validation engine schema for the records of this model's input type."""
+        from .models_registry import RECORD_SCHEMAS
+
+        return RECORD_SCHEMAS[self.input_type]
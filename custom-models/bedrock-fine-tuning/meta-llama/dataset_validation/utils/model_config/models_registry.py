@@ -1,6 +1,13 @@
 from .model import Model
 from .model_type import ModelType
 from .input_type import InputType
+from utils import record_schemas
+
+# validation engine schema for each input type
+RECORD_SCHEMAS = {
+    InputType.CONVERSE: record_schemas.CONVERSE,
+    InputType.PROMPT_COMPLETION: record_schemas.PROMPT_COMPLETION,
+}
 
 MODELS = {
     "llama3-1-8b": Model(
@@ -26,5 +33,6 @@ MODELS = {
     "llama3-2-90b": Model(
         model_type=ModelType.MULTIMODAL,
         input_type=InputType.CONVERSE,
+        max_tokens=10000,
     ),
 }
@@ -0,0 +1,29 @@
+import os
+import sys
+
+from utils.constants import Keys, Roles
+from utils.schema import Schema
+
+# shared validation engine, see custom-models/dataset-validation-engine
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "..", "dataset-validation-engine")
+)
+from validation_engine import JsonSchemaRecordSchema
+
+
+def check_messages(row):
+    """Checks that message roles are supported and that assistant messages do not contain images."""
+    supported_roles = [member.value for member in list(Roles)]
+    for message in row[Keys.MESSAGES]:
+        role = message[Keys.ROLE]
+        if role not in supported_roles:
+            raise ValueError(f"The role '{role}' is not supported. Supported roles are: {supported_roles}. ")
+
+        for content in message[Keys.CONTENT]:
+            if Keys.IMAGE in content and role == Roles.ASSISTANT:
+                raise ValueError(f"A message with the role '{Roles.ASSISTANT}' should not contain any images. ")
+
+
+CONVERSE = JsonSchemaRecordSchema(Schema.Converse, checks=[check_messages])
+
+PROMPT_COMPLETION = JsonSchemaRecordSchema(Schema.PROMPT_COMPLETION)
@@ -1,15 +1,23 @@
 import argparse
 import json
+import os
 import re
+import sys
 
 from pydantic import BaseModel, ValidationError, ValidationInfo, field_validator, model_validator
 from typing import List, Optional
 
+# shared validation engine, see custom-models/dataset-validation-engine
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "..", "dataset-validation-engine"))
+from validation_engine import PydanticRecordSchema, ValidationEngine, add_token_arguments, token_counter_from_args
+
 
 IMAGE_FORMATS = ["jpeg", "png", "gif", "webp"]
 VIDEO_FORMATS = ["mov", "mkv", "mp4", "webm"]
 MAX_NUM_IMAGES = 10
 MODEL_TO_NUM_SAMPLES_MAP = {"micro": (8, 20000), "lite": (8, 20000), "pro": (8, 20000)}
+SHARD_SIZE = 8 * 1024 * 1024  # bytes of the input file validated per worker task in streaming mode
+MAX_ERRORS = 100  # failed samples reported in detail in streaming mode, the rest are only counted
 
 
 class ConverseRoles:
@@ -224,11 +232,14 @@ class ConverseDatasetSample(BaseModel):
 
 def validate_converse_dataset(args):
     """Validates the entire conversation dataset against Nova format requirements."""
+    if getattr(args, "stream", False):
+        return validate_converse_dataset_streaming(args)
+
     samples = load_jsonl_data(args.input_file)
     num_samples = len(samples)
     validate_data_record_bounds(num_samples, args.model_name)
 
-    error_message = ""
+    error_messages = []
     failed_samples_id_list = []
 
     for i, sample in enumerate(samples):
@@ -236,29 +247,83 @@ def validate_converse_dataset(args):
             ConverseDatasetSample.model_validate(sample, context={"model_name": args.model_name})
         except ValidationError as e:
             failed_samples_id_list.append(i)
-            error_message += f"Sample {i} - "
-            for err in e.errors():
-                err["msg"] = err["msg"].replace("Value error, ", "")
-                sample_error_message = f"{err['loc']}: {err['msg']} (type={err['type']}). "
-                error_message += sample_error_message
+            error_messages.append(format_sample_errors(i, e.errors()))
         except Exception as e:
             raise NovaInternalError(f"Error occured: {e}")
 
-    if error_message:
-        prefix_str = f"Problematic samples: "
+    if error_messages:
+        raise NovaClientError(format_failed_samples(failed_samples_id_list) + "".join(error_messages))
+    else:
+        print("Validation successful, all samples passed")
+
+
+def format_sample_errors(sample_id, errors):
+    """Formats the pydantic errors of a sample as 'Sample i - loc: msg (type=...). ...'."""
+    parts = [f"Sample {sample_id} - "]
+    for err in errors:
+        msg = err["msg"].replace("Value error, ", "")
+        parts.append(f"{tuple(err['loc'])}: {msg} (type={err['type']}). ")
+    return "".join(parts)
 
-        if len(failed_samples_id_list) > 3:
-            first_sample_id = failed_samples_id_list[0]
-            second_sample_id = failed_samples_id_list[1]
-            last_sample_id = failed_samples_id_list[-1]
-            failed_samples_str = f"[{first_sample_id}, {second_sample_id}, ...{last_sample_id}]. "
-        else:
-            failed_samples_str = f"{failed_samples_id_list}. "
 
-        final_err_msg = prefix_str + failed_samples_str + error_message
-        raise NovaClientError(final_err_msg)
+def format_failed_samples(failed_samples_id_list):
+    """Formats the prefix listing the failed sample ids, shortened when there are more than 3."""
+    if len(failed_samples_id_list) > 3:
+        first_sample_id = failed_samples_id_list[0]
+        second_sample_id = failed_samples_id_list[1]
+        last_sample_id = failed_samples_id_list[-1]
+        failed_samples_str = f"[{first_sample_id}, {second_sample_id}, ...{last_sample_id}]. "
     else:
-        print("Validation successful, all samples passed")
+        failed_samples_str = f"{failed_samples_id_list}. "
+    return "Problematic samples: " + failed_samples_str
+
+
+def validate_converse_dataset_streaming(args):
+    """
+    Validates the dataset without loading it into memory, using the shared validation engine.
+
+    The file is split into byte ranges on line boundaries that are validated by a pool of worker processes, with a
+    pydantic TypeAdapter built once per process validating the raw JSON of each line. Only the errors of the first
+    max_errors failed samples are kept. The token lengths of the valid samples are computed in the same pass, and
+    with args.drop_over_limit the valid samples within args.max_tokens are written to that file. The engine's
+    validation report is returned, written to args.report if given, and NovaClientError is raised if the dataset is
+    invalid.
+    """
+    check_jsonl_file(args.input_file)
+    engine = ValidationEngine(
+        PydanticRecordSchema(ConverseDatasetSample, context={"model_name": args.model_name}),
+        workers=getattr(args, "workers", None),
+        shard_size=SHARD_SIZE,
+        max_errors=getattr(args, "max_errors", None) or MAX_ERRORS,
+        token_counter=token_counter_from_args(args) if hasattr(args, "tokenizer") else None,
+        output_file=getattr(args, "drop_over_limit", None),
+    )
+    report = engine.validate_file(args.input_file)
+    if report.token_stats:
+        print("\n".join(report.token_stats.format(args.price_per_1k_tokens, args.epochs)))
+    try:
+        validate_data_record_bounds(report.num_records, args.model_name)
+    except NovaClientError as e:
+        report.dataset_errors.append(str(e))
+
+    if getattr(args, "report", None):
+        report.write_json(args.report)
+
+    if report.valid:
+        print(f"Validation successful, all {report.num_records} samples passed")
+        return report
+
+    # samples are numbered from 0 as in the default mode
+    failed_samples = [(record.line - 1, record.errors) for record in report.invalid_records]
+    error_messages = report.dataset_errors[:]
+    if failed_samples:
+        error_messages.append(
+            format_failed_samples([sample_id for sample_id, _ in failed_samples])
+            + "".join(format_sample_errors(sample_id, errors) for sample_id, errors in failed_samples)
+        )
+    if report.truncated:
+        error_messages.append(f"{report.num_invalid_records - len(failed_samples)} more failed samples not shown.")
+    raise NovaClientError(" ".join(error_messages))
 
 
 def check_roles_order(messages):
@@ -334,5 +399,32 @@ if __name__ == "__main__":
         required=True,
         help="Choose a model from: micro, lite, pro",
     )
+    parser.add_argument(
+        "-s",
+        "--stream",
+        action="store_true",
+        help="Validate in streaming mode with parallel workers, for large datasets",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of worker processes in streaming mode (default: number of CPUs)",
+    )
+    parser.add_argument(
+        "--max_errors",
+        type=int,
+        default=MAX_ERRORS,
+        help=f"Number of failed samples reported in detail in streaming mode (default: {MAX_ERRORS})",
+    )
+    parser.add_argument(
+        "-r",
+        "--report",
+        type=str,
+        default=None,
+        help="Write a JSON validation report to this file in streaming mode",
+    )
+    add_token_arguments(parser)
     args = parser.parse_args()
     validate_converse_dataset(args)
@@ -0,0 +1,394 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Builds the Nova tool-use fine-tuning dataset from a question bank (e.g. ../assets/train_data.txt), executing the
+expected tool call of each example.
+
+Tools are looked up in a registry built from the tool modules of this folder: the name comes from the module's
+get_tool_spec() and the function is its fetch_* function. Tool calls run concurrently on a thread pool, with a
+per-tool limit on calls per second and on calls in flight. Every successful call is stored in a persistent cache
+(SQLite) keyed by the tool name and its arguments, so regenerating a dataset only calls the tools for new arguments,
+and replay mode builds the dataset from the cache alone, without calling any external API.
+
+Examples whose tool call fails are left out of the dataset. The records have the same format as the ones written by
+02_prepare_toolcall_dataset_for_bedrock_nova_ft.ipynb.
+"""
+
+import argparse
+import ast
+import hashlib
+import importlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, List, Optional
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+log = logging.getLogger(__name__)
+
+DEFAULT_TOOL_MODULES = [
+    "weather_api_call",
+    "stat_pull",
+    "terminal",
+    "text_to_sql",
+    "wikipidea",
+    "youtube_search",
+    "pubmed_search",
+    "duckduckgo_results_json",
+]
+DEFAULT_CACHE_PATH = "../assets/tool_cache.sqlite"
+DEFAULT_WORKERS = 16
+SYSTEM_PROMPT = "You are a bot that can handle different requests with tools."
+
+# same prompt as 02_prepare_toolcall_dataset_for_bedrock_nova_ft.ipynb, trailing spaces included
+PROMPT_TEMPLATE = (
+    "\nGiven the following functions within <tools>, please respond with a JSON for a function call with its proper "
+    "arguments that best answers the given prompt.\n"
+    'Respond in the format {"name": function name, "parameters": dictionary of argument name and its value}.'
+    "Do not use variables. Donot give any explanations. \n"
+    "ONLY output the resulting JSON structure and nothing else.Donot use the word 'json' anywhere in the result.\n"
+    "\n"
+    "<tools>{tool_config}</tools>\n"
+    "\n"
+    "Generate answer for the following question.\n"
+    "<question>{question}</question>\n"
+)
+
+
+class RateLimiter:
+    """Thread-safe token bucket: at most `rate` calls per second, in bursts of at most `burst` calls."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+@dataclass
+class Tool:
+    """A tool of the registry, with its own limits on calls per second and on concurrent calls."""
+
+    name: str
+    spec: Dict
+    function: Callable
+    rate_limiter: Optional[RateLimiter] = None
+    semaphore: Optional[threading.Semaphore] = None
+
+    def __call__(self, input_data):
+        if self.semaphore:
+            self.semaphore.acquire()
+        try:
+            if self.rate_limiter:
+                self.rate_limiter.acquire()
+            return self.function(input_data)
+        finally:
+            if self.semaphore:
+                self.semaphore.release()
+
+
+class ToolRegistry:
+    """Tools by name, in registration order, as used in the tool config of the prompts."""
+
+    def __init__(self):
+        self.tools: Dict[str, Tool] = {}
+
+    def register(self, spec, function, rate_limit=None, max_concurrency=None):
+        """
+        Register a tool.
+
+        :param spec: The tool specification, as returned by get_tool_spec().
+        :param function: The function that executes the tool, called with the tool input.
+        :param rate_limit: Maximum number of calls per second, or None for no limit.
+        :param max_concurrency: Maximum number of calls in flight, or None for no limit.
+        """
+        name = spec["toolSpec"]["name"]
+        self.tools[name] = Tool(
+            name=name,
+            spec=spec,
+            function=function,
+            rate_limiter=RateLimiter(rate_limit) if rate_limit else None,
+            semaphore=threading.Semaphore(max_concurrency) if max_concurrency else None,
+        )
+        return self.tools[name]
+
+    def register_module(self, module_name, rate_limit=None, max_concurrency=None):
+        """Register a tool module: a module with get_tool_spec() and a fetch_* function that executes the tool."""
+        module = importlib.import_module(module_name)
+        functions = [name for name in dir(module) if name.startswith("fetch_") and callable(getattr(module, name))]
+        if len(functions) != 1:
+            raise ValueError(f"Tool module {module_name} must define exactly one fetch_* function, found {functions}")
+        return self.register(module.get_tool_spec(), getattr(module, functions[0]), rate_limit, max_concurrency)
+
+    @classmethod
+    def from_modules(cls, module_names, rate_limits=None, max_concurrency=None, default_rate_limit=None,
+                     default_max_concurrency=None):
+        """
+        Build a registry from tool modules.
+
+        :param module_names: The tool modules to import.
+        :param rate_limits: Tool name -> maximum number of calls per second, for the tools with their own limit.
+        :param max_concurrency: Tool name -> maximum number of calls in flight, for the tools with their own limit.
+        :return: The tool registry.
+        """
+        rate_limits = rate_limits or {}
+        max_concurrency = max_concurrency or {}
+        registry = cls()
+        for module_name in module_names:
+            tool = registry.register_module(module_name)
+            rate_limit = rate_limits.get(tool.name, default_rate_limit)
+            concurrency = max_concurrency.get(tool.name, default_max_concurrency)
+            tool.rate_limiter = RateLimiter(rate_limit) if rate_limit else None
+            tool.semaphore = threading.Semaphore(concurrency) if concurrency else None
+        return registry
+
+    def tool_config(self):
+        return {"tools": [tool.spec for tool in self.tools.values()]}
+
+    def __getitem__(self, name):
+        return self.tools[name]
+
+    def __contains__(self, name):
+        return name in self.tools
+
+
+class ToolCache:
+    """Persistent tool name + arguments -> response cache, shared by the threads of a run."""
+
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, tool TEXT, input TEXT, response TEXT)"
+            )
+
+    @staticmethod
+    def key(tool_name, input_data):
+        payload = json.dumps([tool_name, input_data], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, tool_name, input_data):
+        """Return (True, response) for a cached call, (False, None) otherwise."""
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT response FROM responses WHERE key = ?", (self.key(tool_name, input_data),)
+            ).fetchone()
+        return (True, json.loads(row[0])) if row else (False, None)
+
+    def put(self, tool_name, input_data, response):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                (
+                    self.key(tool_name, input_data),
+                    tool_name,
+                    json.dumps(input_data, sort_keys=True, default=str),
+                    json.dumps(response, default=str),
+                ),
+            )
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+
+def load_question_bank(path) -> Iterator[Dict]:
+    """
+    Read a question bank: one example per line with the question, the expected tool ("answer") and its arguments
+    ("args"), as a Python literal (../assets/train_data.txt) or JSON.
+    """
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                yield ast.literal_eval(line)
+
+
+def format_record(example, formatted_tool_config):
+    """Format an example in the tooluse-dataset-2024 format of 02_prepare_toolcall_dataset_for_bedrock_nova_ft."""
+    prompt = PROMPT_TEMPLATE.replace("{question}", example["question"].strip())
+    prompt = prompt.replace("{tool_config}", formatted_tool_config)
+    return {
+        "schemaVersion": "tooluse-dataset-2024",
+        "system": [{"text": SYSTEM_PROMPT}],
+        "messages": [
+            {"role": "user", "content": [{"text": prompt}]},
+            {"role": "assistant", "content": [{"text": f"{{'name':{example['answer']}, 'parameters':{example['args']}}}"}]},
+        ],
+    }
+
+
+class DatasetRunner:
+    """
+    Executes the tool calls of a question bank and writes the dataset.
+
+    Cached calls are answered from the cache. Other calls run on a thread pool of `workers` threads, within the
+    limits of their tool, with at most `max_pending` examples in flight; results are collected in order, so the
+    dataset has the order of the question bank. With replay=True, no tool is called and the examples that are not in
+    the cache are left out.
+    """
+
+    def __init__(self, registry: ToolRegistry, cache: ToolCache, workers=DEFAULT_WORKERS, replay=False,
+                 max_pending=None):
+        self.registry = registry
+        self.cache = cache
+        self.workers = workers
+        self.replay = replay
+        self.max_pending = max_pending or 4 * workers
+        self.counts = Counter()
+        self.in_flight = {}
+
+    def call(self, tool_name, input_data):
+        """Execute a tool call and cache its response. Returns (response, error)."""
+        try:
+            response = self.registry[tool_name](input_data)
+        except Exception as e:
+            return None, f"{type(e).__name__}: {e}"
+        self.cache.put(tool_name, input_data, response)
+        return response, None
+
+    def resolve(self, executor, example):
+        """Return a callable giving the (status, response, error) of the example's tool call."""
+        tool_name, input_data = example["answer"], example["args"]
+        if tool_name not in self.registry:
+            return lambda: ("unknown tool", None, f"Unknown tool: {tool_name}")
+        key = self.cache.key(tool_name, input_data)
+        # identical calls in flight share one call; once it is done, they are answered from the cache
+        future = self.in_flight.get(key)
+        if future is None:
+            hit, response = self.cache.get(tool_name, input_data)
+            if hit:
+                return lambda: ("cached", response, None)
+            if self.replay:
+                return lambda: ("not cached", None, None)
+            future = self.in_flight[key] = executor.submit(self.call, tool_name, input_data)
+            future.add_done_callback(lambda _: self.in_flight.pop(key, None))
+
+        def result():
+            response, error = future.result()
+            return ("failed", None, error) if error else ("called", response, None)
+        return result
+
+    def run(self, examples, output_path, results_path=None) -> List[Dict]:
+        """
+        Execute the tool calls of the examples and write the records of the successful ones to output_path.
+
+        :param examples: The examples of the question bank.
+        :param output_path: The output JSONL dataset.
+        :param results_path: Optional JSONL file of the tool call and response (or error) of each example.
+        :return: The failed tool calls, as {"question", "tool", "error"}.
+        """
+        formatted_tool_config = json.dumps(self.registry.tool_config(), indent=2)
+        failures = []
+        results = open(results_path, "w", encoding="utf-8") if results_path else None
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor, \
+                    open(output_path, "w", encoding="utf-8") as output:
+                pending = deque()
+
+                def collect():
+                    example, result = pending.popleft()
+                    status, response, error = result()
+                    self.counts[status] += 1
+                    if results:
+                        results.write(json.dumps({"question": example["question"], "tool": example["answer"],
+                                                  "input": example["args"], "status": status,
+                                                  "response": response, "error": error}, default=str) + "\n")
+                    if status in ("cached", "called"):
+                        output.write(json.dumps(format_record(example, formatted_tool_config)) + "\n")
+                        self.counts["records"] += 1
+                    elif error:
+                        failures.append({"question": example["question"], "tool": example["answer"], "error": error})
+
+                for example in examples:
+                    pending.append((example, self.resolve(executor, example)))
+                    if len(pending) >= self.max_pending:
+                        collect()
+                while pending:
+                    collect()
+        finally:
+            if results:
+                results.close()
+        return failures
+
+
+def parse_limits(values, value_type):
+    """Parse TOOL=VALUE arguments into a dict."""
+    limits = {}
+    for value in values:
+        name, sep, limit = value.partition("=")
+        if not sep:
+            raise argparse.ArgumentTypeError(f"Expected TOOL=VALUE, got {value}")
+        limits[name] = value_type(limit)
+    return limits
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a Nova tool-use fine-tuning dataset, executing and caching the tool calls.")
+    parser.add_argument("-i", "--input", type=str, required=True, help="Question bank, e.g. ../assets/train_data.txt")
+    parser.add_argument("-o", "--output", type=str, required=True, help="Output JSONL dataset.")
+    parser.add_argument("-c", "--cache", type=str, default=DEFAULT_CACHE_PATH, help="Tool response cache (SQLite).")
+    parser.add_argument("-r", "--replay", action="store_true",
+                        help="Build the dataset from cached responses only, without calling the tools.")
+    parser.add_argument("-t", "--tool_module", type=str, nargs="+", default=DEFAULT_TOOL_MODULES,
+                        help="Tool modules with get_tool_spec() and a fetch_* function.")
+    parser.add_argument("--rate_limit", type=str, nargs="+", default=[], metavar="TOOL=CALLS_PER_SECOND",
+                        help="Per-tool limit on calls per second.")
+    parser.add_argument("--max_concurrency", type=str, nargs="+", default=[], metavar="TOOL=CALLS",
+                        help="Per-tool limit on calls in flight.")
+    parser.add_argument("--default_rate_limit", type=float, default=None,
+                        help="Limit on calls per second for tools without their own limit.")
+    parser.add_argument("--default_max_concurrency", type=int, default=None,
+                        help="Limit on calls in flight for tools without their own limit.")
+    parser.add_argument("-w", "--workers", type=int, default=DEFAULT_WORKERS, help="Number of threads for tool calls.")
+    parser.add_argument("--results", type=str, default=None,
+                        help="Optional JSONL file of the tool call and response of each example.")
+    args = parser.parse_args()
+
+    registry = ToolRegistry.from_modules(
+        args.tool_module,
+        rate_limits=parse_limits(args.rate_limit, float),
+        max_concurrency=parse_limits(args.max_concurrency, int),
+        default_rate_limit=args.default_rate_limit,
+        default_max_concurrency=args.default_max_concurrency,
+    )
+    cache = ToolCache(args.cache)
+    runner = DatasetRunner(registry, cache, workers=args.workers, replay=args.replay)
+    try:
+        failures = runner.run(load_question_bank(args.input), args.output, args.results)
+    finally:
+        cache.close()
+
+    for status, count in sorted(runner.counts.items()):
+        log.info(f"{status}: {count}")
+    for failure in failures[:10]:
+        log.warning(f"{failure['tool']} failed for '{failure['question']}': {failure['error']}")
+    if len(failures) > 10:
+        log.warning(f"... and {len(failures) - 10} more failed tool calls")
+    log.info(f"Wrote {runner.counts['records']} records to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
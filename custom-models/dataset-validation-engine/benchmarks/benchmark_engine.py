@@ -0,0 +1,201 @@
+"""
+Benchmarks of the validation engine over synthetic datasets of 10k to 10M rows.
+
+For each number of rows, a Converse-style JSONL dataset (with a share of invalid rows) is generated once and
+validated with each schema type and number of workers, reporting rows/s, MB/s and peak memory. With --baseline, the
+same file is also validated the way the validators used to: json.loads and jsonschema.validate per line in one
+process.
+
+    python3 benchmarks/benchmark_engine.py --rows 10000 100000 1000000 --workers 1 4 --baseline
+"""
+
+import argparse
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from typing import List, Optional
+
+from pydantic import BaseModel, Field
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from validation_engine import JsonSchemaRecordSchema, PydanticRecordSchema, TokenCounter, ValidationEngine
+
+
+CONVERSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "schemaVersion": {"type": "string"},
+        "system": {"type": "array", "items": {"type": "object", "required": ["text"]}},
+        "messages": {
+            "type": "array",
+            "minItems": 2,
+            "items": {
+                "type": "object",
+                "properties": {
+                    "role": {"type": "string", "enum": ["user", "assistant"]},
+                    "content": {"type": "array", "minItems": 1, "items": {"type": "object"}},
+                },
+                "required": ["role", "content"],
+            },
+        },
+    },
+    "required": ["messages"],
+}
+
+
+class ContentItem(BaseModel):
+    text: Optional[str] = None
+
+
+class Message(BaseModel):
+    role: str = Field(pattern="^(user|assistant)$")
+    content: List[ContentItem] = Field(min_length=1)
+
+
+class ConverseSample(BaseModel):
+    schemaVersion: Optional[str] = None
+    system: Optional[List[ContentItem]] = None
+    messages: List[Message] = Field(min_length=2)
+
+
+def check_alternating_roles(record):
+    for i, message in enumerate(record["messages"]):
+        if message["role"] != ("user" if i % 2 == 0 else "assistant"):
+            raise ValueError("Messages must alternate between user and assistant")
+
+
+def check_alternating_roles_model(sample: ConverseSample):
+    check_alternating_roles(sample.model_dump())
+
+
+SCHEMAS = {
+    "jsonschema": lambda: JsonSchemaRecordSchema(CONVERSE_SCHEMA, checks=[check_alternating_roles]),
+    "pydantic": lambda: PydanticRecordSchema(ConverseSample, checks=[check_alternating_roles_model]),
+}
+
+
+def generate_dataset(path: str, num_rows: int, invalid_rate: float, seed: int = 0) -> None:
+    """Write num_rows Converse samples of varying length, invalid_rate of them invalid (bad JSON or schema)."""
+    rng = random.Random(seed)
+    words = ["alpha", "beta", "gamma", "delta", "epsilon", "zeta", "eta", "theta"]
+    templates = []
+    for turns in (1, 2, 4):
+        messages = []
+        for turn in range(turns):
+            messages.append({"role": "user", "content": [{"text": " ".join(rng.choices(words, k=40))}]})
+            messages.append({"role": "assistant", "content": [{"text": " ".join(rng.choices(words, k=80))}]})
+        sample = {"schemaVersion": "bedrock-conversation-2024", "system": [{"text": "You are helpful."}],
+                  "messages": messages}
+        templates.append(json.dumps(sample).encode() + b"\n")
+    invalid = [b'{"messages": [{"role": "user", "content": []}]}\n', b'{"messages": [\n',
+               b'{"messages": [{"role": "assistant", "content": [{"text": "a"}]}, '
+               b'{"role": "user", "content": [{"text": "b"}]}]}\n']
+
+    with open(path, "wb") as file:
+        block = []
+        for _ in range(num_rows):
+            block.append(rng.choice(invalid) if rng.random() < invalid_rate else rng.choice(templates))
+            if len(block) == 10000:
+                file.write(b"".join(block))
+                block = []
+        file.write(b"".join(block))
+
+
+def baseline(path: str) -> int:
+    """Per-line json.loads + jsonschema.validate in a single process, as the validators used to do."""
+    from jsonschema import ValidationError, validate
+
+    num_invalid = 0
+    with open(path, "r") as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+                validate(record, CONVERSE_SCHEMA)
+                check_alternating_roles(record)
+            except (json.JSONDecodeError, ValidationError, ValueError):
+                num_invalid += 1
+    return num_invalid
+
+
+def peak_rss_mb() -> float:
+    """Peak resident memory of this process and of the largest worker process (Linux reports KiB)."""
+    self_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return max(self_rss, children_rss) / scale
+
+
+def run(args) -> List[dict]:
+    results = []
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp_dir:
+        for num_rows in args.rows:
+            path = os.path.join(tmp_dir, f"synthetic_{num_rows}.jsonl")
+            start = time.perf_counter()
+            generate_dataset(path, num_rows, args.invalid_rate)
+            size_mb = os.path.getsize(path) / 1024 / 1024
+            print(f"\n{num_rows} rows, {size_mb:.0f} MB (generated in {time.perf_counter() - start:.1f}s)")
+
+            runs = [(schema, workers) for schema in args.schemas for workers in args.workers]
+            if args.baseline and num_rows <= args.baseline_max_rows:
+                runs.append(("baseline", 1))
+            for schema, workers in runs:
+                start = time.perf_counter()
+                if schema == "baseline":
+                    num_invalid = baseline(path)
+                else:
+                    token_counter = None
+                    if args.tokenizer:
+                        token_counter = TokenCounter(None if args.tokenizer == "chars" else args.tokenizer)
+                    engine = ValidationEngine(SCHEMAS[schema](), workers=workers, shard_size=args.shard_size,
+                                              token_counter=token_counter)
+                    num_invalid = engine.validate_file(path).num_invalid_records
+                seconds = time.perf_counter() - start
+                result = {
+                    "rows": num_rows,
+                    "size_mb": round(size_mb, 1),
+                    "schema": schema,
+                    "workers": workers,
+                    "seconds": round(seconds, 2),
+                    "rows_per_second": round(num_rows / seconds),
+                    "mb_per_second": round(size_mb / seconds, 1),
+                    "invalid_rows": num_invalid,
+                    "peak_rss_mb": round(peak_rss_mb()),
+                }
+                results.append(result)
+                print(f"  {schema:>10} workers={workers:<3} {seconds:8.2f}s {result['rows_per_second']:>10} rows/s "
+                      f"{result['mb_per_second']:>7} MB/s  invalid={num_invalid}  peak RSS={result['peak_rss_mb']} MB")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the dataset validation engine on synthetic datasets.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000],
+                        help="Dataset sizes in rows (e.g. up to 10000000).")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count()],
+                        help="Numbers of worker processes to compare.")
+    parser.add_argument("--schemas", nargs="+", choices=list(SCHEMAS), default=list(SCHEMAS),
+                        help="Record schema types to benchmark.")
+    parser.add_argument("--invalid-rate", type=float, default=0.01, help="Share of invalid rows.")
+    parser.add_argument("--shard-size", type=int, default=16 * 1024 * 1024, help="Bytes per worker task.")
+    parser.add_argument("--baseline", action="store_true",
+                        help="Also run the per-line json.loads + jsonschema.validate baseline.")
+    parser.add_argument("--baseline-max-rows", type=int, default=1_000_000,
+                        help="Skip the (slow) baseline for larger datasets.")
+    parser.add_argument("--tokenizer", type=str, default=None,
+                        help="Also count tokens with this tokenizer.json file or Hub model id ('chars': estimate).")
+    parser.add_argument("--dir", type=str, default=None, help="Directory for the generated datasets.")
+    parser.add_argument("-o", "--output", type=str, default=None, help="Write the results to a JSON file.")
+    args = parser.parse_args()
+
+    results = run(args)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""
+Finds exact and near-duplicate samples in a training JSONL file, and validation samples that duplicate training
+samples, and writes the deduplicated files:
+
+    python3 deduplicate.py -t train.jsonl -v validation.jsonl -o deduplicated/
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from validation_engine.dedup import DEFAULT_NGRAM, DEFAULT_NUM_PERM, DEFAULT_THRESHOLD, Deduplicator
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find duplicate and leaked samples in training/validation JSONL.")
+    parser.add_argument("-t", "--train", type=str, required=True, help="Training JSONL file (or .jsonl.gz).")
+    parser.add_argument("-v", "--validation", type=str, default=None, help="Validation JSONL file (or .jsonl.gz).")
+    parser.add_argument("-o", "--output-dir", type=str, default=None,
+                        help="Write the deduplicated files to this directory as <file name>.dedup.jsonl.")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Estimated Jaccard similarity of word n-grams from which samples are near duplicates.")
+    parser.add_argument("--exact-only", action="store_true", help="Only find exact duplicates.")
+    parser.add_argument("--num-perm", type=int, default=DEFAULT_NUM_PERM, help="MinHash signature size.")
+    parser.add_argument("--ngram", type=int, default=DEFAULT_NGRAM, help="Words per shingle.")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="Number of worker processes (default: number of CPUs).")
+    parser.add_argument("--tmp-dir", type=str, default=None, help="Directory for the temporary signature files.")
+    parser.add_argument("-r", "--report", type=str, default=None, help="Write a JSON report to this file.")
+    args = parser.parse_args()
+
+    deduplicator = Deduplicator(
+        threshold=None if args.exact_only else args.threshold,
+        num_perm=args.num_perm,
+        ngram=args.ngram,
+        workers=args.workers,
+        tmp_dir=args.tmp_dir,
+    )
+    report = deduplicator.run(args.train, args.validation, args.output_dir)
+    print("\n".join(report.format()))
+    if args.report:
+        report.write_json(args.report)
+
+
+if __name__ == "__main__":
+    main()
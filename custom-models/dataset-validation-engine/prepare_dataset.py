@@ -0,0 +1,80 @@
+"""
+Splits a JSONL fine-tuning dataset into stratified training and validation sets, optionally packs short
+conversations, orders the samples by token length and writes shards under the per-file size and record limits, with
+a summary of the token totals of each shard:
+
+    python3 prepare_dataset.py -i train.jsonl -o prepared/ --validation-fraction 0.1 --max-shard-records 10000
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from validation_engine import TokenCounter
+from validation_engine.prepare import (
+    LENGTH_STRATUM,
+    ORDERS,
+    SUMMARY_FILE,
+    ConversationPacker,
+    DatasetPreparer,
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Split, pack, order and shard a JSONL dataset by token length.")
+    parser.add_argument("-i", "--input", type=str, required=True, help="JSONL dataset (or .jsonl.gz).")
+    parser.add_argument("-o", "--output-dir", type=str, required=True,
+                        help=f"Directory for the shards and {SUMMARY_FILE}.")
+    parser.add_argument("--validation-fraction", type=float, default=0.0,
+                        help="Share of the samples in the validation split (default: no validation split).")
+    parser.add_argument("--max-validation-records", type=int, default=None,
+                        help="Maximum number of samples in the validation split.")
+    parser.add_argument("--stratify-by", type=str, default=None,
+                        help=f"'{LENGTH_STRATUM}' (token length bucket) or a dotted field path, e.g. metadata.category: "
+                             "the validation split gets the same share of each stratum.")
+    parser.add_argument("--pack", action="store_true",
+                        help="Pack short conversations with the same system prompt into multi-turn samples, for "
+                             "models that train on multi-turn conversations.")
+    parser.add_argument("--pack-tokens", type=int, default=None,
+                        help="Token budget of a packed sample (default: --max-tokens).")
+    parser.add_argument("--order", choices=ORDERS, default="original",
+                        help="Order of the samples: original, shuffle, length (shortest first) or bucket (shortest "
+                             "power-of-two length bucket first, shuffled within each bucket).")
+    parser.add_argument("--max-shard-bytes", type=int, default=None, help="Maximum size of an output file.")
+    parser.add_argument("--max-shard-records", type=int, default=None, help="Maximum samples per output file.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the split and shuffles.")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="Number of worker processes (default: number of CPUs).")
+    parser.add_argument("--tmp-dir", type=str, default=None, help="Directory for the decompressed gzip input.")
+    group = parser.add_argument_group("token statistics")
+    group.add_argument("--tokenizer", type=str, default=None,
+                       help="tokenizer.json file or Hugging Face Hub model id used to count tokens "
+                            "(requires `pip install tokenizers`; default: estimate from the number of characters).")
+    group.add_argument("--max-tokens", type=int, default=None,
+                       help="Context limit: samples with more tokens are dropped.")
+    group.add_argument("--price-per-1k-tokens", type=float, default=None,
+                       help="Training price per 1000 tokens, to estimate the cost of each shard.")
+    group.add_argument("--epochs", type=int, default=1, help="Number of epochs for the cost estimate.")
+    args = parser.parse_args()
+
+    preparer = DatasetPreparer(
+        token_counter=TokenCounter(tokenizer=args.tokenizer, max_tokens=args.max_tokens),
+        validation_fraction=args.validation_fraction,
+        max_validation_records=args.max_validation_records,
+        stratify_by=args.stratify_by,
+        packer=ConversationPacker() if args.pack else None,
+        pack_tokens=args.pack_tokens,
+        order=args.order,
+        max_shard_bytes=args.max_shard_bytes,
+        max_shard_records=args.max_shard_records,
+        workers=args.workers,
+        seed=args.seed,
+        tmp_dir=args.tmp_dir,
+    )
+    report = preparer.run(args.input, args.output_dir)
+    print("\n".join(report.format(args.price_per_1k_tokens, args.epochs)))
+
+
+if __name__ == "__main__":
+    main()
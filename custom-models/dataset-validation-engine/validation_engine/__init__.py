@@ -0,0 +1,12 @@
+from .engine import (
+    DEFAULT_MAX_ERRORS,
+    DEFAULT_SHARD_SIZE,
+    ValidationEngine,
+    get_executor,
+    iter_line_blocks,
+    newline_ranges,
+    run_tasks,
+)
+from .report import RecordError, ValidationReport
+from .schemas import JsonSchemaRecordSchema, PydanticRecordSchema, RecordSchema, make_error
+from .tokens import TokenCounter, TokenStats, add_token_arguments, default_texts, token_counter_from_args
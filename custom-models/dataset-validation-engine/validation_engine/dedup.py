@@ -0,0 +1,392 @@
+"""
+Exact and near-duplicate detection across a training and a validation JSONL file.
+
+Both files are hashed in one streaming pass on the shared process pool. For each record, workers compute:
+
+- an exact hash of the canonical JSON of the record (sorted keys, no whitespace), or of the raw line if it isn't
+  valid JSON, so reformatted copies of a record are exact duplicates
+- a MinHash signature of the word n-grams (shingles) of its normalized text, and the LSH band hashes of that
+  signature
+
+Signatures and band hashes are appended to temporary files and read back through memory maps, so memory use is a
+few bytes per record instead of a signature per record. Records that share a band hash are candidates; candidate
+pairs whose estimated Jaccard similarity (the share of equal signature values) reaches the threshold are near
+duplicates. Duplicates are grouped with union-find, and the first record of each group (training records first) is
+kept: the others are duplicates, or leaks when a validation record duplicates a training record.
+"""
+
+import gzip
+import hashlib
+import json
+import mmap
+import os
+import tempfile
+import zlib
+from dataclasses import asdict, dataclass, field
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import orjson
+
+from .engine import DEFAULT_SHARD_SIZE, iter_line_blocks, newline_ranges, run_tasks
+from .tokens import default_texts
+
+
+DEFAULT_THRESHOLD = 0.8
+DEFAULT_NUM_PERM = 128
+DEFAULT_NGRAM = 5
+MAX_DUPLICATE_EXAMPLES = 100
+
+FALSE_POSITIVE_WEIGHT = 0.1
+# candidate pairs verified per batch
+PAIR_BATCH_SIZE = 65536
+
+# MinHash permutations are multiply-shift hashes: the top 32 bits of (a * x + b) mod 2**64
+SHINGLE_MULTIPLIER = np.uint64(1000003)
+BAND_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+MAX_HASH = np.uint32(0xFFFFFFFF)
+
+TRAIN, VALIDATION = "train", "validation"
+
+
+def lsh_params(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """
+    (bands, rows) with bands * rows <= num_perm that minimize the weighted probabilities of missing pairs above the
+    threshold and of proposing pairs below it. Candidates are verified afterwards, so proposing a pair only costs
+    time and weighs FALSE_POSITIVE_WEIGHT.
+    """
+    similarities = np.linspace(0, 1, 201)
+    below, above = similarities < threshold, similarities >= threshold
+
+    def error(params):
+        bands, rows = params
+        probability = 1 - (1 - similarities ** rows) ** bands
+        false_positives, false_negatives = probability[below].sum(), (1 - probability[above]).sum()
+        return FALSE_POSITIVE_WEIGHT * false_positives + (1 - FALSE_POSITIVE_WEIGHT) * false_negatives
+
+    return min(((bands, num_perm // bands) for bands in range(1, num_perm + 1)), key=error)
+
+
+def permutations(num_perm: int, seed: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+    """The (a, b) coefficients of the MinHash permutations, the same in every worker."""
+    rng = np.random.RandomState(seed)
+    a = rng.randint(0, 1 << 62, size=num_perm, dtype=np.int64).astype(np.uint64) * np.uint64(2) + np.uint64(1)
+    b = rng.randint(0, 1 << 62, size=num_perm, dtype=np.int64).astype(np.uint64)
+    return a, b
+
+
+@dataclass
+class MinHasher:
+    """Hashes records; sent to the worker processes, so the texts function must be picklable."""
+
+    num_perm: int = DEFAULT_NUM_PERM
+    ngram: int = DEFAULT_NGRAM
+    bands: int = 32
+    texts: object = default_texts
+
+    def __post_init__(self):
+        self.rows = self.num_perm // self.bands
+        self.a, self.b = permutations(self.num_perm)
+
+    def shingles(self, record) -> np.ndarray:
+        """Hashes of the word n-grams of the lowercased text of a record (one shingle if it has fewer words)."""
+        words = "\n".join(self.texts(record)).lower().encode().split()
+        if not words:
+            return np.empty(0, dtype=np.uint64)
+        word_hashes = np.fromiter(map(zlib.crc32, words), dtype=np.uint64, count=len(words))
+        n = min(self.ngram, len(words))
+        shingles = np.zeros(len(words) - n + 1, dtype=np.uint64)
+        for k in range(n):
+            shingles = shingles * SHINGLE_MULTIPLIER + word_hashes[k:len(words) - n + 1 + k]
+        return np.unique(shingles)
+
+    def signature(self, shingles: np.ndarray) -> np.ndarray:
+        if not len(shingles):
+            return np.full(self.num_perm, MAX_HASH, dtype=np.uint32)
+        hashes = self.a[:, None] * shingles[None, :]
+        hashes += self.b[:, None]
+        return (hashes.min(axis=1) >> np.uint64(32)).astype(np.uint32)
+
+    def band_hashes(self, signatures: np.ndarray) -> np.ndarray:
+        """One 64-bit hash per LSH band of each signature, shape (records, bands)."""
+        rows = signatures[:, :self.bands * self.rows].astype(np.uint64).reshape(len(signatures), self.bands, self.rows)
+        hashes = np.zeros((len(signatures), self.bands), dtype=np.uint64)
+        for k in range(self.rows):
+            hashes = hashes * BAND_MULTIPLIER + rows[:, :, k]
+        return hashes
+
+    def hash_block(self, data: bytes):
+        """
+        Hash the lines of a block: returns the exact hashes (records,), whether each record has text (records,),
+        the MinHash signatures (records, num_perm) and their band hashes (records, bands).
+        """
+        lines = data.split(b"\n")
+        if lines and not lines[-1]:
+            lines.pop()
+        exact = np.empty(len(lines), dtype=np.uint64)
+        has_text = np.zeros(len(lines), dtype=bool)
+        signatures = np.empty((len(lines), self.num_perm), dtype=np.uint32)
+        # exact hash -> first record of the block with it, whose signature is reused
+        seen = {}
+        for i, line in enumerate(lines):
+            try:
+                record = orjson.loads(line)
+                canonical = orjson.dumps(record, option=orjson.OPT_SORT_KEYS)
+            except orjson.JSONDecodeError:
+                record, canonical = line.decode(errors="replace"), line.strip()
+            exact[i] = int.from_bytes(hashlib.blake2b(canonical, digest_size=8).digest(), "little")
+            if exact[i] in seen:
+                has_text[i], signatures[i] = has_text[seen[exact[i]]], signatures[seen[exact[i]]]
+                continue
+            seen[exact[i]] = i
+            shingles = self.shingles(record) if isinstance(record, (dict, list)) else self.shingles({"text": record})
+            has_text[i] = len(shingles) > 0
+            signatures[i] = self.signature(shingles)
+        return exact, has_text, signatures, self.band_hashes(signatures)
+
+
+def hash_range(file_path: str, offset: int, length: int, hasher: MinHasher):
+    with open(file_path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return hasher.hash_block(mm[offset:offset + length])
+
+
+def hash_block(data: bytes, hasher: MinHasher):
+    return hasher.hash_block(data)
+
+
+def open_jsonl(file_path: str):
+    return gzip.open(file_path, "rb") if file_path.endswith(".gz") else open(file_path, "rb")
+
+
+def iter_lines(file_path: str, block_size: int = DEFAULT_SHARD_SIZE) -> Iterator[bytes]:
+    """The lines of a (gzip) JSONL file, split the same way as by the hashing workers."""
+    with open_jsonl(file_path) as stream:
+        for block in iter_line_blocks(stream, block_size):
+            lines = block.split(b"\n")
+            if lines and not lines[-1]:
+                lines.pop()
+            yield from lines
+
+
+class UnionFind:
+    """Groups of record indexes; the root of each group is its smallest index."""
+
+    def __init__(self, size: int):
+        self.parent = np.arange(size, dtype=np.int64)
+
+    def find(self, i: int) -> int:
+        root = i
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[i] != root:
+            self.parent[i], i = root, self.parent[i]
+        return int(root)
+
+    def union(self, i: int, j: int) -> bool:
+        root_i, root_j = self.find(i), self.find(j)
+        if root_i == root_j:
+            return False
+        self.parent[max(root_i, root_j)] = min(root_i, root_j)
+        return True
+
+
+@dataclass
+class Duplicate:
+    """A dropped record and the earlier record it was matched with; similarity is 1.0 for exact duplicates."""
+
+    file: str
+    line: int
+    duplicate_of_file: str
+    duplicate_of_line: int
+    similarity: float
+
+
+@dataclass
+class DedupReport:
+    """Result of deduplicating a training file and an optional validation file."""
+
+    num_records: Dict[str, int] = field(default_factory=dict)
+    num_exact_duplicates: Dict[str, int] = field(default_factory=dict)
+    num_near_duplicates: Dict[str, int] = field(default_factory=dict)
+    # validation records that duplicate a training record
+    num_leaked: int = 0
+    # details of the first MAX_DUPLICATE_EXAMPLES duplicates
+    duplicates: List[Duplicate] = field(default_factory=list)
+    # deduplicated JSONL files, by dataset
+    output_files: Dict[str, str] = field(default_factory=dict)
+
+    def num_duplicates(self, dataset: str) -> int:
+        return self.num_exact_duplicates.get(dataset, 0) + self.num_near_duplicates.get(dataset, 0)
+
+    def format(self) -> List[str]:
+        lines = []
+        for dataset, num_records in self.num_records.items():
+            lines.append(
+                f"{dataset}: {num_records} records, {self.num_exact_duplicates[dataset]} exact and "
+                f"{self.num_near_duplicates[dataset]} near duplicates"
+                + (f", written to {self.output_files[dataset]}" if dataset in self.output_files else "")
+            )
+        if VALIDATION in self.num_records:
+            lines.append(f"{self.num_leaked} validation records duplicate training records")
+        for duplicate in self.duplicates:
+            lines.append(
+                f"  {duplicate.file} line {duplicate.line} duplicates {duplicate.duplicate_of_file} line "
+                f"{duplicate.duplicate_of_line} (similarity {duplicate.similarity:.2f})"
+            )
+        return lines
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+    def write_json(self, path: str) -> None:
+        with open(path, "w") as file:
+            json.dump(self.to_dict(), file, indent=2)
+
+
+class Deduplicator:
+    """
+    Finds exact and near-duplicate records in a training file and across the training and validation files.
+
+    Args:
+        threshold: estimated Jaccard similarity of the word n-grams above which records are near duplicates;
+            None to only find exact duplicates
+        num_perm: MinHash signature size; more is more precise, and slower
+        ngram: words per shingle
+        workers: worker processes (default: number of CPUs), 1 to hash in the calling process
+        texts: function returning the texts of a parsed record, see tokens.default_texts
+        tmp_dir: directory for the signature files
+    """
+
+    def __init__(
+        self,
+        threshold: Optional[float] = DEFAULT_THRESHOLD,
+        num_perm: int = DEFAULT_NUM_PERM,
+        ngram: int = DEFAULT_NGRAM,
+        workers: Optional[int] = None,
+        shard_size: int = DEFAULT_SHARD_SIZE,
+        texts=default_texts,
+        tmp_dir: Optional[str] = None,
+    ):
+        self.threshold = threshold
+        bands, _ = lsh_params(threshold or 1.0, num_perm)
+        self.hasher = MinHasher(num_perm=num_perm, ngram=ngram, bands=bands, texts=texts)
+        self.workers = workers or os.cpu_count()
+        self.shard_size = shard_size
+        self.max_pending = 2 * self.workers
+        self.tmp_dir = tmp_dir
+
+    def _tasks(self, file_path: str):
+        if file_path.endswith(".gz"):
+            with gzip.open(file_path, "rb") as stream:
+                for block in iter_line_blocks(stream, self.shard_size):
+                    yield hash_block, block, self.hasher
+        else:
+            for offset, length in newline_ranges(file_path, self.shard_size):
+                yield hash_range, file_path, offset, length, self.hasher
+
+    def _hash_files(self, paths: List[str], signatures_file, bands_file) -> Tuple[np.ndarray, np.ndarray, List[int]]:
+        """Hash the files in order; returns the exact hashes, the has-text flags and the record count per file."""
+        exact, has_text, counts = [], [], []
+        for path in paths:
+            count = 0
+            for block_exact, block_has_text, signatures, band_hashes in run_tasks(
+                self._tasks(path), self.workers, self.max_pending
+            ):
+                exact.append(block_exact)
+                has_text.append(block_has_text)
+                signatures.tofile(signatures_file)
+                band_hashes.tofile(bands_file)
+                count += len(block_exact)
+            counts.append(count)
+        empty = np.empty(0)
+        return (np.concatenate(exact or [empty]).astype(np.uint64),
+                np.concatenate(has_text or [empty]).astype(bool), counts)
+
+    def _near_duplicate_pairs(self, has_text: np.ndarray, signatures: np.ndarray, band_hashes: np.ndarray):
+        """Candidate pairs from the LSH bands, (record, first record of its bucket), one band at a time."""
+        indexes = np.flatnonzero(has_text)
+        for band in range(band_hashes.shape[1]):
+            column = np.asarray(band_hashes[indexes, band])
+            order = np.argsort(column, kind="stable")
+            sorted_column = column[order]
+            starts = np.flatnonzero(np.r_[True, sorted_column[1:] != sorted_column[:-1]])
+            first = np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+            members = np.flatnonzero(np.arange(len(order)) != first)
+            if len(members):
+                yield indexes[order[members]], indexes[order[first[members]]]
+
+    def run(self, train_path: str, validation_path: Optional[str] = None,
+            output_dir: Optional[str] = None) -> DedupReport:
+        """
+        Deduplicate the training file and, if given, the validation file against itself and the training file.
+        With an output_dir, the kept records of each file are written to <output_dir>/<file name>.dedup.jsonl.
+        """
+        paths = [train_path] + ([validation_path] if validation_path else [])
+        names = [TRAIN, VALIDATION][:len(paths)]
+        report = DedupReport()
+        with tempfile.TemporaryDirectory(dir=self.tmp_dir) as tmp:
+            signatures_path = os.path.join(tmp, "signatures.bin")
+            bands_path = os.path.join(tmp, "bands.bin")
+            with open(signatures_path, "wb") as signatures_file, open(bands_path, "wb") as bands_file:
+                exact, has_text, counts = self._hash_files(paths, signatures_file, bands_file)
+            total = len(exact)
+            starts = np.cumsum([0] + counts)
+
+            groups = UnionFind(total)
+            # record -> (earlier record it was matched with, estimated similarity)
+            matches = {}
+            # exact duplicates: records with the hash of an earlier record
+            _, first_index, inverse = np.unique(exact, return_index=True, return_inverse=True)
+            first_of = first_index[inverse.reshape(-1)]
+            for i in np.flatnonzero(first_of != np.arange(total)):
+                groups.union(int(i), int(first_of[i]))
+                matches[int(i)] = (int(first_of[i]), 1.0)
+
+            if self.threshold is not None and total:
+                signatures = np.memmap(signatures_path, dtype=np.uint32, mode="r",
+                                       shape=(total, self.hasher.num_perm))
+                band_hashes = np.memmap(bands_path, dtype=np.uint64, mode="r", shape=(total, self.hasher.bands))
+                for records, candidates in self._near_duplicate_pairs(has_text, signatures, band_hashes):
+                    for batch in range(0, len(records), PAIR_BATCH_SIZE):
+                        i_batch = records[batch:batch + PAIR_BATCH_SIZE]
+                        j_batch = candidates[batch:batch + PAIR_BATCH_SIZE]
+                        estimates = (signatures[i_batch] == signatures[j_batch]).mean(axis=1)
+                        for i, j, estimate in zip(i_batch, j_batch, estimates):
+                            if estimate >= self.threshold and groups.union(int(i), int(j)):
+                                matches.setdefault(int(i), (int(j), float(estimate)))
+                del signatures, band_hashes
+
+        roots = np.fromiter((groups.find(i) for i in range(total)), dtype=np.int64, count=total)
+        dropped = roots != np.arange(total)
+
+        def locate(index: int) -> Tuple[str, int]:
+            file_index = int(np.searchsorted(starts, index, side="right")) - 1
+            return names[file_index], index - int(starts[file_index]) + 1
+
+        for file_index, name in enumerate(names):
+            start, end = starts[file_index], starts[file_index + 1]
+            report.num_records[name] = int(end - start)
+            exact_dropped = dropped[start:end] & (exact[start:end] == exact[roots[start:end]])
+            report.num_exact_duplicates[name] = int(exact_dropped.sum())
+            report.num_near_duplicates[name] = int(dropped[start:end].sum()) - report.num_exact_duplicates[name]
+        if validation_path:
+            report.num_leaked = int((dropped[starts[1]:] & (roots[starts[1]:] < starts[1])).sum())
+
+        for index in np.flatnonzero(dropped)[:MAX_DUPLICATE_EXAMPLES]:
+            match, estimate = matches.get(int(index), (int(roots[index]), self.threshold))
+            report.duplicates.append(Duplicate(*locate(int(index)), *locate(match), round(estimate, 3)))
+
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+            for file_index, (name, path) in enumerate(zip(names, paths)):
+                base = os.path.basename(path)
+                for extension in (".gz", ".jsonl"):
+                    base = base[:-len(extension)] if base.endswith(extension) else base
+                output_file = os.path.join(output_dir, f"{base}.dedup.jsonl")
+                keep = ~dropped[starts[file_index]:starts[file_index + 1]]
+                with open(output_file, "wb") as output:
+                    for line, kept in zip(iter_lines(path, self.shard_size), keep):
+                        if kept:
+                            output.write(line + b"\n")
+                report.output_files[name] = output_file
+        return report
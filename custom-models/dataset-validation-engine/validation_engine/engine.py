@@ -0,0 +1,246 @@
+"""
+Streaming, parallel validation of JSONL datasets.
+
+Plain files are memory-mapped and split into byte ranges of about `shard_size` bytes that end on a newline; each
+worker reads its own range. Gzip files and other streams are read in blocks of whole lines. At most `max_pending`
+shards are in flight at a time, so memory use does not depend on the size of the dataset, and shard results are
+collected in order to turn shard-relative line numbers into file line numbers.
+"""
+
+import atexit
+import gzip
+import mmap
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO, Callable, Iterable, Iterator, List, Optional, Tuple
+
+from .report import RecordError, ValidationReport
+from .schemas import RecordSchema
+from .tokens import TokenCounter, TokenStats
+
+
+DEFAULT_SHARD_SIZE = 16 * 1024 * 1024
+DEFAULT_MAX_ERRORS = 100
+# valid records tokenized per batch when counting tokens
+TOKEN_BATCH_SIZE = 1024
+
+# process pools shared by every engine, by number of workers
+_executors = {}
+# engines may run on several threads at once, e.g. one per S3 object being validated
+_executors_lock = threading.Lock()
+
+
+def get_executor(workers: Optional[int] = None) -> ProcessPoolExecutor:
+    """Return the persistent process pool with the given number of workers (default: number of CPUs)."""
+    workers = workers or os.cpu_count()
+    with _executors_lock:
+        if workers not in _executors:
+            _executors[workers] = ProcessPoolExecutor(max_workers=workers)
+            atexit.register(_executors[workers].shutdown)
+        return _executors[workers]
+
+
+def run_tasks(tasks: Iterable[Tuple], workers: int, max_pending: int) -> Iterator:
+    """
+    Run (function, *args) tasks and yield their results in order: in the calling process with workers=1, otherwise
+    on the persistent process pool with at most max_pending tasks in flight.
+    """
+    if workers == 1:
+        for function, *args in tasks:
+            yield function(*args)
+        return
+    executor = get_executor(workers)
+    pending = deque()
+    try:
+        for function, *args in tasks:
+            pending.append(executor.submit(function, *args))
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def newline_ranges(file_path: str, shard_size: int) -> List[Tuple[int, int]]:
+    """Split a plain file into (offset, length) byte ranges of about shard_size bytes that end on a newline."""
+    file_size = os.path.getsize(file_path)
+    if file_size == 0:
+        return []
+    ranges = []
+    with open(file_path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        start = 0
+        while start < file_size:
+            end = file_size
+            if start + shard_size < file_size:
+                newline = mm.find(b"\n", start + shard_size - 1)
+                if newline != -1:
+                    end = newline + 1
+            ranges.append((start, end - start))
+            start = end
+    return ranges
+
+
+def iter_line_blocks(stream: BinaryIO, block_size: int, stop=None) -> Iterator[bytes]:
+    """
+    Read a binary stream (e.g. a gzip or S3 stream) in blocks of whole lines of about block_size bytes.
+    Reading stops before the next block once the `stop` event is set, and the rest of the stream is left unread.
+    """
+    remainder = b""
+    while True:
+        if stop is not None and stop.is_set():
+            return
+        block = stream.read(block_size)
+        if not block:
+            break
+        block = remainder + block
+        cut = block.rfind(b"\n") + 1
+        if cut == 0:
+            remainder = block
+            continue
+        yield block[:cut]
+        remainder = block[cut:]
+    if remainder:
+        yield remainder
+
+
+def validate_block(data: bytes, schema: RecordSchema, max_errors: int,
+                   token_counter: Optional[TokenCounter] = None, keep_valid: bool = False):
+    """
+    Validate a block of whole JSONL lines.
+
+    Returns (number of records, number of invalid records, [(line number within the block, errors)], token stats,
+    kept lines) with the errors of at most max_errors records. Token stats are only computed with a token_counter,
+    and the valid lines (within the token limit) are only returned with keep_valid.
+    """
+    lines = data.split(b"\n")
+    if lines and not lines[-1]:
+        lines.pop()
+    num_invalid = 0
+    invalid = []
+    token_stats = TokenStats(max_tokens=token_counter.max_tokens) if token_counter else None
+    kept = [] if keep_valid else None
+    # valid records waiting to be tokenized, as (line number, record, line)
+    batch = []
+
+    def flush():
+        for (line_num, _, line), num_tokens in zip(batch, token_counter.count(record for _, record, _ in batch)):
+            token_stats.add(line_num, num_tokens)
+            if kept is not None and not token_counter.is_over_limit(num_tokens):
+                kept.append(line)
+        batch.clear()
+
+    for line_num, line in enumerate(lines, start=1):
+        record, errors = schema.parse(line) if token_counter else (None, schema.validate_line(line))
+        if errors:
+            num_invalid += 1
+            if len(invalid) < max_errors:
+                invalid.append((line_num, errors))
+        elif token_counter:
+            batch.append((line_num, record, line))
+            if len(batch) >= TOKEN_BATCH_SIZE:
+                flush()
+        elif kept is not None:
+            kept.append(line)
+    if batch:
+        flush()
+    return len(lines), num_invalid, invalid, token_stats, b"\n".join(kept) + b"\n" if kept else None
+
+
+def validate_range(file_path: str, offset: int, length: int, schema: RecordSchema, max_errors: int,
+                   token_counter: Optional[TokenCounter] = None, keep_valid: bool = False):
+    """Validate the lines in a byte range of a plain JSONL file, read through a memory map."""
+    with open(file_path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return validate_block(mm[offset:offset + length], schema, max_errors, token_counter, keep_valid)
+
+
+class ValidationEngine:
+    """
+    Validates JSONL datasets against a RecordSchema.
+
+    With workers=1 shards are validated in the calling process (e.g. for small files or notebooks), otherwise on a
+    persistent process pool shared by all engines.
+
+    With a token_counter, the token lengths of the valid records are computed in the same pass (report.token_stats).
+    With an output_file, the valid records (within the token limit, if any) are written to it, in order.
+    """
+
+    def __init__(
+        self,
+        schema: RecordSchema,
+        workers: Optional[int] = None,
+        shard_size: int = DEFAULT_SHARD_SIZE,
+        max_errors: int = DEFAULT_MAX_ERRORS,
+        max_pending: Optional[int] = None,
+        token_counter: Optional[TokenCounter] = None,
+        output_file: Optional[str] = None,
+    ):
+        self.schema = schema
+        self.token_counter = token_counter
+        self.output_file = output_file
+        self.workers = workers or os.cpu_count()
+        self.shard_size = shard_size
+        self.max_errors = max_errors
+        self.max_pending = max_pending or 2 * self.workers
+
+    def validate_file(self, file_path: str) -> ValidationReport:
+        """Validate a local .jsonl file, or a gzip-compressed one (.gz)."""
+        if file_path.endswith(".gz"):
+            with gzip.open(file_path, "rb") as stream:
+                return self.validate_stream(stream, file_path)
+        tasks = (
+            (validate_range, file_path, offset, length, *self._task_args())
+            for offset, length in newline_ranges(file_path, self.shard_size)
+        )
+        return self.run(tasks, file_path)
+
+    def validate_stream(self, stream: BinaryIO, source: str, stop=None,
+                        on_shard: Optional[Callable[[int, int], None]] = None) -> ValidationReport:
+        """
+        Validate a binary stream of JSONL, e.g. a decompressed or downloaded file, until it ends or stop is set.
+        The stream is not read any further once stop is set; the shards already read are still validated.
+        """
+        tasks = (
+            (validate_block, block, *self._task_args())
+            for block in iter_line_blocks(stream, self.shard_size, stop)
+        )
+        return self.run(tasks, source, on_shard)
+
+    def _task_args(self) -> Tuple:
+        return self.schema, self.max_errors, self.token_counter, self.output_file is not None
+
+    def run(self, tasks: Iterable[Tuple], source: str,
+            on_shard: Optional[Callable[[int, int], None]] = None) -> ValidationReport:
+        """
+        Run (function, *args) shard tasks and aggregate their results, in order, into a report. on_shard is called
+        with the number of records and of invalid records of each shard as it is collected.
+        """
+        report = ValidationReport(source=source)
+        if self.token_counter:
+            report.token_stats = TokenStats(max_tokens=self.token_counter.max_tokens)
+        output = open(self.output_file, "wb") if self.output_file else None
+
+        def collect(result):
+            num_records, num_invalid, invalid, token_stats, kept = result
+            for line_num, errors in invalid:
+                if len(report.invalid_records) < self.max_errors:
+                    report.invalid_records.append(RecordError(line=report.num_records + line_num, errors=errors))
+            if token_stats:
+                report.token_stats.merge(token_stats, line_offset=report.num_records)
+            if kept and output:
+                output.write(kept)
+            report.num_records += num_records
+            report.num_invalid_records += num_invalid
+            if on_shard:
+                on_shard(num_records, num_invalid)
+
+        try:
+            for result in run_tasks(tasks, self.workers, self.max_pending):
+                collect(result)
+        finally:
+            if output:
+                output.close()
+        return report
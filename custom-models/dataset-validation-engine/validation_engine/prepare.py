@@ -0,0 +1,421 @@
+"""
+Token-aware preparation of a JSONL fine-tuning dataset: stratified train/validation split, optional packing of short
+conversations, ordering by token length, and shards under per-file size and record limits.
+
+The input is scanned in one pass on the shared process pool. For each record, workers return its byte range, its
+token count, its stratum and, if it can be packed, a hash of everything but its messages. Only these few numbers per
+record are kept, so memory use does not depend on the size of the records. The split, packs, order and shards are
+planned from them, then each shard is written by a worker that reads its records through a memory map of the input
+(gzip input is decompressed to a temporary file first). The token totals of each shard and split give the training
+cost before the job is submitted.
+"""
+
+import bisect
+import gzip
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import tempfile
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+
+import numpy as np
+import orjson
+
+from .dedup import TRAIN, VALIDATION
+from .engine import DEFAULT_SHARD_SIZE, TOKEN_BATCH_SIZE, newline_ranges, run_tasks
+from .tokens import TokenCounter, TokenStats
+
+
+ORDERS = ("original", "shuffle", "length", "bucket")
+LENGTH_STRATUM = "length"
+SUMMARY_FILE = "summary.json"
+
+
+def length_bucket(num_tokens: np.ndarray) -> np.ndarray:
+    """Power-of-two token length bucket of each record: 0 for 0-63 tokens, 1 for 64-127, 2 for 128-255, ..."""
+    return np.maximum(0, np.floor(np.log2(np.maximum(num_tokens, 1))).astype(np.int64) - 5)
+
+
+@dataclass
+class FieldStratum:
+    """Stratum of a record: the value at a dotted path, e.g. 'metadata.category' or 'messages.0.role'."""
+
+    path: str
+
+    def __call__(self, record) -> str:
+        value = record
+        for part in self.path.split("."):
+            if isinstance(value, dict):
+                value = value.get(part)
+            elif isinstance(value, list) and part.isdigit() and int(part) < len(value):
+                value = value[int(part)]
+            else:
+                value = None
+            if value is None:
+                return ""
+        return value if isinstance(value, str) else json.dumps(value, sort_keys=True)
+
+
+@dataclass
+class ConversationPacker:
+    """
+    Packs conversations (records with a list of messages, from a user turn to an assistant turn) into one multi-turn
+    record. Only records with the same other fields (e.g. schemaVersion and system prompt) are packed together.
+    """
+
+    messages_key: str = "messages"
+    role_key: str = "role"
+    first_role: str = "user"
+    last_role: str = "assistant"
+
+    def key(self, record) -> Optional[int]:
+        """Hash of the fields that must be equal in a pack, or None if the record can't be packed."""
+        messages = record.get(self.messages_key) if isinstance(record, dict) else None
+        if not messages or not isinstance(messages, list):
+            return None
+        if not isinstance(messages[0], dict) or not isinstance(messages[-1], dict):
+            return None
+        if messages[0].get(self.role_key) != self.first_role or messages[-1].get(self.role_key) != self.last_role:
+            return None
+        rest = orjson.dumps({k: v for k, v in record.items() if k != self.messages_key}, option=orjson.OPT_SORT_KEYS)
+        return int.from_bytes(hashlib.blake2b(rest, digest_size=8).digest(), "little")
+
+    def pack(self, records: List[Dict]) -> Dict:
+        return {**records[0], self.messages_key: [m for record in records for m in record[self.messages_key]]}
+
+
+def scan_block(data: bytes, base_offset: int, token_counter: TokenCounter, stratum, packer):
+    """
+    Scan a block of whole JSONL lines that starts at base_offset in the file.
+
+    Returns the offset and length of each line, whether it is valid JSON, its token count, its stratum (None without
+    a stratum function) and its pack key (None without a packer; 0 for records that can't be packed).
+    """
+    lines = data.split(b"\n")
+    if lines and not lines[-1]:
+        lines.pop()
+    lengths = np.fromiter((len(line) for line in lines), dtype=np.int64, count=len(lines))
+    offsets = base_offset + np.concatenate(([0], np.cumsum(lengths + 1)[:-1])).astype(np.int64)
+    valid = np.zeros(len(lines), dtype=bool)
+    num_tokens = np.zeros(len(lines), dtype=np.int64)
+    strata = [""] * len(lines) if stratum else None
+    pack_keys = np.zeros(len(lines), dtype=np.uint64) if packer else None
+    # valid records waiting to be tokenized, as (line index, record)
+    batch = []
+
+    def flush():
+        for (i, _), count in zip(batch, token_counter.count(record for _, record in batch)):
+            num_tokens[i] = count
+        batch.clear()
+
+    for i, line in enumerate(lines):
+        try:
+            record = orjson.loads(line)
+        except orjson.JSONDecodeError:
+            continue
+        valid[i] = True
+        if stratum:
+            strata[i] = stratum(record)
+        if packer:
+            # 0 is reserved for records that can't be packed
+            pack_keys[i] = packer.key(record) or 0
+        batch.append((i, record))
+        if len(batch) >= TOKEN_BATCH_SIZE:
+            flush()
+    if batch:
+        flush()
+    return offsets, lengths, valid, num_tokens, strata, pack_keys
+
+
+def scan_range(file_path: str, offset: int, length: int, token_counter: TokenCounter, stratum, packer):
+    with open(file_path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return scan_block(mm[offset:offset + length], offset, token_counter, stratum, packer)
+
+
+def write_shard(file_path: str, output_path: str, offsets: np.ndarray, lengths: np.ndarray, item_sizes: np.ndarray,
+                item_tokens: np.ndarray, token_counter: TokenCounter, packer):
+    """
+    Write a shard: items of item_sizes consecutive records (offsets and lengths in the input file), packed into one
+    record when there are several. Returns the token stats of the written records and the size of the shard.
+    """
+    stats = TokenStats()
+    with open(file_path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm, \
+            open(output_path, "wb") as output:
+        start = 0
+        for line_num, (size, num_tokens) in enumerate(zip(item_sizes, item_tokens), start=1):
+            ranges = list(zip(offsets[start:start + size], lengths[start:start + size]))
+            start += size
+            if size == 1:
+                offset, length = ranges[0]
+                output.write(mm[offset:offset + length] + b"\n")
+            else:
+                record = packer.pack([orjson.loads(mm[offset:offset + length]) for offset, length in ranges])
+                output.write(orjson.dumps(record) + b"\n")
+                # shared fields such as the system prompt are only counted once in the packed record
+                num_tokens = token_counter.count([record])[0]
+            stats.add(line_num, int(num_tokens))
+        size = output.tell()
+    return stats, size
+
+
+@dataclass
+class ShardSummary:
+    file: str
+    split: str
+    num_records: int
+    # input records in the shard, more than num_records when records are packed
+    num_samples: int
+    size_bytes: int
+    total_tokens: int
+    max_tokens: int
+
+
+@dataclass
+class PrepareReport:
+    """Result of preparing a dataset: record counts, shards and token totals per split."""
+
+    source: str
+    num_records: int = 0
+    num_invalid_records: int = 0
+    num_over_limit: int = 0
+    num_packed_records: int = 0
+    max_tokens: Optional[int] = None
+    shards: List[ShardSummary] = field(default_factory=list)
+    token_stats: Dict[str, TokenStats] = field(default_factory=dict)
+
+    def format(self, price_per_1k_tokens: Optional[float] = None, epochs: int = 1) -> List[str]:
+        lines = [f"{self.source}: {self.num_records} records, {self.num_invalid_records} invalid JSON"
+                 + (f", {self.num_over_limit} over the context limit of {self.max_tokens} tokens"
+                    if self.max_tokens is not None else "")
+                 + (f", {self.num_packed_records} packed into multi-turn records" if self.num_packed_records else "")]
+        for shard in self.shards:
+            cost = (f", ${shard.total_tokens * epochs * price_per_1k_tokens / 1000:,.2f}"
+                    if price_per_1k_tokens is not None else "")
+            lines.append(f"  {shard.file}: {shard.num_records} records ({shard.num_samples} samples), "
+                         f"{shard.size_bytes} bytes, {shard.total_tokens} tokens, max {shard.max_tokens}{cost}")
+        for split, stats in self.token_stats.items():
+            lines.append(f"{split}:")
+            lines.extend("  " + line for line in stats.format(price_per_1k_tokens, epochs))
+        return lines
+
+    def to_dict(self) -> Dict:
+        return {
+            "source": self.source,
+            "num_records": self.num_records,
+            "num_invalid_records": self.num_invalid_records,
+            "num_over_limit": self.num_over_limit,
+            "num_packed_records": self.num_packed_records,
+            "context_limit": self.max_tokens,
+            "shards": [asdict(shard) for shard in self.shards],
+            "token_stats": {split: stats.to_dict() for split, stats in self.token_stats.items()},
+        }
+
+    def write_json(self, path: str) -> None:
+        with open(path, "w") as file:
+            json.dump(self.to_dict(), file, indent=2)
+
+
+class DatasetPreparer:
+    """
+    Splits, packs, orders and shards a JSONL dataset by token length.
+
+    Args:
+        token_counter: counts the tokens of each record; records over its max_tokens are dropped
+        validation_fraction: share of the records in the validation split (0 for no split)
+        max_validation_records: upper bound on the validation split
+        stratify_by: None, 'length' (token length bucket) or a dotted field path (e.g. 'metadata.category'); the
+            validation split takes the same share of each stratum
+        packer: e.g. ConversationPacker() to pack short records; None to keep one sample per record
+        pack_tokens: token budget of a packed record (default: the context limit)
+        order: 'original', 'shuffle', 'length' (shortest first) or 'bucket' (power-of-two length buckets, shortest
+            first, shuffled within each bucket)
+        max_shard_bytes, max_shard_records: limits per output file
+        workers: worker processes (default: number of CPUs), 1 to run in the calling process
+        seed: seed of the split and shuffles
+    """
+
+    def __init__(
+        self,
+        token_counter: Optional[TokenCounter] = None,
+        validation_fraction: float = 0.0,
+        max_validation_records: Optional[int] = None,
+        stratify_by: Optional[str] = None,
+        packer: Optional[ConversationPacker] = None,
+        pack_tokens: Optional[int] = None,
+        order: str = "original",
+        max_shard_bytes: Optional[int] = None,
+        max_shard_records: Optional[int] = None,
+        workers: Optional[int] = None,
+        shard_size: int = DEFAULT_SHARD_SIZE,
+        seed: int = 0,
+        tmp_dir: Optional[str] = None,
+    ):
+        if order not in ORDERS:
+            raise ValueError(f"order must be one of {ORDERS}, got {order}")
+        self.token_counter = token_counter or TokenCounter()
+        self.validation_fraction = validation_fraction
+        self.max_validation_records = max_validation_records
+        self.stratify_by = stratify_by
+        self.packer = packer
+        self.pack_tokens = pack_tokens or self.token_counter.max_tokens
+        if packer and not self.pack_tokens:
+            raise ValueError("Packing needs a token budget: pass pack_tokens or a token counter with max_tokens")
+        self.order = order
+        self.max_shard_bytes = max_shard_bytes
+        self.max_shard_records = max_shard_records
+        self.workers = workers or os.cpu_count()
+        self.shard_size = shard_size
+        self.max_pending = 2 * self.workers
+        self.seed = seed
+        self.tmp_dir = tmp_dir
+
+    def _scan(self, file_path: str):
+        stratum = FieldStratum(self.stratify_by) if self.stratify_by and self.stratify_by != LENGTH_STRATUM else None
+        tasks = (
+            (scan_range, file_path, offset, length, self.token_counter, stratum, self.packer)
+            for offset, length in newline_ranges(file_path, self.shard_size)
+        )
+        columns = [[] for _ in range(6)]
+        for result in run_tasks(tasks, self.workers, self.max_pending):
+            for column, value in zip(columns, result):
+                if value is not None:
+                    column.append(value)
+        offsets, lengths, valid, num_tokens = (
+            np.concatenate(column) if column else np.empty(0, dtype=dtype)
+            for column, dtype in zip(columns[:4], (np.int64, np.int64, bool, np.int64))
+        )
+        labels = {}
+        strata = np.fromiter((labels.setdefault(label, len(labels)) for block in columns[4] for label in block),
+                             dtype=np.int64, count=len(offsets)) if stratum else None
+        pack_keys = np.concatenate(columns[5]) if self.packer and columns[5] else None
+        return offsets, lengths, valid, num_tokens, strata, pack_keys
+
+    def _split(self, rng, kept: np.ndarray, strata: Optional[np.ndarray], num_tokens: np.ndarray):
+        """Indexes of the training and validation records, the same share of each stratum in validation."""
+        fraction = self.validation_fraction
+        if self.max_validation_records is not None and len(kept):
+            fraction = min(fraction, self.max_validation_records / len(kept))
+        if not fraction:
+            return kept, np.empty(0, dtype=np.int64)
+        if self.stratify_by == LENGTH_STRATUM:
+            strata = length_bucket(num_tokens)
+        groups = np.unique(strata[kept]) if strata is not None else [None]
+        validation = []
+        for group in groups:
+            members = kept if group is None else kept[strata[kept] == group]
+            members = rng.permutation(members)
+            validation.append(members[:int(round(len(members) * fraction))])
+        validation = np.sort(np.concatenate(validation))
+        return np.setdiff1d(kept, validation, assume_unique=True), validation
+
+    def _pack(self, indexes: np.ndarray, num_tokens: np.ndarray, pack_keys: Optional[np.ndarray]) -> List[np.ndarray]:
+        """
+        Group the records of a split into items: packs of records with the same pack key, by best fit decreasing
+        within the token budget, and single records.
+        """
+        if pack_keys is None:
+            return [indexes[i:i + 1] for i in range(len(indexes))]
+        items = [indexes[i:i + 1] for i in np.flatnonzero(pack_keys[indexes] == 0)]
+        packable = indexes[pack_keys[indexes] != 0]
+        for key in np.unique(pack_keys[packable]):
+            members = packable[pack_keys[packable] == key]
+            members = members[np.argsort(-num_tokens[members], kind="stable")]
+            # remaining budget of each open pack, sorted, and the pack of each budget
+            budgets, packs = [], []
+            for index in members:
+                position = bisect.bisect_left(budgets, num_tokens[index])
+                if position < len(budgets):
+                    budget = budgets.pop(position)
+                    pack = packs.pop(position)
+                else:
+                    budget, pack = self.pack_tokens, []
+                pack.append(index)
+                budget -= num_tokens[index]
+                position = bisect.bisect_left(budgets, budget)
+                budgets.insert(position, budget)
+                packs.insert(position, pack)
+            items.extend(np.sort(np.array(pack, dtype=np.int64)) for pack in packs)
+        return items
+
+    def _order(self, rng, items: List[np.ndarray], num_tokens: np.ndarray) -> List[np.ndarray]:
+        if self.order == "original":
+            return sorted(items, key=lambda item: item[0])
+        if self.order == "shuffle":
+            return [items[i] for i in rng.permutation(len(items))]
+        item_tokens = np.fromiter((num_tokens[item].sum() for item in items), dtype=np.int64, count=len(items))
+        if self.order == "length":
+            keys = (item_tokens,)
+        else:
+            keys = (rng.random(len(items)), length_bucket(item_tokens))
+        return [items[i] for i in np.lexsort(keys)]
+
+    def _shard(self, items: List[np.ndarray], lengths: np.ndarray) -> List[List[np.ndarray]]:
+        """Cut the items into shards within the byte and record limits (an item larger than the limit gets a shard)."""
+        shards, shard, shard_bytes = [], [], 0
+        for item in items:
+            # upper bound of the packed record size: packing only removes repeated fields
+            item_bytes = int(lengths[item].sum()) + 1
+            if shard and ((self.max_shard_bytes and shard_bytes + item_bytes > self.max_shard_bytes)
+                          or (self.max_shard_records and len(shard) >= self.max_shard_records)):
+                shards.append(shard)
+                shard, shard_bytes = [], 0
+            shard.append(item)
+            shard_bytes += item_bytes
+        if shard:
+            shards.append(shard)
+        return shards
+
+    def run(self, file_path: str, output_dir: str) -> PrepareReport:
+        """
+        Prepare a .jsonl (or .jsonl.gz) file and write the shards to output_dir as train-NNNNN-of-NNNNN.jsonl and
+        validation-NNNNN-of-NNNNN.jsonl, with a summary.json of the token totals per shard and split.
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        report = PrepareReport(source=file_path, max_tokens=self.token_counter.max_tokens)
+        with tempfile.TemporaryDirectory(dir=self.tmp_dir) as tmp:
+            if file_path.endswith(".gz"):
+                plain_path = os.path.join(tmp, "input.jsonl")
+                with gzip.open(file_path, "rb") as stream, open(plain_path, "wb") as output:
+                    shutil.copyfileobj(stream, output, self.shard_size)
+                file_path = plain_path
+
+            offsets, lengths, valid, num_tokens, strata, pack_keys = self._scan(file_path)
+            report.num_records = len(offsets)
+            report.num_invalid_records = int((~valid).sum())
+            kept = valid
+            if self.token_counter.max_tokens is not None:
+                over_limit = valid & (num_tokens > self.token_counter.max_tokens)
+                report.num_over_limit = int(over_limit.sum())
+                kept = valid & ~over_limit
+            kept = np.flatnonzero(kept)
+
+            rng = np.random.default_rng(self.seed)
+            tasks = []
+            for split, indexes in zip((TRAIN, VALIDATION), self._split(rng, kept, strata, num_tokens)):
+                if not len(indexes):
+                    continue
+                items = self._order(rng, self._pack(indexes, num_tokens, pack_keys), num_tokens)
+                report.num_packed_records += sum(len(item) for item in items if len(item) > 1)
+                shards = self._shard(items, lengths)
+                for shard_index, shard in enumerate(shards):
+                    records = np.concatenate(shard)
+                    name = f"{split}-{shard_index:05d}-of-{len(shards):05d}.jsonl"
+                    tasks.append((split, name, len(records), (
+                        write_shard, file_path, os.path.join(output_dir, name), offsets[records], lengths[records],
+                        np.fromiter(map(len, shard), dtype=np.int64, count=len(shard)),
+                        np.fromiter((num_tokens[item].sum() for item in shard), dtype=np.int64, count=len(shard)),
+                        self.token_counter, self.packer,
+                    )))
+
+            results = run_tasks((task for *_, task in tasks), self.workers, self.max_pending)
+            for (split, name, num_samples, _), (stats, size) in zip(tasks, results):
+                report.token_stats.setdefault(split, TokenStats()).merge(stats)
+                report.shards.append(ShardSummary(
+                    file=name, split=split, num_records=stats.num_records, num_samples=num_samples, size_bytes=size,
+                    total_tokens=stats.total_tokens, max_tokens=max(stats.histogram, default=0),
+                ))
+        report.write_json(os.path.join(output_dir, SUMMARY_FILE))
+        return report
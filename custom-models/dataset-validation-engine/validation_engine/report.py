@@ -0,0 +1,80 @@
+import json
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+
+from .tokens import TokenStats
+
+
+@dataclass
+class RecordError:
+    """Errors of one invalid record. Each error is a dict with `loc` (path in the record), `msg` and `type`."""
+
+    line: int
+    errors: List[Dict]
+
+
+@dataclass
+class ValidationReport:
+    """Result of validating a JSONL dataset, in the same format for every validator."""
+
+    source: str
+    num_records: int = 0
+    num_invalid_records: int = 0
+    # details are kept for the first max_errors invalid records only
+    invalid_records: List[RecordError] = field(default_factory=list)
+    # errors about the dataset as a whole, e.g. record count or size limits
+    dataset_errors: List[str] = field(default_factory=list)
+    # token lengths of the valid records, when counted
+    token_stats: Optional[TokenStats] = None
+
+    @property
+    def num_valid_records(self) -> int:
+        return self.num_records - self.num_invalid_records
+
+    @property
+    def truncated(self) -> bool:
+        return self.num_invalid_records > len(self.invalid_records)
+
+    @property
+    def valid(self) -> bool:
+        return not (self.num_invalid_records or self.dataset_errors)
+
+    def check_record_bounds(self, min_records: Optional[int] = None, max_records: Optional[int] = None,
+                            name: str = "dataset") -> None:
+        """Add a dataset error if the number of records is out of bounds."""
+        if min_records is not None and self.num_records < min_records:
+            self.dataset_errors.append(
+                f"The {name} contains {self.num_records} records, fewer than the minimum of {min_records}."
+            )
+        if max_records is not None and self.num_records > max_records:
+            self.dataset_errors.append(
+                f"The {name} contains {self.num_records} records, which exceeds the maximum allowed limit of "
+                f"{max_records}."
+            )
+
+    def format_errors(self) -> List[str]:
+        """One 'Line N: loc: msg' string per error of the reported invalid records, then the dataset errors."""
+        lines = []
+        for record in self.invalid_records:
+            for error in record.errors:
+                loc = ".".join(str(part) for part in error["loc"])
+                lines.append(f"Line {record.line}: {loc + ': ' if loc else ''}{error['msg']}")
+        if self.truncated:
+            lines.append(f"... and {self.num_invalid_records - len(self.invalid_records)} more invalid records")
+        return lines + self.dataset_errors
+
+    def to_dict(self) -> Dict:
+        return {
+            "source": self.source,
+            "valid": self.valid,
+            "num_records": self.num_records,
+            "num_invalid_records": self.num_invalid_records,
+            "dataset_errors": self.dataset_errors,
+            "invalid_records": [asdict(record) for record in self.invalid_records],
+            "truncated": self.truncated,
+            "token_stats": self.token_stats.to_dict() if self.token_stats else None,
+        }
+
+    def write_json(self, path: str) -> None:
+        with open(path, "w") as file:
+            json.dump(self.to_dict(), file, indent=2)
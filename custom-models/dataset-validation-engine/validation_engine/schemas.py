@@ -0,0 +1,106 @@
+"""
+Pluggable record schemas. A schema validates one raw JSONL line and returns a list of errors, each a dict with the
+`loc` (path in the record), `msg` and `type` of the error; an empty list means the record is valid.
+
+Schemas are sent to the worker processes, so they (and their checks) must be picklable: use module-level functions
+for checks, not lambdas. Compiled validators are rebuilt lazily in each process.
+"""
+
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import orjson
+
+
+def make_error(msg: str, error_type: str, loc: Sequence = ()) -> Dict:
+    return {"loc": list(loc), "msg": msg, "type": error_type}
+
+
+def run_checks(checks: Sequence[Callable], record) -> List[Dict]:
+    """Run extra checks on a record that passed its schema. A check raises ValueError with the error message."""
+    for check in checks:
+        try:
+            check(record)
+        except ValueError as e:
+            return [make_error(str(e), check.__name__)]
+    return []
+
+
+class RecordSchema:
+    """Base class: parses the line with orjson and validates the resulting object with validate_record."""
+
+    def validate_line(self, line: bytes) -> List[Dict]:
+        return self.parse(line)[1]
+
+    def parse(self, line: bytes) -> Tuple[Any, List[Dict]]:
+        """Returns the parsed record (None if it isn't valid JSON) and its errors."""
+        try:
+            record = orjson.loads(line)
+        except orjson.JSONDecodeError as e:
+            return None, [make_error(f"Invalid JSON: {e}", "json_invalid")]
+        return record, self.validate_record(record)
+
+    def validate_record(self, record) -> List[Dict]:
+        raise NotImplementedError
+
+
+class JsonSchemaRecordSchema(RecordSchema):
+    """
+    Validates records against a JSON schema, reporting the best matching error as jsonschema.validate would, then
+    runs the given checks on records that match the schema.
+    """
+
+    def __init__(self, schema: Dict, checks: Sequence[Callable] = ()):
+        self.schema = schema
+        self.checks = list(checks)
+        self._validator = None
+
+    def __getstate__(self):
+        return {**self.__dict__, "_validator": None}
+
+    @property
+    def validator(self):
+        if self._validator is None:
+            from jsonschema.validators import validator_for
+
+            self._validator = validator_for(self.schema)(self.schema)
+        return self._validator
+
+    def validate_record(self, record) -> List[Dict]:
+        from jsonschema.exceptions import best_match
+
+        error = best_match(self.validator.iter_errors(record))
+        if error is not None:
+            return [make_error(error.message, error.validator, error.absolute_path)]
+        return run_checks(self.checks, record)
+
+
+@lru_cache(maxsize=None)
+def _type_adapter(model):
+    from pydantic import TypeAdapter
+
+    return TypeAdapter(model)
+
+
+class PydanticRecordSchema(RecordSchema):
+    """
+    Validates raw JSON lines with a pydantic model (TypeAdapter.validate_json, no intermediate dict), then runs the
+    given checks on the validated model instance.
+    """
+
+    def __init__(self, model, context: Optional[Dict] = None, checks: Sequence[Callable] = ()):
+        self.model = model
+        self.context = context
+        self.checks = list(checks)
+
+    def parse(self, line: bytes) -> Tuple[Any, List[Dict]]:
+        from pydantic import ValidationError
+
+        try:
+            instance = _type_adapter(self.model).validate_json(line, context=self.context)
+        except ValidationError as e:
+            return None, [
+                make_error(error["msg"], error["type"], error["loc"])
+                for error in e.errors(include_url=False, include_context=False, include_input=False)
+            ]
+        return instance, run_checks(self.checks, instance)
@@ -0,0 +1,246 @@
+"""
+Token length statistics, computed in the same pass as schema validation.
+
+Each worker counts the tokens of the valid records of its shard with one batched call to a Rust-backed Hugging Face
+`tokenizers` tokenizer (optional dependency; without it, or without a tokenizer name, lengths are estimated from the
+number of characters). Texts repeated across records, such as system prompts, are counted once per worker through an
+LRU cache. Token lengths are kept as an exact histogram (length -> number of records), which is small, mergeable
+across shards and gives exact percentiles.
+"""
+
+import bisect
+import os
+import warnings
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+DEFAULT_CHARS_PER_TOKEN = 4
+DEFAULT_CACHE_SIZE = 4096
+# texts shorter than this are tokenized directly instead of going through the cache
+MIN_CACHED_TEXT_LENGTH = 64
+MAX_FLAGGED_RECORDS = 100
+PERCENTILES = (50, 90, 95, 99)
+
+TEXT_KEYS = ("text", "content", "prompt", "completion", "system")
+
+
+def default_texts(record) -> List[str]:
+    """
+    The strings of a record under one of TEXT_KEYS, at any depth (e.g. Converse messages, prompt/completion pairs
+    or invocation logs). Works on parsed JSON and on pydantic model instances.
+    """
+    texts = []
+
+    def walk(value, key=None):
+        if isinstance(value, str):
+            if key in TEXT_KEYS:
+                texts.append(value)
+        elif isinstance(value, dict):
+            for child_key, child in value.items():
+                walk(child, child_key)
+        elif isinstance(value, (list, tuple)):
+            for child in value:
+                walk(child, key)
+        elif hasattr(value, "__dict__"):
+            for child_key, child in vars(value).items():
+                walk(child, child_key)
+
+    walk(record)
+    return texts
+
+
+@lru_cache(maxsize=None)
+def load_tokenizer(name: str):
+    """Load a `tokenizers` tokenizer from a tokenizer.json file or a Hugging Face Hub model id."""
+    from tokenizers import Tokenizer
+
+    if os.path.isfile(name):
+        return Tokenizer.from_file(name)
+    return Tokenizer.from_pretrained(name)
+
+
+class TokenCounter:
+    """
+    Counts the tokens of records for a context limit.
+
+    Args:
+        tokenizer: tokenizer.json path or Hugging Face Hub model id; None to estimate from the number of characters
+        max_tokens: context limit, records above it are flagged (or dropped from the output)
+        chars_per_token: used when there is no tokenizer (each text counts len(text) // chars_per_token tokens)
+        texts: function returning the texts of a (validated) record, see default_texts
+    """
+
+    def __init__(self, tokenizer: Optional[str] = None, max_tokens: Optional[int] = None,
+                 chars_per_token: float = DEFAULT_CHARS_PER_TOKEN, texts=default_texts,
+                 cache_size: int = DEFAULT_CACHE_SIZE):
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens
+        self.chars_per_token = chars_per_token
+        self.texts = texts
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        if tokenizer:
+            try:
+                import tokenizers  # noqa: F401
+            except ImportError:
+                warnings.warn("tokenizers is not installed (pip install tokenizers), estimating token counts from "
+                              f"{chars_per_token} characters per token")
+                self.tokenizer = None
+
+    def __getstate__(self):
+        return {**self.__dict__, "_cache": OrderedDict()}
+
+    def _encode(self, texts: List[str]) -> List[int]:
+        if not self.tokenizer:
+            return [int(len(text) // self.chars_per_token) for text in texts]
+        encodings = load_tokenizer(self.tokenizer).encode_batch(texts, add_special_tokens=False)
+        return [len(encoding.ids) for encoding in encodings]
+
+    def count(self, records: Iterable) -> List[int]:
+        """Token counts of the records, tokenizing all their texts in one batch."""
+        record_texts = [self.texts(record) for record in records]
+        counts = {}
+        to_encode = []
+        for texts in record_texts:
+            for text in texts:
+                if text in counts:
+                    continue
+                if len(text) >= MIN_CACHED_TEXT_LENGTH and text in self._cache:
+                    self._cache.move_to_end(text)
+                    counts[text] = self._cache[text]
+                else:
+                    counts[text] = None
+                    to_encode.append(text)
+
+        for text, num_tokens in zip(to_encode, self._encode(to_encode)):
+            counts[text] = num_tokens
+            if len(text) >= MIN_CACHED_TEXT_LENGTH:
+                self._cache[text] = num_tokens
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        return [sum(counts[text] for text in texts) for texts in record_texts]
+
+    def is_over_limit(self, num_tokens: int) -> bool:
+        return self.max_tokens is not None and num_tokens > self.max_tokens
+
+
+@dataclass
+class TokenStats:
+    """Token lengths of the valid records of a dataset."""
+
+    max_tokens: Optional[int] = None
+    histogram: Counter = field(default_factory=Counter)
+    num_over_limit: int = 0
+    # (line, number of tokens) of the first records over the limit
+    over_limit_lines: List[Tuple[int, int]] = field(default_factory=list)
+
+    @property
+    def num_records(self) -> int:
+        return sum(self.histogram.values())
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(length * count for length, count in self.histogram.items())
+
+    def add(self, line: int, num_tokens: int) -> None:
+        self.histogram[num_tokens] += 1
+        if self.max_tokens is not None and num_tokens > self.max_tokens:
+            self.num_over_limit += 1
+            if len(self.over_limit_lines) < MAX_FLAGGED_RECORDS:
+                self.over_limit_lines.append((line, num_tokens))
+
+    def merge(self, other: "TokenStats", line_offset: int = 0) -> None:
+        self.histogram.update(other.histogram)
+        self.num_over_limit += other.num_over_limit
+        for line, num_tokens in other.over_limit_lines:
+            if len(self.over_limit_lines) < MAX_FLAGGED_RECORDS:
+                self.over_limit_lines.append((line + line_offset, num_tokens))
+
+    def percentile(self, percent: float) -> int:
+        """Smallest length such that at least percent % of the records are not longer (nearest rank)."""
+        total = self.num_records
+        if not total:
+            return 0
+        rank = max(1, -(-total * percent // 100))
+        seen = 0
+        for length in sorted(self.histogram):
+            seen += self.histogram[length]
+            if seen >= rank:
+                return length
+        return max(self.histogram)
+
+    def bucketed_histogram(self) -> Dict[str, int]:
+        """Number of records per power-of-two length range, e.g. {'0-63': 10, '64-127': 30, ...}."""
+        edges = [0, 64]
+        longest = max(self.histogram, default=0)
+        while edges[-1] <= longest:
+            edges.append(edges[-1] * 2)
+        buckets = Counter()
+        for length, count in self.histogram.items():
+            index = bisect.bisect_right(edges, length) - 1
+            buckets[index] += count
+        return {f"{edges[i]}-{edges[i + 1] - 1}": buckets[i] for i in range(len(edges) - 1)}
+
+    def estimate_cost(self, price_per_1k_tokens: float, epochs: int = 1) -> float:
+        """Training cost for the dataset: tokens x epochs x price per 1000 tokens."""
+        return self.total_tokens * epochs * price_per_1k_tokens / 1000
+
+    def to_dict(self) -> Dict:
+        num_records = self.num_records
+        return {
+            "num_records": num_records,
+            "total_tokens": self.total_tokens,
+            "mean_tokens": round(self.total_tokens / num_records, 1) if num_records else 0,
+            "min_tokens": min(self.histogram, default=0),
+            "max_tokens": max(self.histogram, default=0),
+            "percentiles": {f"p{percent}": self.percentile(percent) for percent in PERCENTILES},
+            "histogram": self.bucketed_histogram(),
+            "context_limit": self.max_tokens,
+            "num_over_limit": self.num_over_limit,
+            "over_limit_lines": [{"line": line, "tokens": num_tokens} for line, num_tokens in self.over_limit_lines],
+        }
+
+    def format(self, price_per_1k_tokens: Optional[float] = None, epochs: int = 1) -> List[str]:
+        """Summary, histogram and context limit lines, plus the cost estimate if a price is given."""
+        stats = self.to_dict()
+        lines = [
+            f"Token lengths of {stats['num_records']} records: total {stats['total_tokens']}, "
+            f"mean {stats['mean_tokens']}, min {stats['min_tokens']}, max {stats['max_tokens']}, "
+            + ", ".join(f"{name} {value}" for name, value in stats["percentiles"].items())
+        ]
+        width = max(stats["histogram"].values(), default=0)
+        for bucket, count in stats["histogram"].items():
+            bar = "#" * (round(40 * count / width) if width else 0)
+            lines.append(f"  {bucket:>15} {count:>10} {bar}")
+        if self.max_tokens is not None:
+            lines.append(f"{self.num_over_limit} records exceed the context limit of {self.max_tokens} tokens"
+                         + (f" (first lines: {[line for line, _ in self.over_limit_lines[:10]]})"
+                            if self.over_limit_lines else ""))
+        if price_per_1k_tokens is not None:
+            lines.append(f"Estimated training cost: ${self.estimate_cost(price_per_1k_tokens, epochs):,.2f} "
+                         f"({stats['total_tokens']} tokens x {epochs} epochs at ${price_per_1k_tokens} per 1K tokens)")
+        return lines
+
+
+def add_token_arguments(parser) -> None:
+    """Command line options for token statistics, shared by the validators."""
+    group = parser.add_argument_group("token statistics")
+    group.add_argument("--tokenizer", type=str, default=None,
+                       help="tokenizer.json file or Hugging Face Hub model id used to count tokens "
+                            "(requires `pip install tokenizers`; default: estimate from the number of characters).")
+    group.add_argument("--max-tokens", type=int, default=None,
+                       help="Context limit: samples with more tokens are flagged.")
+    group.add_argument("--drop-over-limit", type=str, default=None, metavar="OUTPUT_FILE",
+                       help="Write the valid samples within the context limit to this JSONL file.")
+    group.add_argument("--price-per-1k-tokens", type=float, default=None,
+                       help="Training price per 1000 tokens, to estimate the cost of the dataset.")
+    group.add_argument("--epochs", type=int, default=1, help="Number of epochs for the cost estimate.")
+
+
+def token_counter_from_args(args, max_tokens: Optional[int] = None, texts=default_texts) -> TokenCounter:
+    """TokenCounter for the add_token_arguments options, with the model's context limit as default max_tokens."""
+    return TokenCounter(tokenizer=args.tokenizer, max_tokens=args.max_tokens or max_tokens, texts=texts)
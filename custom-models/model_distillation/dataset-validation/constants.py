@@ -10,3 +10,8 @@ JSONL_EXTENSION = ".jsonl"
 GZ_EXTENSION = ".gz"
 S3_PREFIX = "s3://"
 MAX_SIZE = 1 * 1024 * 1024 * 1024  # 1 GB in bytes
+CHUNK_SIZE = 16 * 1024 * 1024  # bytes of JSONL validated per worker task
+MAX_ERRORS = 100  # invalid prompts reported in detail per file, the rest are only counted
+S3_MAX_CONCURRENCY = 8  # S3 objects downloaded and validated at the same time
+MANIFEST_FILE = "manifest.json"  # written by invocation_log_miner.py, verified with dataset_validator.py --manifest
+VERIFIED_SUFFIX = ".verified"  # verified shards of a manifest, next to it
@@ -1,24 +1,65 @@
+import gzip
+import hashlib
+import io
 import json
 import os
 import sys
 import argparse
 import boto3
 import logging
-import numpy as np
+import threading
+from botocore.config import Config
 from schema import Schema
 from constants import *
-from jsonschema import validate
 from jsonschema.exceptions import ValidationError
+from jsonschema.validators import validator_for
 from urllib.parse import urlparse
 from path_type import PathType
 from file_utils import FileUtils
-from concurrent.futures import as_completed, ProcessPoolExecutor
+from s3_utils import IterableStream, S3Utils
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from exceptions.distillation_validation_exception import DistillationValidationException
 
+# shared validation engine, see custom-models/dataset-validation-engine
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "dataset-validation-engine"))
+from validation_engine import RecordSchema, ValidationEngine, make_error
+
 sys.tracebacklimit = -1
 
 log = logging.getLogger(__name__)
 
+# Compiled Converse schema validator, created once per worker process
+_converse_validator = None
+
+MAX_WORKERS = os.process_cpu_count()
+
+
+class PromptSchema(RecordSchema):
+    """Validates prompts (or invocation logs) for the validation engine."""
+
+    def __init__(self, is_invocation_logs):
+        self.is_invocation_logs = is_invocation_logs
+
+    def validate_record(self, record):
+        try:
+            validate_prompt(record, self.is_invocation_logs)
+        except ValidationError as e:
+            return [make_error(e.message, "validation_error")]
+        return []
+
+
+def get_engine(is_invocation_logs, max_pending=None):
+    return ValidationEngine(PromptSchema(is_invocation_logs), workers=MAX_WORKERS, shard_size=CHUNK_SIZE,
+                            max_errors=MAX_ERRORS, max_pending=max_pending)
+
+
+def get_converse_validator():
+    global _converse_validator
+    if _converse_validator is None:
+        schema = Schema.CONVERSE.value
+        _converse_validator = validator_for(schema)(schema)
+    return _converse_validator
+
 
 # Set up logging configuration
 def setup_logging(output_file=None):
@@ -46,7 +87,7 @@ def validate_prompt(json_data, is_invocation_log):
     if is_invocation_log:
         validate_invocation_log(json_data)
     else:
-        validate(instance=json_data, schema=Schema.CONVERSE.value)
+        get_converse_validator().validate(json_data)
         validate_alternating_messages(json_data.get(MESSAGES_FIELD, []))
 
 
@@ -114,7 +155,7 @@ def validate_alternating_messages(messages):
         # Check if the role alternates as expected
         if role != expected_role:
             raise ValidationError(
-                error_message=f"Messages must alternate between '{USER_ROLE}' and '{ASSISTANT_ROLE}' roles,"
+                f"Messages must alternate between '{USER_ROLE}' and '{ASSISTANT_ROLE}' roles,"
                               f" starting with '{USER_ROLE}'."
             )
 
@@ -139,10 +180,7 @@ def validate_file(file_path, is_invocation_logs, is_file_only):
         max_size_gb = FileUtils.convert_bytes_to_Gb(MAX_SIZE)
         log.error(f"{file_path} exceeds {max_size_gb:.2f} Gb.")
 
-    with FileUtils.open_file(file_path, is_invocation_logs) as file:
-        prompts = file.readlines()
-        total_prompts += len(prompts)
-        total_valid_prompts += validate_prompts_in_parallel(prompts, file_path, is_invocation_logs)
+    total_valid_prompts, total_prompts = log_report(get_engine(is_invocation_logs).validate_file(file_path))
 
     if total_valid_prompts < MIN_NUM_PROMPTS and is_file_only:
         error_msg = f"Total number of valid prompts is less than {MIN_NUM_PROMPTS} for file {file_path}"
@@ -185,43 +223,83 @@ def validate_folder(folder_path, is_invocation_logs):
         raise DistillationValidationException(error_msg)
 
 
-def process_s3_path(path, is_invocation_logs):
-    """Process files in an S3 path."""
-    s3_client = boto3.client('s3')
-    bucket_name, prefix = parse_s3_path(path)
-
-    files = s3_client.list_objects_v2(Bucket=bucket_name, Prefix=prefix)
-
-    if 'Contents' not in files:
-        log.info(f"No files found in the S3 path {path}")
-        return
-
-    total_size = 0
-    total_prompts = 0
-    total_valid_prompts = 0
-
-    for file in files['Contents']:
-        file_key = file['Key']
-        file_extension = GZ_EXTENSION if is_invocation_logs else JSONL_EXTENSION
-        file_path = f"s3://{bucket_name}/{file_key}"
+def process_s3_path(path, is_invocation_logs, early_exit=False):
+    """
+    Process files in an S3 path.
 
-        if not file_key.endswith(file_extension):
-            log.debug(f"Skipping file {file_path} as it does not have a {file_extension} extension.")
-            continue
+    Objects are listed page by page and up to S3_MAX_CONCURRENCY of them are downloaded at a time, streaming their
+    parts into the chunk validation workers so downloads and validation overlap. The total size is checked from the
+    listing before anything is downloaded. With early_exit, validation stops as soon as MIN_NUM_PROMPTS valid
+    prompts have been found.
+    """
+    s3_client = boto3.client('s3', config=Config(max_pool_connections=S3_MAX_CONCURRENCY,
+                                                 retries={'max_attempts': 5, 'mode': 'adaptive'}))
+    bucket_name, prefix = parse_s3_path(path)
+    file_extension = GZ_EXTENSION if is_invocation_logs else JSONL_EXTENSION
 
-        file_size = file['Size']
-        total_size += file_size
-        if total_size > MAX_SIZE and not is_invocation_logs:
+    def list_files():
+        for file in S3Utils.list_objects(s3_client, bucket_name, prefix):
+            file_path = f"s3://{bucket_name}/{file['Key']}"
+            if file['Key'].endswith(file_extension):
+                yield file
+            else:
+                log.debug(f"Skipping file {file_path} as it does not have a {file_extension} extension.")
+
+    files = list_files()
+    if not is_invocation_logs:
+        # the size limit is decided by the listing alone
+        files = list(files)
+        total_size = sum(file['Size'] for file in files)
+        if total_size > MAX_SIZE:
             max_size_gb = FileUtils.convert_bytes_to_Gb(MAX_SIZE)
             error_msg = f"Total size of files exceeds {max_size_gb} Gb."
             log.error(error_msg)
             raise DistillationValidationException(error_msg)
 
-        log.info(f"Validating file from S3: {file_path}")
-        file_obj = s3_client.get_object(Bucket=bucket_name, Key=file_key)
-        lines = file_obj['Body'].readlines()
-        total_prompts += len(lines)
-        total_valid_prompts += validate_prompts_in_parallel(lines, file_path, is_invocation_logs)
+    total_files = 0
+    total_prompts = 0
+    total_valid_prompts = 0
+    stop = threading.Event()
+    # share the in-flight chunks between the objects downloaded concurrently
+    engine = get_engine(is_invocation_logs, max_pending=max(1, 2 * MAX_WORKERS // S3_MAX_CONCURRENCY))
+    pending = set()
+    totals_lock = threading.Lock()
+
+    def on_shard(num_prompts, num_invalid_prompts):
+        # counted per shard rather than per object, so early exit doesn't wait for whole objects
+        nonlocal total_prompts, total_valid_prompts
+        with totals_lock:
+            total_prompts += num_prompts
+            total_valid_prompts += num_prompts - num_invalid_prompts
+            if early_exit and total_valid_prompts >= MIN_NUM_PROMPTS and not stop.is_set():
+                log.info(f"Found at least {MIN_NUM_PROMPTS} valid prompts, stopping early.")
+                stop.set()
+
+    def collect(futures):
+        for future in futures:
+            pending.discard(future)
+            future.result()
+
+    with ThreadPoolExecutor(max_workers=S3_MAX_CONCURRENCY) as executor:
+        try:
+            for file in files:
+                if len(pending) >= S3_MAX_CONCURRENCY:
+                    collect(wait(pending, return_when=FIRST_COMPLETED).done)
+                if stop.is_set():
+                    break
+                total_files += 1
+                pending.add(executor.submit(validate_s3_object, s3_client, bucket_name, file, is_invocation_logs,
+                                            engine, stop, on_shard))
+            collect(wait(pending).done)
+        except BaseException:
+            stop.set()
+            for future in pending:
+                future.cancel()
+            raise
+
+    if total_files == 0:
+        log.info(f"No files found in the S3 path {path}")
+        return
 
     is_file_path = path.endswith(GZ_EXTENSION) or path.endswith(JSONL_EXTENSION)
     if not is_file_path:
@@ -233,54 +311,98 @@ def process_s3_path(path, is_invocation_logs):
         raise DistillationValidationException(error_msg)
 
 
-def validate_prompts_in_parallel(prompts, file_path, is_invocation_logs):
-    """Validates the given prompts in parallel"""
-    max_workers = os.process_cpu_count()
-
-    # Create a thread pool to process chunks in parallel
-    with ProcessPoolExecutor(max_workers=max_workers) as executor:
-        futures = []
-
-        chunks = np.array_split(np.array(prompts), max_workers)
-        starting_line = 1
-        for lines in chunks:
-            futures.append(executor.submit(validate_lines, lines, starting_line, file_path, is_invocation_logs))
-            starting_line += lines.size
-
-        # Wait for all tasks to complete
-        total_valid_prompts = 0
-        for future in as_completed(futures):
-            num_valid_prompts, errors = future.result()
-            total_valid_prompts += num_valid_prompts
-            if errors:
-                for error in errors:
-                    log.debug(error)
-
-        if total_valid_prompts < len(prompts):
-            log.info("Prompts with invalid format detected. Specify an output file for more details."
-                     " Visit the following link for correct format."
-                     " \nhttps://docs.aws.amazon.com/bedrock/latest/userguide/prequisites-model-distillation.html ")
-
-        log.info(f"{total_valid_prompts} out of {len(prompts)} prompts are valid for file: {file_path}")
-        return total_valid_prompts
-
-
-def validate_lines(lines, starting_line, file_path, is_invocation_logs):
-    """Process a chunk of prompts."""
-    line_num = starting_line
-    num_valid_prompts = 0
-    errors = []
-    for line in lines:
-        try:
-            json_data = json.loads(line)
-            validate_prompt(json_data, is_invocation_logs)
-            num_valid_prompts += 1
-        except json.JSONDecodeError:
-            errors.append(f"Invalid JSON. This occurred on line {line_num} for file {file_path}")
-        except ValidationError as e:
-            errors.append(f"Validation error: {e.message}. This occurred on line {line_num} for file {file_path}")
-        line_num += 1
-    return num_valid_prompts, errors
+def validate_s3_object(s3_client, bucket_name, file, is_invocation_logs, engine, stop, on_shard=None):
+    """
+    Stream an S3 object into the chunk validation workers, until it ends or stop is set. Once stop is set no further
+    parts of the object are downloaded.
+    """
+    file_path = f"s3://{bucket_name}/{file['Key']}"
+    log.info(f"Validating file from S3: {file_path}")
+
+    parts = IterableStream(S3Utils.iter_object_parts(s3_client, bucket_name, file['Key'], file['Size'], CHUNK_SIZE))
+    with parts:
+        stream = gzip.GzipFile(fileobj=io.BufferedReader(parts, CHUNK_SIZE)) if is_invocation_logs else parts
+        with stream:
+            return log_report(engine.validate_stream(stream, file_path, stop, on_shard))
+
+
+def log_report(report):
+    """Log the errors of a file's validation report. Returns (number of valid prompts, number of prompts)."""
+    for record in report.invalid_records:
+        for error in record.errors:
+            message = "Invalid JSON" if error["type"] == "json_invalid" else f"Validation error: {error['msg']}"
+            log.debug(f"{message}. This occurred on line {record.line} for file {report.source}")
+    if report.truncated:
+        log.debug(f"{report.num_invalid_records - len(report.invalid_records)} more invalid prompts"
+                  f" for file {report.source}")
+
+    if report.num_invalid_records:
+        log.info("Prompts with invalid format detected. Specify an output file for more details."
+                 " Visit the following link for correct format."
+                 " \nhttps://docs.aws.amazon.com/bedrock/latest/userguide/prequisites-model-distillation.html ")
+
+    log.info(f"{report.num_valid_records} out of {report.num_records} prompts are valid for file: {report.source}")
+    return report.num_valid_records, report.num_records
+
+
+def verify_manifest(manifest_path):
+    """
+    Verify the shards of a manifest written by invocation_log_miner.py: checksum, record count and validation of
+    each shard. Verified shards are recorded next to the manifest (<manifest>.verified) and only checksummed by later
+    runs, so new shards can be verified incrementally.
+    """
+    with open(manifest_path) as file:
+        manifest = json.load(file)
+    is_invocation_logs = manifest["format"] == "logs"
+    folder = os.path.dirname(os.path.abspath(manifest_path))
+    state_path = manifest_path + VERIFIED_SUFFIX
+    verified = {}
+    if os.path.exists(state_path):
+        with open(state_path) as file:
+            verified = json.load(file)
+
+    engine = get_engine(is_invocation_logs)
+    total_valid_prompts = 0
+    failed_shards = []
+    for shard in manifest["shards"]:
+        shard_path = os.path.join(folder, shard["path"])
+        if not os.path.exists(shard_path):
+            log.error(f"Shard {shard['path']} is missing.")
+            failed_shards.append(shard["path"])
+            continue
+        digest = hashlib.sha256()
+        with open(shard_path, "rb") as file:
+            for block in iter(lambda: file.read(CHUNK_SIZE), b""):
+                digest.update(block)
+        if digest.hexdigest() != shard["sha256"]:
+            log.error(f"Checksum mismatch for {shard['path']}: the shard was modified or truncated.")
+            failed_shards.append(shard["path"])
+            continue
+        previous = verified.get(shard["path"])
+        if previous and previous["sha256"] == shard["sha256"]:
+            log.debug(f"Skipping validation of {shard['path']}, already verified.")
+            total_valid_prompts += previous["num_valid_records"]
+            continue
+
+        num_valid_prompts, num_prompts = log_report(engine.validate_file(shard_path))
+        if num_prompts != shard["num_records"]:
+            log.error(f"{shard['path']} contains {num_prompts} records, the manifest lists {shard['num_records']}.")
+            failed_shards.append(shard["path"])
+            continue
+        total_valid_prompts += num_valid_prompts
+        verified[shard["path"]] = {"sha256": shard["sha256"], "num_valid_records": num_valid_prompts}
+        with open(state_path, "w") as file:
+            json.dump(verified, file, indent=2)
+
+    log.info(f"{total_valid_prompts} out of {manifest['num_records']} prompts are valid for manifest: {manifest_path}")
+    if failed_shards:
+        error_msg = f"{len(failed_shards)} shards failed verification: {', '.join(failed_shards)}"
+        log.error(error_msg)
+        raise DistillationValidationException(error_msg)
+    if total_valid_prompts < MIN_NUM_PROMPTS:
+        error_msg = f"Total number of valid prompts is less than {MIN_NUM_PROMPTS}."
+        log.error(error_msg)
+        raise DistillationValidationException(error_msg)
 
 
 def parse_s3_path(path):
@@ -308,9 +430,15 @@ def main():
     parser.add_argument(
         "-p", "--path",
         type=str,
-        required=True,
+        required=False,
         help="File, folder, or S3 path."
     )
+    parser.add_argument(
+        "-m", "--manifest",
+        type=str,
+        required=False,
+        help="Verify the shards of a manifest written by invocation_log_miner.py, skipping shards already verified."
+    )
     parser.add_argument(
         "-o", "--output",
         type=str,
@@ -322,8 +450,15 @@ def main():
         action="store_true",
         help="Flag to indicate that the files are invocation log files."
     )
+    parser.add_argument(
+        "-e", "--early_exit",
+        action="store_true",
+        help="Stop validating an S3 path as soon as the minimum number of valid prompts is found."
+    )
 
     args = parser.parse_args()
+    if not args.path and not args.manifest:
+        parser.error("one of -p/--path or -m/--manifest is required")
     path = args.path
     output_file = args.output
     is_invocation_logs = args.invocation_logs
@@ -331,6 +466,11 @@ def main():
     # Set up logging to console and to file if specified
     setup_logging(output_file)
 
+    if args.manifest:
+        verify_manifest(args.manifest)
+        log.info("Validation complete.")
+        return
+
     # Determine whether the provided path is a file or folder
     path_type = get_path_type(path)
 
@@ -342,7 +482,7 @@ def main():
     elif path_type == PathType.FOLDER:
         validate_folder(path, is_invocation_logs)
     elif path_type == PathType.S3:
-        process_s3_path(path, is_invocation_logs)
+        process_s3_path(path, is_invocation_logs, args.early_exit)
     else:
         log.info(f"The provided path '{path}' is not a valid file or folder or S3 path.")
         sys.exit(1)
@@ -0,0 +1,443 @@
+"""
+Mines Bedrock model invocation logs into a sharded distillation dataset.
+
+Phase 1 runs one task per log object (local file or S3 object) on a pool of worker processes. Each task streams the
+gzip logs, keeps the entries supported for distillation (validate_invocation_log) that match the model, time and
+request metadata filters, joins the extra metadata, and converts the entries if needed. It gives each record a
+stable id, a hash of its prompt, and routes it to a staging shard by that id, so duplicates always land in the same
+shard.
+
+Phase 2 runs one task per shard. It drops duplicate prompts with a set bounded by the size of the shard, samples
+each (model, time bucket) down to the requested size (deterministically, by id), and writes the final shard. Log
+records keep their id as "recordId"; the ids of prompt records, whose schema allows no extra fields, are written to
+a part-NNNNN-of-NNNNN.ids file next to the shard, one per line in record order. The manifest lists each shard with
+its record count, size and SHA-256, for dataset_validator.py --manifest.
+"""
+
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+import sys
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+import boto3
+import orjson
+from botocore.config import Config
+from jsonschema.exceptions import ValidationError
+
+from constants import *
+from dataset_validator import MAX_WORKERS, parse_s3_path, validate_invocation_log, validate_prompt
+from s3_utils import IterableStream, S3Utils
+
+# shared validation engine, see custom-models/dataset-validation-engine
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "dataset-validation-engine"))
+from validation_engine import run_tasks
+
+log = logging.getLogger(__name__)
+
+
+PROMPTS_FORMAT = "prompts"
+LOGS_FORMAT = "logs"
+TIME_BUCKETS = {"hour": "%Y-%m-%dT%H", "day": "%Y-%m-%d", "month": "%Y-%m"}
+INPUT_EXTENSIONS = (GZ_EXTENSION, JSONL_EXTENSION, ".json")
+IDS_EXTENSION = ".ids"  # record ids of a prompts shard, one per line
+
+# S3 client of each worker process
+_s3_client = None
+
+
+@dataclass
+class MiningOptions:
+    """Filters and output settings, sent to the worker processes."""
+
+    output_format: str = LOGS_FORMAT
+    num_shards: int = 16
+    model_ids: List[str] = field(default_factory=list)
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
+    # requestMetadata key -> required value
+    metadata_filters: Dict[str, str] = field(default_factory=dict)
+    # JSONL file of {"requestId": ..., <metadata>} joined into requestMetadata
+    metadata_path: Optional[str] = None
+    include_responses: bool = False
+    time_bucket: str = "day"
+
+
+def get_s3_client():
+    global _s3_client
+    if _s3_client is None:
+        _s3_client = boto3.client("s3", config=Config(retries={"max_attempts": 5, "mode": "adaptive"}))
+    return _s3_client
+
+
+@lru_cache(maxsize=None)
+def load_metadata(metadata_path):
+    """requestId -> metadata dict, loaded once per worker process."""
+    metadata = {}
+    with open(metadata_path, "rb") as file:
+        for line in file:
+            if line.strip():
+                entry = orjson.loads(line)
+                metadata[entry.pop("requestId")] = {key: str(value) for key, value in entry.items()}
+    return metadata
+
+
+def text_of(content):
+    """The text of a message content: a string, or the text items of a list of content blocks."""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(item.get("text", "") for item in content if isinstance(item, dict))
+    return ""
+
+
+def extract_prompt(entry) -> Tuple[str, str]:
+    """(system prompt, user prompt) of an invocation log entry (Converse, Messages or prompt string requests)."""
+    body = entry.get("input", {}).get("inputBodyJson", {})
+    system = text_of(body.get("system", ""))
+    messages = body.get("messages")
+    if isinstance(messages, list):
+        user = "".join(text_of(message.get("content")) for message in messages if message.get("role") == USER_ROLE)
+    else:
+        user = body.get("prompt") or body.get("inputText") or ""
+    return system, user
+
+
+def extract_response(entry) -> str:
+    """The generated text of an invocation log entry, for the common response formats."""
+    body = entry.get("output", {}).get("outputBodyJson", {})
+    if "output" in body:
+        return text_of(body["output"].get("message", {}).get("content"))
+    if "content" in body:
+        return text_of(body["content"])
+    if "generation" in body:
+        return body["generation"]
+    if "results" in body and body["results"]:
+        return body["results"][0].get("outputText", "")
+    return ""
+
+
+def to_prompt_record(entry, include_response):
+    """Convert a log entry to a bedrock-conversation-2024 prompt."""
+    system, user = extract_prompt(entry)
+    record = {"schemaVersion": "bedrock-conversation-2024"}
+    if system:
+        record["system"] = [{"text": system}]
+    record[MESSAGES_FIELD] = [{ROLE_FIELD: USER_ROLE, "content": [{"text": user}]}]
+    response = extract_response(entry) if include_response else ""
+    if response:
+        record[MESSAGES_FIELD].append({ROLE_FIELD: ASSISTANT_ROLE, "content": [{"text": response}]})
+    return record
+
+
+def record_id(system, user) -> str:
+    """Stable id of a prompt: the same prompt always gets the same id, in any run."""
+    return hashlib.sha256(f"{system}\x00{user}".encode()).hexdigest()[:32]
+
+
+def shard_of(id, num_shards) -> int:
+    return int(id[8:16], 16) % num_shards
+
+
+def sample_fraction(id) -> float:
+    """Uniform in [0, 1) and independent of the shard, used for deterministic sampling."""
+    return int(id[:8], 16) / 0x100000000
+
+
+def parse_timestamp(value) -> Optional[datetime]:
+    try:
+        timestamp = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except (AttributeError, ValueError):
+        return None
+    return timestamp if timestamp.tzinfo else timestamp.replace(tzinfo=timezone.utc)
+
+
+def open_source(source):
+    """Binary line stream of a ("file", path) or ("s3", bucket, key, size) log source."""
+    if source[0] == "s3":
+        _, bucket_name, key, size = source
+        parts = S3Utils.iter_object_parts(get_s3_client(), bucket_name, key, size, CHUNK_SIZE)
+        stream = io.BufferedReader(IterableStream(parts), CHUNK_SIZE)
+        return gzip.GzipFile(fileobj=stream) if key.endswith(GZ_EXTENSION) else stream
+    return gzip.open(source[1], "rb") if source[1].endswith(GZ_EXTENSION) else open(source[1], "rb")
+
+
+def mine_source(source, options: MiningOptions):
+    """
+    Phase 1 task: filter, convert and route the entries of one log source.
+
+    Returns (counts, (model, time bucket) -> kept entries, shard -> staged lines), where a staged line is
+    "<id>\\t<model>\\t<time bucket>\\t<record JSON>".
+    """
+    counts = Counter()
+    buckets = Counter()
+    shards = {}
+    metadata = load_metadata(options.metadata_path) if options.metadata_path else None
+    with open_source(source) as stream:
+        for line in stream:
+            if not line.strip():
+                continue
+            counts["entries"] += 1
+            try:
+                entry = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                counts["rejected: invalid JSON"] += 1
+                continue
+            try:
+                validate_invocation_log(entry)
+            except ValidationError as e:
+                counts[f"rejected: {e.message}"] += 1
+                continue
+            except (AttributeError, KeyError, TypeError):
+                counts["rejected: unsupported entry structure"] += 1
+                continue
+
+            model_id = entry["modelId"]
+            if options.model_ids and model_id not in options.model_ids:
+                counts["filtered: model"] += 1
+                continue
+            timestamp = parse_timestamp(entry.get("timestamp"))
+            if (options.start or options.end) and (
+                timestamp is None
+                or (options.start and timestamp < options.start)
+                or (options.end and timestamp >= options.end)
+            ):
+                counts["filtered: time"] += 1
+                continue
+            if metadata is not None and entry.get("requestId") in metadata:
+                entry["requestMetadata"] = {**entry.get("requestMetadata", {}), **metadata[entry["requestId"]]}
+                counts["metadata joined"] += 1
+            request_metadata = entry.get("requestMetadata", {})
+            if any(request_metadata.get(key) != value for key, value in options.metadata_filters.items()):
+                counts["filtered: metadata"] += 1
+                continue
+
+            system, user = extract_prompt(entry)
+            id = record_id(system, user)
+            if options.output_format == PROMPTS_FORMAT:
+                record = to_prompt_record(entry, options.include_responses)
+                try:
+                    validate_prompt(record, False)
+                except ValidationError as e:
+                    counts[f"rejected: {e.message}"] += 1
+                    continue
+            else:
+                record = {**entry, "recordId": id}
+
+            bucket = timestamp.strftime(TIME_BUCKETS[options.time_bucket]) if timestamp else "unknown"
+            buckets[(model_id, bucket)] += 1
+            shards.setdefault(shard_of(id, options.num_shards), []).append(
+                b"\t".join((id.encode(), model_id.encode(), bucket.encode(), orjson.dumps(record)))
+            )
+            counts["kept"] += 1
+    return counts, buckets, {shard: b"\n".join(lines) + b"\n" for shard, lines in shards.items()}
+
+
+def finalize_shard(staging_path, output_path, bucket_rates, compress, ids_path=None):
+    """
+    Phase 2 task: drop duplicate prompts and sample a staging shard into the output shard. With ids_path, the ids of
+    the records are written to it, one per line in the order of the records (the prompt format has no room for them).
+
+    Returns the manifest entry of the shard and its counts.
+    """
+    seen = set()
+    counts = Counter()
+    models = Counter()
+    digest = hashlib.sha256()
+    ids = open(ids_path, "wb") if ids_path else None
+    with open(output_path, "wb") as file:
+        output = gzip.GzipFile(filename="", mode="wb", fileobj=file, mtime=0) if compress else file
+        with open(staging_path, "rb") as staging:
+            for line in staging:
+                id, model_id, bucket, record = line.rstrip(b"\n").split(b"\t", 3)
+                if id in seen:
+                    counts["duplicates"] += 1
+                    continue
+                seen.add(id)
+                if sample_fraction(id.decode()) >= bucket_rates.get((model_id.decode(), bucket.decode()), 1.0):
+                    counts["sampled out"] += 1
+                    continue
+                output.write(record + b"\n")
+                if ids:
+                    ids.write(id + b"\n")
+                models[model_id.decode()] += 1
+                counts["records"] += 1
+        if compress:
+            output.close()
+    if ids:
+        ids.close()
+    with open(output_path, "rb") as file:
+        for block in iter(lambda: file.read(CHUNK_SIZE), b""):
+            digest.update(block)
+    shard = {
+        "path": os.path.basename(output_path),
+        "num_records": counts["records"],
+        "size": os.path.getsize(output_path),
+        "sha256": digest.hexdigest(),
+        "models": dict(models),
+    }
+    if ids_path:
+        shard["ids_path"] = os.path.basename(ids_path)
+    return shard, counts
+
+
+def list_sources(path):
+    """Log sources of a local file or folder, or an S3 path, in a stable order."""
+    if path.startswith(S3_PREFIX):
+        bucket_name, prefix = parse_s3_path(path)
+        for file in S3Utils.list_objects(get_s3_client(), bucket_name, prefix):
+            if file["Key"].endswith(INPUT_EXTENSIONS):
+                yield "s3", bucket_name, file["Key"], file["Size"]
+    elif os.path.isfile(path):
+        yield "file", path
+    else:
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if filename.endswith(INPUT_EXTENSIONS):
+                    yield "file", os.path.join(dirpath, filename)
+
+
+def mine_invocation_logs(paths, output_dir, options: MiningOptions, max_per_bucket=None, sample_rate=1.0,
+                         workers=None):
+    """
+    Mine the invocation logs under the given local or S3 paths into output_dir: part-NNNNN-of-NNNNN.jsonl shards
+    (.jsonl.gz for the logs format) and manifest.json. Returns the manifest.
+    """
+    workers = workers or MAX_WORKERS
+    staging_dir = os.path.join(output_dir, "_staging")
+    os.makedirs(staging_dir, exist_ok=True)
+    staging = [open(os.path.join(staging_dir, f"shard-{shard:05d}"), "wb") for shard in range(options.num_shards)]
+    counts = Counter()
+    buckets = Counter()
+    num_sources = 0
+    try:
+        tasks = ((mine_source, source, options) for path in paths for source in list_sources(path))
+        for source_counts, source_buckets, source_shards in run_tasks(tasks, workers, 2 * workers):
+            num_sources += 1
+            counts.update(source_counts)
+            buckets.update(source_buckets)
+            for shard, data in source_shards.items():
+                staging[shard].write(data)
+            if num_sources % 100 == 0:
+                log.info(f"Mined {num_sources} log files, {counts['kept']} of {counts['entries']} entries kept")
+    finally:
+        for file in staging:
+            file.close()
+
+    # deterministic per (model, time bucket) sampling rates; duplicates are still counted here
+    bucket_rates = {
+        bucket: min(1.0, sample_rate * (max_per_bucket / count if max_per_bucket else 1.0))
+        for bucket, count in buckets.items()
+    }
+    compress = options.output_format == LOGS_FORMAT
+    extension = JSONL_EXTENSION + (GZ_EXTENSION if compress else "")
+
+    # logs records carry their id as recordId; prompt records can't, so their ids go to a sidecar file
+    names = [os.path.join(output_dir, f"part-{shard:05d}-of-{options.num_shards:05d}")
+             for shard in range(options.num_shards)]
+    tasks = (
+        (finalize_shard, os.path.join(staging_dir, f"shard-{shard:05d}"), names[shard] + extension, bucket_rates,
+         compress, None if compress else names[shard] + IDS_EXTENSION)
+        for shard in range(options.num_shards)
+    )
+    shards = []
+    for shard, shard_counts in run_tasks(tasks, workers, 2 * workers):
+        shards.append(shard)
+        counts.update(shard_counts)
+    shutil.rmtree(staging_dir)
+
+    manifest = {
+        "created": datetime.now(timezone.utc).isoformat(),
+        "inputs": paths,
+        "format": options.output_format,
+        "options": {
+            "model_ids": options.model_ids,
+            "start": options.start.isoformat() if options.start else None,
+            "end": options.end.isoformat() if options.end else None,
+            "metadata_filters": options.metadata_filters,
+            "metadata_path": options.metadata_path,
+            "include_responses": options.include_responses,
+            "time_bucket": options.time_bucket,
+            "max_per_bucket": max_per_bucket,
+            "sample_rate": sample_rate,
+        },
+        "num_sources": num_sources,
+        "num_records": sum(shard["num_records"] for shard in shards),
+        "counts": dict(sorted(counts.items())),
+        "shards": shards,
+    }
+    with open(os.path.join(output_dir, MANIFEST_FILE), "w") as file:
+        json.dump(manifest, file, indent=2)
+    return manifest
+
+
+def parse_date(value):
+    timestamp = parse_timestamp(value)
+    if timestamp is None:
+        raise argparse.ArgumentTypeError(f"invalid ISO 8601 date: {value}")
+    return timestamp
+
+
+def parse_filter(value):
+    if "=" not in value:
+        raise argparse.ArgumentTypeError(f"expected key=value, got: {value}")
+    return tuple(value.split("=", 1))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mine Bedrock invocation logs into a sharded distillation dataset.")
+    parser.add_argument("-p", "--path", type=str, nargs="+", required=True,
+                        help="Invocation log files, folders or S3 paths (s3://bucket/prefix).")
+    parser.add_argument("-o", "--output_dir", type=str, required=True, help="Directory for the shards and manifest.")
+    parser.add_argument("-f", "--format", choices=[LOGS_FORMAT, PROMPTS_FORMAT], default=LOGS_FORMAT,
+                        help="Keep the log entries (gzip JSONL) or convert them to bedrock-conversation-2024 prompts.")
+    parser.add_argument("-n", "--num_shards", type=int, default=16, help="Number of output shards.")
+    parser.add_argument("-m", "--model_id", type=str, nargs="+", default=[], help="Only keep these model ids.")
+    parser.add_argument("--start", type=parse_date, default=None, help="Only keep entries from this time (ISO 8601).")
+    parser.add_argument("--end", type=parse_date, default=None, help="Only keep entries before this time (ISO 8601).")
+    parser.add_argument("--filter", type=parse_filter, nargs="+", default=[], metavar="KEY=VALUE",
+                        help="Only keep entries with these requestMetadata values (after the metadata join).")
+    parser.add_argument("--metadata", type=str, default=None,
+                        help="JSONL file of {\"requestId\": ..., <key>: <value>} joined into requestMetadata.")
+    parser.add_argument("--include_responses", action="store_true",
+                        help="With the prompts format, add the logged response as the assistant message.")
+    parser.add_argument("--time_bucket", choices=list(TIME_BUCKETS), default="day",
+                        help="Time bucket for --max_per_bucket sampling.")
+    parser.add_argument("--max_per_bucket", type=int, default=None,
+                        help="Sample about this many prompts per model and time bucket.")
+    parser.add_argument("--sample_rate", type=float, default=1.0, help="Keep this fraction of the prompts.")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="Number of worker processes (default: number of CPUs).")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    options = MiningOptions(
+        output_format=args.format,
+        num_shards=args.num_shards,
+        model_ids=args.model_id,
+        start=args.start,
+        end=args.end,
+        metadata_filters=dict(args.filter),
+        metadata_path=args.metadata,
+        include_responses=args.include_responses,
+        time_bucket=args.time_bucket,
+    )
+    manifest = mine_invocation_logs(args.path, args.output_dir, options, args.max_per_bucket, args.sample_rate,
+                                    args.workers)
+    for name, count in manifest["counts"].items():
+        log.info(f"{name}: {count}")
+    log.info(f"Wrote {manifest['num_records']} records in {len(manifest['shards'])} shards to {args.output_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+import io
+
+
+class IterableStream(io.RawIOBase):
+    """Read-only file object over an iterator of bytes, e.g. the parts of an S3 object."""
+
+    def __init__(self, parts):
+        self.parts = iter(parts)
+        self.buffer = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self.buffer:
+            self.buffer = next(self.parts, None)
+            if self.buffer is None:
+                self.buffer = b""
+                return 0
+        size = min(len(b), len(self.buffer))
+        b[:size] = self.buffer[:size]
+        self.buffer = self.buffer[size:]
+        return size
+
+    def close(self):
+        # stop the part iterator, e.g. so no more range GETs are made for an S3 object
+        close = getattr(self.parts, "close", None)
+        if close:
+            close()
+        self.buffer = b""
+        super().close()
+
+
+class S3Utils:
+    @staticmethod
+    def list_objects(s3_client, bucket_name, prefix):
+        """Yield every object (dict with Key and Size) under the prefix, across all pages of results."""
+        paginator = s3_client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+            yield from page.get("Contents", [])
+
+    @staticmethod
+    def iter_object_parts(s3_client, bucket_name, key, size, part_size):
+        """
+        Download an object in parts of at most part_size bytes.
+
+        Small objects are fetched with a single GET; larger ones with sequential range GETs, so a part is only
+        held in memory until it has been handed off, and a dropped connection only retries one part.
+        """
+        if size <= part_size:
+            yield s3_client.get_object(Bucket=bucket_name, Key=key)["Body"].read()
+            return
+        for start in range(0, size, part_size):
+            end = min(start + part_size, size) - 1
+            response = s3_client.get_object(Bucket=bucket_name, Key=key, Range=f"bytes={start}-{end}")
+            yield response["Body"].read()
@@ -12,18 +12,27 @@ The output format matches the AWS Bedrock Batch Inference output format.
 
 import os
 import json
+import hashlib
 import time
 import logging
 import argparse
 import secrets
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, List, Any, Optional, Tuple
+from typing import Dict, Iterable, Iterator, List, Any, Optional, Tuple
 
 import boto3
+from botocore.config import Config
 from botocore.exceptions import ClientError
 from tqdm import tqdm
 
 
+# Error codes that mean we are sending requests too fast
+THROTTLING_ERROR_CODES = {"ThrottlingException", "TooManyRequestsException", "ServiceUnavailableException"}
+
+
 # Configure logging
 def setup_logging(log_level: str = "INFO") -> Tuple[logging.Logger, logging.Logger]:
     """
@@ -64,6 +73,244 @@ def setup_logging(log_level: str = "INFO") -> Tuple[logging.Logger, logging.Logg
     return main_logger, error_logger
 
 
+class AdaptiveRateLimiter:
+    """
+    Thread-safe request rate limiter that adapts to throttling (AIMD)
+
+    Requests are spaced 1 / rate seconds apart. Every throttled request cuts the rate by 30%
+    (multiplicative decrease, at most once per cooldown period), and every successful
+    request raises it by a small step (additive increase) up to max_rate.
+    """
+
+    def __init__(
+        self,
+        initial_rate: float = 5.0,
+        min_rate: float = 0.1,
+        max_rate: float = 50.0,
+        increase_step: float = 0.2,
+        decrease_factor: float = 0.7,
+        cooldown: float = 1.0
+    ):
+        """
+        Args:
+            initial_rate: Initial requests per second
+            min_rate: Lower bound for the rate
+            max_rate: Upper bound for the rate
+            increase_step: Requests per second added after each success
+            decrease_factor: Multiplier applied to the rate after throttling
+            cooldown: Minimum seconds between two rate decreases
+        """
+        self.rate = initial_rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._next_slot = time.monotonic()
+        self._last_decrease = 0.0
+
+    def acquire(self) -> None:
+        """Block until the caller may send the next request"""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next_slot, now)
+            self._next_slot = slot + 1.0 / self.rate
+        if slot > now:
+            time.sleep(slot - now)
+
+    def on_success(self) -> None:
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase_step)
+
+    def on_throttle(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            # one burst of throttled responses only counts once
+            if now - self._last_decrease >= self.cooldown:
+                self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+                self._last_decrease = now
+
+
+def stable_record_id(record: Dict[str, Any]) -> str:
+    """
+    Record ID derived from the record content, identical across runs and processes
+    (unlike hash(), which is salted per process)
+    
+    Args:
+        record: Input record without a recordId
+        
+    Returns:
+        ID of the form record_<16 hex chars of the SHA-256 of the canonical JSON>
+    """
+    canonical = json.dumps(record, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return f"record_{hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:16]}"
+
+
+class OutputCheckpoint:
+    """
+    Append-only output file with a sidecar index for resuming interrupted runs
+    
+    Every result line written to the output file gets a line "<recordId>\t<status>\t<end offset>"
+    in <output_file>.index, where status is "ok" or "failed" and the offset is the output file size
+    after the line. Both files are flushed and fsynced every fsync_every records or fsync_interval
+    seconds (output first, so the index never points past durable output).
+    
+    On resume, the index is read and only the output written after its last offset is scanned, so
+    lines that made it to disk after the last checkpoint are recovered and a torn last line is cut off.
+    Without an index the whole output file is scanned.
+    """
+    
+    def __init__(self, output_file: str, fsync_every: int = 100, fsync_interval: float = 30.0):
+        self.output_file = output_file
+        self.index_file = f"{output_file}.index"
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.status: Dict[str, str] = {}
+        self._output = None
+        self._index = None
+        self._offset = 0
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self.has_duplicates = False
+    
+    def load(self) -> Dict[str, str]:
+        """
+        Read the status of the records already in the output file
+        
+        Returns:
+            Mapping of recordId to "ok" or "failed" (the latest result for each record)
+        """
+        self.status = {}
+        indexed_offset = 0
+        index_size = 0  # bytes of the index made of complete, well-formed lines
+        if os.path.exists(self.index_file) and os.path.exists(self.output_file):
+            with open(self.index_file, "rb") as f:
+                for raw in f:
+                    if not raw.endswith(b"\n"):
+                        break  # torn write at the end of the index
+                    parts = raw.decode("utf-8", errors="replace").rstrip("\n").split("\t")
+                    if len(parts) != 3:
+                        break
+                    try:
+                        end_offset = int(parts[2])
+                    except ValueError:
+                        break
+                    self._set_status(parts[0], parts[1])
+                    indexed_offset = end_offset
+                    index_size += len(raw)
+            if not self._ends_line(indexed_offset):
+                # output was truncated or replaced - don't trust the index
+                self.status, indexed_offset = {}, 0
+        
+        # scan output that was written after the last indexed line (all of it without an index)
+        recovered = []
+        if os.path.exists(self.output_file):
+            with open(self.output_file, "rb") as f:
+                f.seek(indexed_offset)
+                offset = indexed_offset
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # partial line from an interrupted write
+                    try:
+                        result = json.loads(line)
+                    except json.JSONDecodeError:
+                        break
+                    offset += len(line)
+                    recovered.append((result.get("recordId"), self.result_status(result), offset))
+            os.truncate(self.output_file, offset)
+        
+        # rewrite the index so it matches the (possibly truncated) output exactly
+        if indexed_offset:
+            os.truncate(self.index_file, index_size)
+        with open(self.index_file, "w" if indexed_offset == 0 else "a") as f:
+            for record_id, status, end_offset in recovered:
+                self._set_status(record_id, status)
+                f.write(f"{record_id}\t{status}\t{end_offset}\n")
+        return self.status
+    
+    def _ends_line(self, offset: int) -> bool:
+        """Whether offset is 0 or falls just after a newline of the output file"""
+        if offset == 0:
+            return True
+        if offset > os.path.getsize(self.output_file):
+            return False
+        with open(self.output_file, "rb") as f:
+            f.seek(offset - 1)
+            return f.read(1) == b"\n"
+    
+    def _set_status(self, record_id: str, status: str) -> None:
+        if record_id in self.status:
+            self.has_duplicates = True
+        self.status[record_id] = status
+    
+    @staticmethod
+    def result_status(result: Dict[str, Any]) -> str:
+        return "ok" if "modelOutput" in result else "failed"
+    
+    def open(self, resume: bool) -> None:
+        """Open the output and index files, appending to them when resuming and truncating them otherwise"""
+        mode = "a" if resume else "w"
+        self._output = open(self.output_file, mode + "b")
+        self._index = open(self.index_file, mode)
+        self._offset = self._output.tell()
+        if not resume:
+            self.status = {}
+    
+    def write(self, result: Dict[str, Any]) -> None:
+        line = (json.dumps(result) + "\n").encode("utf-8")
+        self._output.write(line)
+        self._offset += len(line)
+        status = self.result_status(result)
+        self._set_status(result["recordId"], status)
+        self._index.write(f"{result['recordId']}\t{status}\t{self._offset}\n")
+        
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_every or time.monotonic() - self._last_sync >= self.fsync_interval:
+            self.sync()
+    
+    def sync(self) -> None:
+        """Flush both files to disk, output before index"""
+        for f in (self._output, self._index):
+            f.flush()
+            os.fsync(f.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+    
+    def close(self) -> None:
+        if self._output is not None:
+            self.sync()
+            self._output.close()
+            self._index.close()
+            self._output = self._index = None
+    
+    def compact(self) -> None:
+        """
+        Keep only the latest result per recordId, e.g. after previously failed records were retried,
+        so the output has one line per record like a real batch inference output
+        """
+        latest: Dict[str, int] = {}
+        with open(self.output_file, "rb") as f:
+            for line_number, line in enumerate(f):
+                latest[json.loads(line).get("recordId")] = line_number
+        keep = set(latest.values())
+        
+        tmp_output, tmp_index = f"{self.output_file}.tmp", f"{self.index_file}.tmp"
+        offset = 0
+        with open(self.output_file, "rb") as src, open(tmp_output, "wb") as out, open(tmp_index, "w") as index:
+            for line_number, line in enumerate(src):
+                if line_number in keep:
+                    result = json.loads(line)
+                    out.write(line)
+                    offset += len(line)
+                    index.write(f"{result.get('recordId')}\t{self.result_status(result)}\t{offset}\n")
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp_output, self.output_file)
+        os.replace(tmp_index, self.index_file)
+        self.has_duplicates = False
+
+
 class BatchInferenceSimulator:
     """
     Simulates batch inference for Amazon Bedrock models
@@ -80,7 +327,11 @@ class BatchInferenceSimulator:
         backoff_factor: float = 2.0,
         jitter: float = 0.1,
         logger: Optional[logging.Logger] = None,
-        error_logger: Optional[logging.Logger] = None
+        error_logger: Optional[logging.Logger] = None,
+        concurrency: int = 1,
+        rate_limiter: Optional[AdaptiveRateLimiter] = None,
+        resume: bool = False,
+        fsync_every: int = 100
     ):
         """
         Initialize the batch inference simulator
@@ -96,6 +347,10 @@ class BatchInferenceSimulator:
             jitter: Random jitter factor to add to backoff
             logger: Logger for general logs
             error_logger: Logger for error logs
+            concurrency: Number of requests in flight at once (1 = sequential)
+            rate_limiter: Rate limiter shared by all requests (defaults to an AdaptiveRateLimiter)
+            resume: Append to an existing output file, skipping records that already succeeded
+            fsync_every: Number of records written between flushes of the output to disk
         """
         self.input_file = input_file
         self.output_file = output_file
@@ -105,6 +360,10 @@ class BatchInferenceSimulator:
         self.initial_backoff = initial_backoff
         self.backoff_factor = backoff_factor
         self.jitter = jitter
+        self.concurrency = max(1, concurrency)
+        self.rate_limiter = rate_limiter or AdaptiveRateLimiter()
+        self.resume = resume
+        self.checkpoint = OutputCheckpoint(output_file, fsync_every=fsync_every)
         
         # Set up loggers if not provided
         if logger is None or error_logger is None:
@@ -114,9 +373,14 @@ class BatchInferenceSimulator:
             self.error_logger = error_logger
         
         # Initialize Bedrock client
+        # (the client is shared by all worker threads; retries are handled here, not by botocore)
         self.bedrock_client = boto3.client(
             service_name="bedrock-runtime",
-            region_name=self.region
+            region_name=self.region,
+            config=Config(
+                max_pool_connections=max(10, self.concurrency),
+                retries={"max_attempts": 1, "mode": "standard"}
+            )
         )
         
         # Statistics
@@ -125,6 +389,7 @@ class BatchInferenceSimulator:
             "successful_records": 0,
             "failed_records": 0,
             "retried_records": 0,
+            "skipped_records": 0,
             "total_tokens": {
                 "input": 0,
                 "output": 0
@@ -132,25 +397,31 @@ class BatchInferenceSimulator:
             "start_time": None,
             "end_time": None
         }
+        self._stats_lock = threading.Lock()
     
-    def read_jsonl(self) -> List[Dict[str, Any]]:
+    def _increment(self, key: str, value: int = 1) -> None:
+        """Thread-safe update of a counter in self.stats"""
+        with self._stats_lock:
+            self.stats[key] += value
+    
+    def _add_tokens(self, input_tokens: int, output_tokens: int) -> None:
+        with self._stats_lock:
+            self.stats["total_tokens"]["input"] += input_tokens
+            self.stats["total_tokens"]["output"] += output_tokens
+    
+    def iter_records(self) -> Iterator[Dict[str, Any]]:
         """
-        Read records from JSONL file
+        Stream records from the JSONL file one line at a time
         
-        Returns:
-            List of records as dictionaries
+        Yields:
+            Records as dictionaries
         """
-        records = []
         try:
             with open(self.input_file, 'r') as f:
                 for line in f:
                     if line.strip():  # Skip empty lines
-                        record = json.loads(line)
-                        records.append(record)
-            
-            self.logger.info(f"Read {len(records)} records from {self.input_file}")
-            self.stats["total_records"] = len(records)
-            return records
+                        self._increment("total_records")
+                        yield json.loads(line)
         
         except FileNotFoundError:
             self.logger.error(f"Input file not found: {self.input_file}")
@@ -158,6 +429,18 @@ class BatchInferenceSimulator:
         except json.JSONDecodeError as e:
             self.logger.error(f"Error parsing JSON: {str(e)}")
             raise
+    
+    def read_jsonl(self) -> List[Dict[str, Any]]:
+        """
+        Read records from JSONL file
+        
+        Returns:
+            List of records as dictionaries
+        """
+        self.stats["total_records"] = 0
+        records = list(self.iter_records())
+        self.logger.info(f"Read {len(records)} records from {self.input_file}")
+        return records
 
     def format_model_input(self, model_input: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -246,10 +529,28 @@ class BatchInferenceSimulator:
         
         return formatted_input
     
+    def _sleep_before_retry(self, record_id: str, retry_count: int, backoff_time: float, error: Exception) -> None:
+        """Sleep for backoff_time with random jitter before retrying a request"""
+        # Generate cryptographically secure random number between -jitter and jitter
+        rand_int = secrets.randbelow(2**32)  # Using 32 bits for sufficient precision
+        normalized = (rand_int / (2**32 - 1)) * 2 - 1  # Convert to [-1, 1]
+        jitter_amount = normalized * self.jitter * backoff_time
+        sleep_time = backoff_time + jitter_amount
+        
+        self.logger.warning(
+            f"Error invoking model for record {record_id}. "
+            f"Retry {retry_count}/{self.max_retries} in {sleep_time:.2f}s: {str(error)}"
+        )
+        
+        time.sleep(sleep_time)
+    
     def invoke_model(self, model_input: Dict[str, Any], record_id: str) -> Dict[str, Any]:
         """
         Invoke Bedrock model with retry logic
         
+        Safe to call from several threads: requests are paced by the shared rate limiter,
+        which slows down when the model throttles and speeds back up as calls succeed.
+        
         Args:
             model_input: Model input parameters
             record_id: Record ID for logging
@@ -261,31 +562,32 @@ class BatchInferenceSimulator:
         backoff_time = self.initial_backoff
         
         # Format the input for nova lite
-        self.logger.debug("model input", model_input)
+        self.logger.debug(f"model input {model_input}")
         formatted_input = self.format_model_input(model_input)
-        # print("formatted_input", formatted_input)
+        body = json.dumps(formatted_input)
         
         while True:
             try:
+                self.rate_limiter.acquire()
                 self.logger.debug(f"Invoking model for record {record_id}")
                 
                 # Invoke the model
                 response = self.bedrock_client.invoke_model(
                     modelId=self.model_id,
-                    body=json.dumps(formatted_input)
+                    body=body
                 )
                 
                 
                 # Parse the response
                 response_body = json.loads(response.get('body').read().decode('utf-8'))
+                self.rate_limiter.on_success()
                 
                 # Extract metrics
                 input_tokens = response.get('inputTokenCount', 0)
                 output_tokens = response.get('outputTokenCount', 0)
                 
                 # Update token statistics
-                self.stats["total_tokens"]["input"] += input_tokens
-                self.stats["total_tokens"]["output"] += output_tokens
+                self._add_tokens(input_tokens, output_tokens)
                 
                 # Format response in batch inference format matching the desired structure
                 formatted_response = {
@@ -294,7 +596,7 @@ class BatchInferenceSimulator:
                     "recordId": record_id
                 }
                 
-                self.stats["successful_records"] += 1
+                self._increment("successful_records")
                 return formatted_response
                 
             except ClientError as e:
@@ -311,12 +613,15 @@ class BatchInferenceSimulator:
                         "errorCode": error_code
                     }
                     
-                    self.stats["failed_records"] += 1
+                    self._increment("failed_records")
                     return error_response
                 
+                if error_code in THROTTLING_ERROR_CODES:
+                    self.rate_limiter.on_throttle()
+                
                 # For other errors, continue with retry logic
                 retry_count += 1
-                self.stats["retried_records"] += 1
+                self._increment("retried_records")
                 
                 if retry_count > self.max_retries:
                     self.logger.error(f"Max retries exceeded for record {record_id}")
@@ -332,12 +637,15 @@ class BatchInferenceSimulator:
                         "errorCode": error_code
                     }
                     
-                    self.stats["failed_records"] += 1
+                    self._increment("failed_records")
                     return error_response
+                
+                self._sleep_before_retry(record_id, retry_count, backoff_time, e)
+                backoff_time *= self.backoff_factor
             except Exception as e:
                 # For general exceptions, continue with retry logic
                 retry_count += 1
-                self.stats["retried_records"] += 1
+                self._increment("retried_records")
                 
                 if retry_count > self.max_retries:
                     self.logger.error(f"Max retries exceeded for record {record_id}")
@@ -353,49 +661,90 @@ class BatchInferenceSimulator:
                         "errorCode": "UnknownError"
                     }
                     
-                    self.stats["failed_records"] += 1
+                    self._increment("failed_records")
                     return error_response
                 
-                # Calculate backoff with jitter
-                # Generate cryptographically secure random number between -jitter and jitter
-                rand_int = secrets.randbelow(2**32)  # Using 32 bits for sufficient precision
-                normalized = (rand_int / (2**32 - 1)) * 2 - 1  # Convert to [-1, 1]
-                jitter_amount = normalized * self.jitter * backoff_time
-                sleep_time = backoff_time + jitter_amount
-                
-                self.logger.warning(
-                    f"Error invoking model for record {record_id}. "
-                    f"Retry {retry_count}/{self.max_retries} in {sleep_time:.2f}s: {str(e)}"
-                )
-                
-                time.sleep(sleep_time)
+                self._sleep_before_retry(record_id, retry_count, backoff_time, e)
                 backoff_time *= self.backoff_factor
     
-    def process_records(self, records: List[Dict[str, Any]]) -> None:
+    def process_record(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Invoke the model for a single input record
+        
+        Args:
+            record: Input record with recordId and modelInput
+            
+        Returns:
+            Output record in batch inference format
+        """
+        # Extract record ID and model input
+        record_id = record.get("recordId") or stable_record_id(record)
+        model_input = record.get("modelInput", {})
+        
+        return self.invoke_model(model_input, record_id)
+    
+    def process_records(self, records: Iterable[Dict[str, Any]]) -> None:
         """
         Process all records and write results to output file
         
+        With concurrency > 1, records are submitted to a thread pool while reading, keeping at
+        most 2 x concurrency records in flight. Results are written in input order.
+        
         Args:
-            records: List of records to process
+            records: Records to process (a list or a stream, e.g. from iter_records)
         """
         self.stats["start_time"] = datetime.now()
-        self.logger.info(f"Starting batch inference with {len(records)} records")
+        self.logger.info(f"Starting batch inference with concurrency {self.concurrency}")
         
         # Create output directory if it doesn't exist
-        os.makedirs(os.path.dirname(self.output_file), exist_ok=True)
+        os.makedirs(os.path.dirname(self.output_file) or ".", exist_ok=True)
         
-        with open(self.output_file, 'w') as f:
-            for record in tqdm(records, desc="Processing records"):
-                # Extract record ID and model input
-                record_id = record.get("recordId", f"record_{hash(json.dumps(record))}")
-                model_input = record.get("modelInput", {})
-                
-                
-                # Invoke model
-                result = self.invoke_model(model_input, record_id)
-                
-                # Write result to output file
-                f.write(json.dumps(result) + '\n')
+        completed = set()
+        previously_failed = set()
+        if self.resume:
+            status = self.checkpoint.load()
+            completed = {record_id for record_id, s in status.items() if s == "ok"}
+            previously_failed = {record_id for record_id, s in status.items() if s == "failed"}
+            self.logger.info(
+                f"Resuming: {len(completed)} records already completed, {len(previously_failed)} failed records will be retried"
+            )
+        
+        def pending_records() -> Iterator[Dict[str, Any]]:
+            for record in records:
+                if (record.get("recordId") or stable_record_id(record)) in completed:
+                    self._increment("skipped_records")
+                    continue
+                yield record
+        
+        total = len(records) if isinstance(records, list) else None
+        self.checkpoint.open(resume=self.resume)
+        try:
+            with tqdm(total=total, desc="Processing records") as progress:
+                if self.concurrency == 1:
+                    for record in pending_records():
+                        # Write result to output file
+                        self.checkpoint.write(self.process_record(record))
+                        progress.update()
+                else:
+                    max_in_flight = 2 * self.concurrency
+                    in_flight = deque()
+                    with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                        for record in pending_records():
+                            in_flight.append(executor.submit(self.process_record, record))
+                            # bounded window - write the oldest result before reading further
+                            while len(in_flight) >= max_in_flight:
+                                self.checkpoint.write(in_flight.popleft().result())
+                                progress.update()
+                        while in_flight:
+                            self.checkpoint.write(in_flight.popleft().result())
+                            progress.update()
+        finally:
+            # whatever completed is on disk, even if the run is interrupted
+            self.checkpoint.close()
+        
+        if self.checkpoint.has_duplicates:
+            # retried records were appended after their earlier failures
+            self.checkpoint.compact()
         
         self.stats["end_time"] = datetime.now()
         self.logger.info(f"Batch inference completed. Results written to {self.output_file}")
@@ -413,9 +762,10 @@ class BatchInferenceSimulator:
         self.logger.info("BATCH INFERENCE SUMMARY")
         self.logger.info("=" * 50)
         self.logger.info(f"Total records processed: {self.stats['total_records']}")
-        self.logger.info(f"Successful records: {self.stats['successful_records']}")
+        self.logger.info(f"New successful records: {self.stats['successful_records']}")
         self.logger.info(f"Failed records: {self.stats['failed_records']}")
         self.logger.info(f"Records with retries: {self.stats['retried_records']}")
+        self.logger.info(f"Skipped records (completed in a previous run): {self.stats['skipped_records']}")
         self.logger.info(f"Total input tokens: {self.stats['total_tokens']['input']}")
         self.logger.info(f"Total output tokens: {self.stats['total_tokens']['output']}")
         self.logger.info(f"Total duration: {duration:.2f} seconds")
@@ -430,11 +780,8 @@ class BatchInferenceSimulator:
         Run the batch inference simulation
         """
         try:
-            # Read records
-            records = self.read_jsonl()
-            
-            # Process records
-            self.process_records(records)
+            # Stream records into the model calls
+            self.process_records(self.iter_records())
             
             # Print summary
             self.print_summary()
@@ -454,6 +801,15 @@ def parse_args():
                         help="Bedrock model ID (default: anthropic.claude-3-haiku-20240307-v1:0)")
     parser.add_argument("--region", "-r", default="us-east-1", help="AWS region (default: us-east-1)")
     parser.add_argument("--max-retries", type=int, default=5, help="Maximum retries for failed requests (default: 5)")
+    parser.add_argument("--concurrency", "-c", type=int, default=1,
+                        help="Number of concurrent model invocations (default: 1)")
+    parser.add_argument("--max-rps", type=float, default=50.0,
+                        help="Upper bound for the adaptive request rate, in requests per second (default: 50)")
+    parser.add_argument("--resume", action="store_true",
+                        help="Resume an interrupted run: keep the existing output and only process records "
+                             "that have not completed successfully yet")
+    parser.add_argument("--fsync-every", type=int, default=100,
+                        help="Number of records written between flushes of the output to disk (default: 100)")
     parser.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
                         help="Logging level (default: INFO)")
     
@@ -475,7 +831,11 @@ def main():
         region=args.region,
         max_retries=args.max_retries,
         logger=main_logger,
-        error_logger=error_logger
+        error_logger=error_logger,
+        concurrency=args.concurrency,
+        resume=args.resume,
+        fsync_every=args.fsync_every,
+        rate_limiter=AdaptiveRateLimiter(initial_rate=min(5.0, args.max_rps), max_rate=args.max_rps)
     )
     
     simulator.run()
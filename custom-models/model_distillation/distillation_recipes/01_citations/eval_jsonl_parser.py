@@ -2,62 +2,267 @@ import boto3
 import pandas as pd
 import json
 import re
-from typing import List, Dict, Any, Optional
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from botocore.config import Config
+from typing import List, Dict, Any, Optional, Iterable, Set
 # import numpy as np
 import time
 
-def parse_jsonl_to_df(file_path: str) -> pd.DataFrame:
+try:
+    # optional, for Aho-Corasick multi-pattern matching (pip install pyahocorasick)
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+DEFAULT_ANSWER_PATTERN = r'<answer_part>\n(.*?)\n<\/answer_part>'
+ANSWER_TEXT_PATTERN = re.compile(r'<text>\n(.*?)\n</text>', re.DOTALL)
+SOURCES_PATTERN = re.compile(r'<source>(.*?)</source>', re.DOTALL)
+
+COVERAGE_MAP = {
+    "none is present in context": 0,
+    "some is present in context": 1,
+    "approximately half is present in context": 2,
+    "most is present in context": 3,
+    "all is present in context": 4
+}
+
+# Bedrock Runtime client shared by all threads; adaptive retries slow down client-side on throttling
+_bedrock_runtime = None
+_bedrock_runtime_lock = threading.Lock()
+
+
+def get_bedrock_runtime():
+    global _bedrock_runtime
+    with _bedrock_runtime_lock:
+        if _bedrock_runtime is None:
+            _bedrock_runtime = boto3.client(
+                'bedrock-runtime',
+                config=Config(retries={"max_attempts": 10, "mode": "adaptive"}, max_pool_connections=50)
+            )
+    return _bedrock_runtime
+
+
+@lru_cache(maxsize=32)
+def compile_answer_pattern(xml_pattern: str) -> re.Pattern:
+    return re.compile(xml_pattern, re.DOTALL)
+
+
+def find_contained(patterns: Iterable[str], passage_texts: List[str]) -> Set[str]:
+    """
+    Return the subset of patterns that occur in at least one of the passages.
+
+    Uses an Aho-Corasick automaton over the patterns when pyahocorasick is installed, so each
+    passage is scanned once for all citations. Otherwise each pattern is searched once in the
+    concatenated passages (separated by NUL so matches can't span two passages).
+    """
+    patterns = set(patterns)
+    found = set()
+    if '' in patterns:
+        patterns.discard('')
+        if passage_texts:
+            found.add('')
+    if not patterns or not passage_texts:
+        return found
+
+    if ahocorasick is not None:
+        automaton = ahocorasick.Automaton()
+        for pattern in patterns:
+            automaton.add_word(pattern, pattern)
+        automaton.make_automaton()
+        for passage_text in passage_texts:
+            for _, pattern in automaton.iter(passage_text):
+                found.add(pattern)
+            if len(found) == len(patterns) + ('' in found):
+                break
+        return found
+
+    haystack = '\x00'.join(passage_texts)
+    return found | {pattern for pattern in patterns if pattern in haystack}
+
+
+class CoverageScorer:
+    """
+    Thread-safe, rate-limited and memoized Claude calls for citation coverage scoring.
+
+    Responses are cached by a hash of (model id, related passages, candidate response), in memory
+    and optionally in a JSONL file so reruns of an evaluation don't call the model again.
+    """
+
+    def __init__(
+        self,
+        model_id: str = "us.anthropic.claude-3-5-haiku-20241022-v1:0",
+        max_requests_per_second: float = 10.0,
+        cache_file: Optional[str] = None
+    ):
+        self.model_id = model_id
+        self.min_interval = 1.0 / max_requests_per_second
+        self.cache_file = cache_file
+        self._cache: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._next_slot = time.monotonic()
+        self._in_progress: Dict[str, threading.Event] = {}
+        if cache_file and os.path.exists(cache_file):
+            with open(cache_file, 'r') as f:
+                for line in f:
+                    entry = json.loads(line)
+                    self._cache[entry['key']] = entry['response']
+
+    def cache_key(self, related_passages: str, candidate_response: str) -> str:
+        return hashlib.sha256(
+            '\x00'.join([self.model_id, related_passages, candidate_response]).encode('utf-8')
+        ).hexdigest()
+
+    def _wait_for_slot(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next_slot, now)
+            self._next_slot = slot + self.min_interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    def evaluate(self, related_passages: str, candidate_response: str) -> str:
+        """Claude's coverage evaluation text for a candidate response, from the cache when possible"""
+        key = self.cache_key(related_passages, candidate_response)
+        while True:
+            with self._lock:
+                if key in self._cache:
+                    return self._cache[key]
+                # another thread is already asking the same question - wait for its answer
+                event = self._in_progress.get(key)
+                if event is None:
+                    event = self._in_progress[key] = threading.Event()
+                    break
+            event.wait()
+
+        try:
+            self._wait_for_slot()
+            response = send_prompt_to_claude(
+                model_id=self.model_id,
+                prompt=build_coverage_prompt(related_passages, candidate_response),
+                max_tokens=500,
+                temperature=0.1
+            )
+            with self._lock:
+                self._cache[key] = response
+                if self.cache_file:
+                    with open(self.cache_file, 'a') as f:
+                        f.write(json.dumps({'key': key, 'response': response}) + '\n')
+            return response
+        finally:
+            with self._lock:
+                self._in_progress.pop(key, None)
+            event.set()
+
+
+_default_scorers: Dict[str, CoverageScorer] = {}
+_default_scorers_lock = threading.Lock()
+
+
+def get_default_scorer(model_id: str) -> CoverageScorer:
+    with _default_scorers_lock:
+        if model_id not in _default_scorers:
+            _default_scorers[model_id] = CoverageScorer(model_id=model_id)
+        return _default_scorers[model_id]
+
+
+def build_coverage_prompt(related_passages: str, candidate_response: str) -> str:
+    return f"""
+                For a given task, you are provided with a set of related passages, and a candidate answer.
+
+                Does the candidate answer contain information that is not included in the passages, or that cannot be easily inferred from them via common sense knowledge?
+
+                Related Passages:{related_passages}
+
+                Candidate Response: {candidate_response}
+
+                Evaluate how much of the information in the answer is contained in the available context passages (or can be inferred from them via common sense knowledge). Ignore any other mistakes, such as missing information, untruthful answers, grammar issues etc; only evaluate whether the information in the candidate answer is in the related passages.
+
+
+                Firstly explain your response, followed by your final answer. You should follow the format 
+                Explanation: [Explanation], Answer: [Answer], 
+                where '[Answer]' can be one of the following:
+                ```
+                none is present in context
+                some is present in context
+                approximately half is present in context
+                most is present in the context
+                all is present in the context
+                ```
+                """
+
+def iter_turns(file_path: str) -> Iterable[Dict[str, Any]]:
+    """Yield the conversation turns of an evaluation JSONL file, one line at a time"""
+    with open(file_path, 'r') as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                yield from record.get('conversationTurns', [])
+
+
+def parse_jsonl_to_df(
+    file_path: str,
+    model_id: str = "us.anthropic.claude-3-5-haiku-20241022-v1:0",
+    max_workers: int = 8,
+    max_requests_per_second: float = 10.0,
+    cache_file: Optional[str] = None
+) -> pd.DataFrame:
     """
     Parse a JSONL file containing conversation data into a pandas DataFrame.
     
+    Turns are validated concurrently by max_workers threads sharing one rate-limited,
+    memoized coverage scorer; rows keep the order of the file.
+    
     Args:
         file_path (str): Path to the JSONL file
+        model_id (str): The Claude model ID to use for citation coverage evaluation
+        max_workers (int): Number of turns validated concurrently
+        max_requests_per_second (float): Upper bound on Claude calls per second
+        cache_file (Optional[str]): JSONL file to persist coverage evaluations across runs
         
     Returns:
         pd.DataFrame: DataFrame containing the parsed data with appropriate data types
     """
-    # Read the JSONL file line by line
+    scorer = CoverageScorer(model_id=model_id, max_requests_per_second=max_requests_per_second, cache_file=cache_file)
+    turns = list(iter_turns(file_path))
+    
     records = []
-    with open(file_path, 'r') as f:
-        line_no = 1
-        for line in f:
-            record = json.loads(line.strip())
-            # Process each conversation turn
-            for turn in record.get('conversationTurns', []):
-                # Validate citations for this turn
-                validation_results = validate_citation_coverage(turn, model_id="us.anthropic.claude-3-5-haiku-20241022-v1:0")
-                
-                # Extract relevant fields
-                processed_record = {
-                    'prompt': turn.get('inputRecord', {}).get('prompt', {}).get('content', [{}])[0].get('text', ''),
-                    'reference_response': turn.get('inputRecord', {}).get('referenceResponses', [{}])[0].get('content', [{}])[0].get('text', ''),
-                    'model_identifier': turn.get('output', {}).get('modelIdentifier', ''),
-                    'kb_identifier': turn.get('output', {}).get('knowledgeBaseIdentifier', ''),
-                    'model_output': turn.get('output', {}).get('text', ''),
-                }
-                
-                # Extract metrics
-                metrics = {}
-                for result in turn.get('results', []):
-                    metric_name = result.get('metricName', '').replace('Builtin.', '')
-                    metric_value = result.get('result')
-                    metrics[f'metric_{metric_name.lower()}'] = metric_value
-                
-                processed_record.update(metrics)
-                
-                # Add citation validation results
-                citation_fields = {
-                    'citation_validation_rate': validation_results.get('validation_rate', 0.0),
-                    'total_citations': validation_results.get('total_citations', 0),
-                    'valid_citations': validation_results.get('valid_citations', 0),
-                    'all_citations_valid': validation_results.get('all_citations_valid', False),
-                    'citation_coverage': validation_results.get('citation_coverage', 0)
-                }
-                processed_record.update(citation_fields)
-                
-                records.append(processed_record)
-                print(f"Processed line {str(line_no)}")
-                line_no+=1
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        all_validation_results = executor.map(lambda turn: validate_citation_coverage(turn, scorer=scorer), turns)
+        for line_no, (turn, validation_results) in enumerate(zip(turns, all_validation_results), start=1):
+            # Extract relevant fields
+            processed_record = {
+                'prompt': turn.get('inputRecord', {}).get('prompt', {}).get('content', [{}])[0].get('text', ''),
+                'reference_response': turn.get('inputRecord', {}).get('referenceResponses', [{}])[0].get('content', [{}])[0].get('text', ''),
+                'model_identifier': turn.get('output', {}).get('modelIdentifier', ''),
+                'kb_identifier': turn.get('output', {}).get('knowledgeBaseIdentifier', ''),
+                'model_output': turn.get('output', {}).get('text', ''),
+            }
+            
+            # Extract metrics
+            metrics = {}
+            for result in turn.get('results', []):
+                metric_name = result.get('metricName', '').replace('Builtin.', '')
+                metric_value = result.get('result')
+                metrics[f'metric_{metric_name.lower()}'] = metric_value
+            
+            processed_record.update(metrics)
+            
+            # Add citation validation results
+            citation_fields = {
+                'citation_validation_rate': validation_results.get('validation_rate', 0.0),
+                'total_citations': validation_results.get('total_citations', 0),
+                'valid_citations': validation_results.get('valid_citations', 0),
+                'all_citations_valid': validation_results.get('all_citations_valid', False),
+                'citation_coverage': validation_results.get('citation_coverage', 0)
+            }
+            processed_record.update(citation_fields)
+            
+            records.append(processed_record)
+            print(f"Processed line {str(line_no)}")
     
     # Create DataFrame
     df = pd.DataFrame(records)
@@ -125,7 +330,8 @@ def aggregate_metrics_by_model(df: pd.DataFrame) -> pd.DataFrame:
 def validate_citation_coverage(
     turn: Dict[str, Any],
     xml_pattern: Optional[str] = None,
-    model_id: Optional[str] = "us.anthropic.claude-3-5-haiku-20241022-v1:0"
+    model_id: Optional[str] = "us.anthropic.claude-3-5-haiku-20241022-v1:0",
+    scorer: Optional[CoverageScorer] = None
 ) -> Dict[str, Any]:
     """
     Parse model output XML from a conversation turn to extract citations
@@ -136,6 +342,7 @@ def validate_citation_coverage(
         turn (Dict[str, Any]): The conversation turn containing model output and retrieved passages
         xml_pattern (Optional[str]): Regex pattern to extract citation text from XML, defaults to answer_part tags
         model_id (Optional[str]): The Claude model ID to use for citation coverage evaluation
+        scorer (Optional[CoverageScorer]): Rate-limited, memoized Claude client to use, defaults to a shared one per model_id
         
     Returns:
         Dict[str, Any]: Dictionary containing validation results including:
@@ -145,16 +352,15 @@ def validate_citation_coverage(
                        - all_citations_valid: Boolean indicating if all citations are valid
                        - citation_coverage: Numeric score (0-4) indicating citation coverage
     """
+    if scorer is None:
+        scorer = get_default_scorer(model_id)
+
     # Extract model output and retrieved passages from the turn
     model_output = turn.get('output', {}).get('text', '')
     retrieved_passages = turn.get('output', {}).get('retrievedPassages', {})
     
-    # Compile the regex pattern
-    if not xml_pattern:
-        xml_pattern = r'<answer_part>\n(.*?)\n<\/answer_part>'
-    answers_pattern = re.compile(xml_pattern, re.DOTALL)
-    
     # Extract all matches from the model output
+    answers_pattern = compile_answer_pattern(xml_pattern or DEFAULT_ANSWER_PATTERN)
     answers = answers_pattern.findall(model_output)
     
     # Extract text from retrieved passages
@@ -172,21 +378,19 @@ def validate_citation_coverage(
         'model_output': model_output
     }
     
-    for answer in answers:
-        citation_found = False
-        
+    parsed_answers = [
+        (answer, ANSWER_TEXT_PATTERN.findall(answer), SOURCES_PATTERN.findall(answer))
+        for answer in answers
+    ]
+    # Check all cited texts of the turn against the retrieved passages in one pass
+    contained = find_contained(
+        (cited_text for _, citation_texts, _ in parsed_answers for cited_text in citation_texts),
+        passage_texts
+    )
+    
+    for answer, citation_texts, sources_texts in parsed_answers:
         # Check if the citation text exists in any of the retrieved passages
-        answer_text_pattern = re.compile(r'<text>\n(.*?)\n</text>', re.DOTALL)
-        sources_pattern = re.compile(r'<source>(.*?)</source>', re.DOTALL)
-
-        citation_texts = answer_text_pattern.findall(answer)
-        sources_texts = sources_pattern.findall(answer)
-
-        for passage_text in passage_texts:
-            for cited_text in citation_texts:
-                if cited_text in passage_text:
-                    citation_found = True
-                    break
+        citation_found = any(cited_text in contained for cited_text in citation_texts)
         
         # Add result to the validation results
         validation_results['citations'].append({
@@ -200,57 +404,20 @@ def validate_citation_coverage(
         else:
             validation_results['all_citations_valid'] = False
 
-        coverage_map = {
-            "none is present in context": 0,
-            "some is present in context": 1,
-            "approximately half is present in context": 2,
-            "most is present in context": 3,
-            "all is present in context": 4
-        }
         related_passages = "\n".join(sources_texts)
         candidate_response = "\n".join(citation_texts)
         if 'I could not find an exact answer to the question' in candidate_response and len(sources_texts) < 1:
             print("justified non answer, marking 'all is present in context'")
-            validation_results['citation_coverage'] = coverage_map["all is present in context"] # this means the answer is justified - no llm call needed
+            validation_results['citation_coverage'] = COVERAGE_MAP["all is present in context"] # this means the answer is justified - no llm call needed
         else:
-            # print(f"sending prompt with the following:\nrelated passages: {related_passages}\ncandidate response: {candidate_response}\n\n")
-            # Call send_prompt_to_claude with the validation results
-            prompt = f"""
-                For a given task, you are provided with a set of related passages, and a candidate answer.
-
-                Does the candidate answer contain information that is not included in the passages, or that cannot be easily inferred from them via common sense knowledge?
-
-                Related Passages:{related_passages}
-
-                Candidate Response: {candidate_response}
-
-                Evaluate how much of the information in the answer is contained in the available context passages (or can be inferred from them via common sense knowledge). Ignore any other mistakes, such as missing information, untruthful answers, grammar issues etc; only evaluate whether the information in the candidate answer is in the related passages.
-
-
-                Firstly explain your response, followed by your final answer. You should follow the format 
-                Explanation: [Explanation], Answer: [Answer], 
-                where '[Answer]' can be one of the following:
-                ```
-                none is present in context
-                some is present in context
-                approximately half is present in context
-                most is present in the context
-                all is present in the context
-                ```
-                """
-            eval_answer = send_prompt_to_claude(
-                model_id=model_id,
-                prompt=prompt,
-                max_tokens=500,
-                temperature=0.1
-            )
+            eval_answer = scorer.evaluate(related_passages, candidate_response)
         
             try:
                 cleansed_answer = eval_answer.split('Answer:')[1].lower().strip()
-                for ans in coverage_map.keys():
+                for ans in COVERAGE_MAP.keys():
                     if ans in cleansed_answer:
                         print(f"found citation coverage: {ans}")
-                        validation_results['citation_coverage'] = coverage_map[ans]
+                        validation_results['citation_coverage'] = COVERAGE_MAP[ans]
                         break
                 
             except:
@@ -294,11 +461,8 @@ def send_prompt_to_claude(
     Raises:
         Exception: If the API call fails
     """
-    # Initialize Bedrock Runtime client
-    bedrock_runtime = boto3.client('bedrock-runtime')
-
-    # Add a small delay to avoid rate limiting
-    time.sleep(.1)
+    # Shared Bedrock Runtime client (rate limiting is done by CoverageScorer and adaptive retries)
+    bedrock_runtime = get_bedrock_runtime()
     
     try:
         # Prepare the request payload for the Bedrock converse API
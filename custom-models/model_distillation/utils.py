@@ -1,8 +1,15 @@
 import os
 import json
+import base64
+import gzip
+import hashlib
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import boto3
 import pandas as pd
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from botocore.exceptions import ClientError
 
 def create_s3_bucket(bucket_name, region=None):
@@ -45,39 +52,206 @@ def create_s3_bucket(bucket_name, region=None):
         print(f"Unexpected error: {str(e)}")
         return False
 
-def upload_training_data_to_s3(bucket_name, local_file_path, prefix="training-data", account_id=None):
+# Multipart upload settings: parts are uploaded in parallel, with at most max_concurrency parts in memory
+DEFAULT_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=64 * 1024 * 1024,
+    multipart_chunksize=32 * 1024 * 1024,
+    max_concurrency=8,
+)
+# S3 multipart uploads have at most 10,000 parts
+MAX_PARTS = 10000
+
+def _part_ranges(file_size, part_size):
+    """(part number, offset, length) of the parts of a file, with parts large enough to stay under MAX_PARTS"""
+    part_size = max(part_size, -(-file_size // MAX_PARTS))
+    return [(number, offset, min(part_size, file_size - offset))
+            for number, offset in enumerate(range(0, file_size, part_size), start=1)]
+
+def _read_part(file_path, offset, length):
+    with open(file_path, 'rb') as file:
+        file.seek(offset)
+        return file.read(length)
+
+def _find_multipart_upload(s3, bucket_name, s3_key):
+    """The id of the most recent unfinished multipart upload of the key, if any"""
+    uploads = []
+    paginator = s3.get_paginator('list_multipart_uploads')
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=s3_key):
+        uploads.extend(upload for upload in page.get('Uploads', []) if upload['Key'] == s3_key)
+    if not uploads:
+        return None
+    return max(uploads, key=lambda upload: upload['Initiated'])['UploadId']
+
+def _uploaded_parts(s3, bucket_name, s3_key, upload_id):
+    """Part number -> (ETag, size) of the parts already uploaded"""
+    parts = {}
+    paginator = s3.get_paginator('list_parts')
+    for page in paginator.paginate(Bucket=bucket_name, Key=s3_key, UploadId=upload_id):
+        for part in page.get('Parts', []):
+            parts[part['PartNumber']] = (part['ETag'].strip('"'), part['Size'])
+    return parts
+
+def upload_file_multipart(s3, local_file_path, bucket_name, s3_key, transfer_config=None, resume=True):
+    """
+    Upload a file to S3 with a parallel multipart upload, verifying the MD5 checksum of every part.
+
+    Files below the multipart threshold are uploaded with a single PUT. With resume, an unfinished multipart upload
+    of the same key (e.g. from an interrupted run) is continued: parts already uploaded with the same checksum are
+    skipped. The upload is left unfinished on errors so it can be resumed; abort it with abort_multipart_upload
+    otherwise.
+
+    The ETag of the object is compared with the one expected from the local checksums (S3 computes it differently
+    for objects encrypted with KMS keys, which only prints a warning, the parts having been checked already).
+
+    Returns:
+        str: ETag of the uploaded object
+    """
+    config = transfer_config or DEFAULT_TRANSFER_CONFIG
+    file_size = os.path.getsize(local_file_path)
+
+    if file_size < config.multipart_threshold:
+        data = _read_part(local_file_path, 0, file_size)
+        digest = hashlib.md5(data)
+        response = s3.put_object(Bucket=bucket_name, Key=s3_key, Body=data,
+                                 ContentMD5=base64.b64encode(digest.digest()).decode())
+        return _check_etag(s3_key, response['ETag'], digest.hexdigest())
+
+    upload_id = _find_multipart_upload(s3, bucket_name, s3_key) if resume else None
+    uploaded = _uploaded_parts(s3, bucket_name, s3_key, upload_id) if upload_id else {}
+    if upload_id:
+        print(f"Resuming upload of {s3_key} ({len(uploaded)} parts already uploaded)...")
+    else:
+        upload_id = s3.create_multipart_upload(Bucket=bucket_name, Key=s3_key)['UploadId']
+
+    def upload_part(number, offset, length):
+        data = _read_part(local_file_path, offset, length)
+        digest = hashlib.md5(data)
+        if uploaded.get(number) == (digest.hexdigest(), length):
+            return number, digest.hexdigest(), digest.digest()
+        response = s3.upload_part(Bucket=bucket_name, Key=s3_key, UploadId=upload_id, PartNumber=number, Body=data,
+                                  ContentMD5=base64.b64encode(digest.digest()).decode())
+        return number, response['ETag'].strip('"'), digest.digest()
+
+    ranges = _part_ranges(file_size, config.multipart_chunksize)
+    with ThreadPoolExecutor(max_workers=config.max_concurrency) as executor:
+        parts = list(executor.map(lambda part: upload_part(*part), ranges))
+
+    response = s3.complete_multipart_upload(
+        Bucket=bucket_name, Key=s3_key, UploadId=upload_id,
+        MultipartUpload={'Parts': [{'PartNumber': number, 'ETag': etag} for number, etag, _ in parts]},
+    )
+    expected = hashlib.md5(b''.join(digest for _, _, digest in parts)).hexdigest() + f"-{len(parts)}"
+    return _check_etag(s3_key, response['ETag'], expected)
+
+def _check_etag(s3_key, etag, expected):
+    etag = etag.strip('"')
+    if etag != expected:
+        print(f"Warning: the ETag of {s3_key} ({etag}) does not match the local checksum ({expected}), "
+              f"expected only for objects encrypted with KMS keys")
+    return etag
+
+def shard_jsonl_file(local_file_path, output_dir, max_shard_bytes=None, max_shard_records=None, compress=False):
+    """
+    Split a JSONL file into part files of at most max_shard_bytes (uncompressed) and max_shard_records lines,
+    optionally gzip-compressed, named <name>-part-00001-of-00003.jsonl[.gz]. Compression is deterministic, so
+    re-running gives identical files and an interrupted upload can be resumed.
+
+    Returns:
+        list: paths of the part files
+    """
+    name = os.path.basename(local_file_path)
+    name = name[:-len('.jsonl')] if name.endswith('.jsonl') else name
+    extension = '.jsonl.gz' if compress else '.jsonl'
+    shards = []
+    output = None
+
+    def open_shard():
+        path = os.path.join(output_dir, f"{name}-part-{len(shards) + 1:05d}{extension}")
+        shards.append(path)
+        file = open(path, 'wb')
+        return gzip.GzipFile(filename='', mode='wb', fileobj=file, mtime=0) if compress else file, file
+
+    size = records = 0
+    with open(local_file_path, 'rb') as source:
+        for line in source:
+            if not line.strip():
+                continue
+            if not line.endswith(b'\n'):
+                line += b'\n'
+            if output and ((max_shard_bytes and size + len(line) > max_shard_bytes)
+                           or (max_shard_records and records >= max_shard_records)):
+                for stream in output:
+                    stream.close()
+                output, size, records = None, 0, 0
+            if output is None:
+                output = open_shard()
+            output[0].write(line)
+            size, records = size + len(line), records + 1
+    if output:
+        for stream in output:
+            stream.close()
+
+    # rename to include the number of parts
+    for index, path in enumerate(shards):
+        shards[index] = os.path.join(output_dir, f"{name}-part-{index + 1:05d}-of-{len(shards):05d}{extension}")
+        os.replace(path, shards[index])
+    return shards
+
+def upload_training_data_to_s3(bucket_name, local_file_path, prefix="training-data", account_id=None,
+                               compress=False, max_shard_bytes=None, max_shard_records=None,
+                               transfer_config=None, resume=True):
+    """
+    Upload a local JSONL file to s3://<bucket_name>/<prefix>/ with a parallel multipart upload (see
+    upload_file_multipart: per-part checksums, resume of interrupted uploads).
+
+    With compress, the file is uploaded gzip-compressed (.jsonl.gz). With max_shard_bytes and/or max_shard_records,
+    it is split into part files within those limits (e.g. the input size or record limits of a Bedrock job),
+    written to a temporary directory and uploaded one after the other.
+
+    Returns:
+        str: the S3 URI of the uploaded file, or a list of S3 URIs for part files; None on errors
+    """
     try:
         # Get AWS account ID if not provided
         if not account_id:
             sts = boto3.client('sts')
             account_id = sts.get_caller_identity()['Account']
         
-        # Get file name from path
-        file_name = os.path.basename(local_file_path)
-        
-        # Construct S3 key with prefix
-        # Remove leading/trailing slashes from prefix and combine with filename
+        # Remove leading/trailing slashes from prefix
         prefix = prefix.strip('/')
-        s3_key = f"{prefix}/{file_name}" if prefix else file_name
         
-        # Initialize S3 client
-        s3 = boto3.client('s3')
+        # Initialize S3 client with a connection per upload thread
+        config = transfer_config or DEFAULT_TRANSFER_CONFIG
+        s3 = boto3.client('s3', config=Config(max_pool_connections=config.max_concurrency,
+                                              retries={'max_attempts': 10, 'mode': 'adaptive'}))
         
-        print(f"Uploading {file_name} to bucket {bucket_name} with prefix {prefix}...")
-        
-        # Upload file
-        s3.upload_file(
-            local_file_path,
-            bucket_name,
-            s3_key
-        )
-        
-        print(f"Successfully uploaded {file_name} to S3 bucket!")
+        sharded = bool(max_shard_bytes or max_shard_records)
+        with tempfile.TemporaryDirectory() as staging_dir:
+            if sharded or compress:
+                files = shard_jsonl_file(local_file_path, staging_dir, max_shard_bytes, max_shard_records, compress)
+                if not sharded:
+                    # a single compressed file keeps the original name
+                    single = os.path.join(staging_dir, os.path.basename(local_file_path) + '.gz')
+                    os.replace(files[0], single)
+                    files = [single]
+            else:
+                files = [local_file_path]
+            
+            s3_uris = []
+            for file_path in files:
+                # Construct S3 key with prefix
+                file_name = os.path.basename(file_path)
+                s3_key = f"{prefix}/{file_name}" if prefix else file_name
+                
+                print(f"Uploading {file_name} to bucket {bucket_name} with prefix {prefix}...")
+                upload_file_multipart(s3, file_path, bucket_name, s3_key, transfer_config=config, resume=resume)
+                print(f"Successfully uploaded {file_name} to S3 bucket!")
+                s3_uris.append(f"s3://{bucket_name}/{s3_key}")
         
         # Return the S3 URI for the uploaded file
-        s3_uri = f"s3://{bucket_name}/{s3_key}"
-        print(f"File S3 URI: {s3_uri}")
-        return s3_uri
+        for s3_uri in s3_uris:
+            print(f"File S3 URI: {s3_uri}")
+        return s3_uris if sharded else s3_uris[0]
         
     except Exception as e:
         print(f"Error uploading file: {str(e)}")
@@ -320,4 +494,32 @@ def read_jsonl_to_dataframe(file_path):
     except ValueError as e:
         raise ValueError(f"Error reading JSONL file: {str(e)}")
     except Exception as e:
-        raise Exception(f"Unexpected error reading JSONL file: {str(e)}")
\ No newline at end of file
+        raise Exception(f"Unexpected error reading JSONL file: {str(e)}")
+
+def iter_jsonl_dataframes(file_path, chunksize=10000):
+    """
+    Read a JSONL file as pandas DataFrames of at most chunksize rows each, for files too large to load at once.
+    
+    Args:
+        file_path (str): Path to the JSONL file to read (.jsonl or .jsonl.gz)
+        chunksize (int): Number of rows per DataFrame
+        
+    Yields:
+        pandas.DataFrame: the next chunksize rows of the JSONL data
+        
+    Raises:
+        FileNotFoundError: If the specified file does not exist
+        ValueError: If the file is empty or not in valid JSONL format
+    """
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"The file {file_path} was not found")
+    empty = True
+    try:
+        with pd.read_json(file_path, lines=True, chunksize=chunksize) as reader:
+            for chunk in reader:
+                empty = False
+                yield chunk
+    except ValueError as e:
+        raise ValueError(f"Error reading JSONL file: {str(e)}")
+    if empty:
+        raise ValueError("The JSONL file is empty")
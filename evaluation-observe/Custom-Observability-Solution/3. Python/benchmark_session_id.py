@@ -0,0 +1,76 @@
+# Benchmark for session-id extraction in BedrockLogs.
+#
+# Usage:
+#   python benchmark_session_id.py                      # synthetic agent output
+#   python benchmark_session_id.py payload1.json ...    # recorded payloads
+#
+# A recorded payload is the 'output_log' (or 'input_log') of a local-mode run, e.g.
+#   results, log, run_id, observation_id = invoke_agent(...)
+#   json.dump(log['output_log'], open('payload1.json', 'w'), default=str)
+import sys
+import json
+import timeit
+
+from observability import BedrockLogs
+
+AGENT_SESSION_KEY = 'x-amz-bedrock-agent-session-id'
+
+
+def synthetic_agent_output(num_traces=200, session_id='benchmark-session'):
+    """Builds an output shaped like invoke_agent's (ResponseMetadata, answer, trace_data) tuple."""
+    response_metadata = {
+        'RequestId': 'request-id',
+        'HTTPStatusCode': 200,
+        'HTTPHeaders': {'content-type': 'application/json', AGENT_SESSION_KEY: session_id},
+        'RetryAttempts': 0,
+    }
+    trace_data = []
+    for i in range(num_traces):
+        trace_data.append({
+            'agentId': 'AGENT',
+            'sessionId': session_id,
+            'trace': {
+                'orchestrationTrace': {
+                    'modelInvocationInput': {'text': 'x' * 2000, 'traceId': f'trace-{i}', 'type': 'ORCHESTRATION'},
+                    'rationale': {'text': 'thinking ' * 50, 'traceId': f'trace-{i}'},
+                    'observation': {'knowledgeBaseLookupOutput': {'retrievedReferences': [
+                        {'content': {'text': 'passage ' * 100}, 'location': {'s3Location': {'uri': f's3://bucket/{j}'}}}
+                        for j in range(5)
+                    ]}},
+                }
+            },
+            'start_trace_time': float(i),
+        })
+    return [response_metadata, 'final answer', trace_data]
+
+
+def old_extract(log_data, key):
+    paths = BedrockLogs.find_keys(log_data, key)
+    return paths[0][1] if paths else None
+
+
+def new_extract(log_data, key):
+    return BedrockLogs.find_first_key(log_data, key, BedrockLogs.KNOWN_SESSION_ID_PATHS.get(key, ()))
+
+
+def run(name, payload, key, number=200):
+    old_time = timeit.timeit(lambda: old_extract(payload, key), number=number) / number
+    new_time = timeit.timeit(lambda: new_extract(payload, key), number=number) / number
+    print(f"{name}: find_keys {old_time * 1e6:10.1f} us | find_first_key {new_time * 1e6:8.1f} us | "
+          f"speedup {old_time / new_time:7.1f}x")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        for path in sys.argv[1:]:
+            with open(path) as f:
+                payload = json.load(f)
+            # watch() extracts from the first element of the agent output
+            if isinstance(payload, list) and payload:
+                run(f"{path} [agent]", payload[0], AGENT_SESSION_KEY)
+            run(f"{path} [sessionId]", payload, 'sessionId')
+    else:
+        for num_traces in (10, 100, 1000):
+            output = synthetic_agent_output(num_traces)
+            run(f"synthetic {num_traces:5d} traces [agent, output[0]]", output[0], AGENT_SESSION_KEY)
+            run(f"synthetic {num_traces:5d} traces [sessionId, full output]", output, 'sessionId')
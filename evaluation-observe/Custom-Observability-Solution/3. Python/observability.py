@@ -4,12 +4,31 @@ import json
 import time
 import boto3
 from uuid import uuid4
+from collections import deque
 from datetime import datetime, timezone
-from typing import Any, Callable, Dict, Optional
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
 
 class BedrockLogs:
     VALID_FEATURE_NAMES = ["None", "Agent", "KB", "InvokeModel"]
 
+    # Where the session id usually lives, checked before any generic search:
+    # - Agent: the ResponseMetadata returned by invoke_agent (or the full response)
+    # - others: top level of the request/response (retrieve_and_generate, converse, ...)
+    KNOWN_SESSION_ID_PATHS = {
+        'x-amz-bedrock-agent-session-id': [
+            ('HTTPHeaders', 'x-amz-bedrock-agent-session-id'),
+            ('ResponseMetadata', 'HTTPHeaders', 'x-amz-bedrock-agent-session-id'),
+            ('x-amz-bedrock-agent-session-id',),
+        ],
+        'sessionId': [
+            ('sessionId',),
+            ('sessionState', 'sessionId'),
+        ],
+    }
+    # Session ids are never buried deep, so the fallback search stops here:
+    MAX_SESSION_ID_SEARCH_DEPTH = 6
+    _NOT_FOUND = object()
+
     def __init__(self, delivery_stream_name: str = None, 
                  experiment_id: str = None, 
                  default_call_type: str = 'LLM', 
@@ -64,6 +83,55 @@ class BedrockLogs:
 
         return results
 
+    @staticmethod
+    def find_first_key(data, key, known_paths=(), max_depth=None):
+        """
+        Finds the first value stored under `key` without walking the whole structure.
+
+        The `known_paths` are checked first. If none of them match, the structure is
+        searched breadth-first (shallowest match wins) with an explicit queue, and the
+        search stops at `max_depth` levels instead of recursing through large traces.
+
+        Args:
+            data (Any): The dict/list/tuple to search.
+            key (str): The key to search for.
+            known_paths (list, optional): Key paths to try before searching.
+            max_depth (int, optional): Maximum nesting depth to search. Defaults to
+                MAX_SESSION_ID_SEARCH_DEPTH.
+
+        Returns:
+            Any: The value found, or BedrockLogs._NOT_FOUND.
+        """
+        if max_depth is None:
+            max_depth = BedrockLogs.MAX_SESSION_ID_SEARCH_DEPTH
+
+        for known_path in known_paths:
+            node = data
+            for step in known_path:
+                if not isinstance(node, dict) or step not in node:
+                    break
+                node = node[step]
+            else:
+                return node
+
+        queue = deque([(data, 0)])
+        while queue:
+            node, depth = queue.popleft()
+            if isinstance(node, dict):
+                if key in node:
+                    return node[key]
+                children = node.values()
+            elif isinstance(node, (list, tuple)):
+                children = node
+            else:
+                continue
+            if depth < max_depth:
+                for child in children:
+                    if isinstance(child, (dict, list, tuple)):
+                        queue.append((child, depth + 1))
+
+        return BedrockLogs._NOT_FOUND
+
     def extract_session_id(self, log_data: Dict[str, Any]) -> str:
         """
         Extracts the session ID from the log data. If the session ID is not available,
@@ -76,15 +144,79 @@ class BedrockLogs:
             str: The session ID or a newly generated UUID if the session ID is not available.
         """
         if self.feature_name == "Agent":
-            session_id_paths = self.find_keys(log_data, 'x-amz-bedrock-agent-session-id')
+            key = 'x-amz-bedrock-agent-session-id'
         else:
-            session_id_paths = self.find_keys(log_data, 'sessionId')
+            key = 'sessionId'
 
-        if session_id_paths:
-            path, session_id = session_id_paths[0]
-            return session_id
-        else:
+        session_id = self.find_first_key(log_data, key, self.KNOWN_SESSION_ID_PATHS.get(key, ()))
+        if session_id is self._NOT_FOUND:
             return str(uuid4())
+        return session_id
+
+    def _stamp_trace(self, trace, prev_trace_time, request_start_time):
+        """
+        Adds 'latency' and 'step_number' to a trace that carries 'start_trace_time'.
+
+        Returns:
+            float: The trace's start time, to be used as the next prev_trace_time.
+        """
+        # Check if 'start_trace_time' is defined correctly
+        if not isinstance(trace['start_trace_time'], float):
+            raise ValueError("The key 'start_trace_time' should be present and should be a time.time() object.")
+
+        # Calculate the latency between traces
+        if prev_trace_time is None:
+            trace['latency'] = trace['start_trace_time'] - request_start_time
+        else:
+            trace['latency'] = trace['start_trace_time'] - prev_trace_time
+
+        trace['step_number'] = self.step_counter
+        self.step_counter += 1
+        return trace['start_trace_time']
+
+    def iter_agent_events(self, events: Iterable[Dict[str, Any]], request_start_time: float) -> Iterator[Dict[str, Any]]:
+        """
+        Streaming pass-through for agent completions. Trace events are stamped with
+        'start_trace_time', 'latency' and 'step_number' as they arrive and yielded
+        immediately, so the event stream is never materialized.
+
+        Args:
+            events (Iterable): The agent event stream, e.g. invoke_agent()['completion'].
+            request_start_time (float): The start time of the request.
+
+        Yields:
+            dict: Each event, unchanged apart from the trace annotations.
+        """
+        prev_trace_time = None
+        for event in events:
+            if isinstance(event, dict) and isinstance(event.get('trace'), dict):
+                trace = event['trace']
+                trace.setdefault('start_trace_time', time.time())
+                prev_trace_time = self._stamp_trace(trace, prev_trace_time, request_start_time)
+            yield event
+
+    @staticmethod
+    def _is_event_stream(obj) -> bool:
+        return hasattr(obj, '__iter__') and not isinstance(obj, (dict, list, tuple, str, bytes))
+
+    def stream_agent_feature(self, output_data, request_start_time):
+        """
+        Streaming counterpart of handle_agent_feature: wraps the event stream(s) in the
+        output with iter_agent_events instead of iterating over them.
+
+        Args:
+            output_data (Any): An event stream, or a tuple containing one (e.g. ResponseMetadata, completion).
+            request_start_time (float): The start time of the request.
+
+        Returns:
+            Any: The output data with every event stream replaced by a pass-through generator.
+        """
+        if self._is_event_stream(output_data):
+            return self.iter_agent_events(output_data, request_start_time)
+        if isinstance(output_data, tuple):
+            return tuple(self.iter_agent_events(item, request_start_time) if self._is_event_stream(item) else item
+                         for item in output_data)
+        return output_data
 
     def handle_agent_feature(self, output_data, request_start_time):
         """
@@ -103,59 +235,29 @@ class BedrockLogs:
             if isinstance(data, dict) and 'trace' in data:
                 trace = data['trace']
                 if 'start_trace_time' in trace:
-                    # Check if 'start_trace_time' is defined correctly
-                    if not isinstance(trace['start_trace_time'], float):
-                        raise ValueError("The key 'start_trace_time' should be present and should be a time.time() object.")
-
-                    # Calculate the latency between traces
-                    if prev_trace_time is None:
-                        trace['latency'] = trace['start_trace_time'] - request_start_time
-                    else:
-                        trace['latency'] = trace['start_trace_time'] - prev_trace_time
-
-                    prev_trace_time = trace['start_trace_time']
-                    trace['step_number'] = self.step_counter
-                    self.step_counter += 1
-                    data['trace'] = trace  # Update the 'trace' dictionary in the original data
+                    prev_trace_time = self._stamp_trace(trace, prev_trace_time, request_start_time)
 
             elif isinstance(data, list):
                 for item in data:
                     if isinstance(item, dict) and 'start_trace_time' in item:
-                        # Check if 'start_trace_time' is defined correctly
-                        if not isinstance(item['start_trace_time'], float):
-                            raise ValueError("The key 'start_trace_time' should be present and should be a time.time() object.")
-
-                        # Calculate the latency between traces
-                        if prev_trace_time is None:
-                            item['latency'] = item['start_trace_time'] - request_start_time
-                        else:
-                            item['latency'] = item['start_trace_time'] - prev_trace_time
-
-                        prev_trace_time = item['start_trace_time']
-                        item['step_number'] = self.step_counter
-                        self.step_counter += 1
+                        prev_trace_time = self._stamp_trace(item, prev_trace_time, request_start_time)
 
                     elif isinstance(item, dict) and 'trace' in item:
                         trace = item['trace']
                         if 'start_trace_time' in trace:
-                            # Check if 'start_trace_time' is defined correctly
-                            if not isinstance(trace['start_trace_time'], float):
-                                raise ValueError("The key 'start_trace_time' should be present and should be a time.time() object.")
-
-                            # Calculate the latency between traces
-                            if prev_trace_time is None:
-                                trace['latency'] = trace['start_trace_time'] - request_start_time
-                            else:
-                                trace['latency'] = trace['start_trace_time'] - prev_trace_time
-
-                            prev_trace_time = trace['start_trace_time']
-                            trace['step_number'] = self.step_counter
-                            self.step_counter += 1
-                            item['trace'] = trace  # Update the 'trace' dictionary in the original item
+                            prev_trace_time = self._stamp_trace(trace, prev_trace_time, request_start_time)
 
         return output_data
 
-    def watch(self, capture_input: bool = True, capture_output: bool = True, call_type: Optional[str] = None):
+    def watch(self, capture_input: bool = True, capture_output: bool = True, call_type: Optional[str] = None,
+              stream_output: bool = False):
+        """
+        Decorator that logs the inputs, outputs and timings of the wrapped function.
+
+        With stream_output=True and feature_name='Agent', the wrapped function may return the
+        agent event stream (or a tuple containing it) and it is passed through lazily: trace
+        events are annotated as the caller consumes them and are not included in 'output_log'.
+        """
         def wrapper(func):
             def inner(*args, **kwargs):
                 # For Latency Calculation:
@@ -194,7 +296,16 @@ class BedrockLogs:
 
                 # Handle the 'Agent' feature case
                 if self.feature_name == "Agent":
-                    if output_data is not None:
+                    if output_data is not None and stream_output:
+                        result = self.stream_agent_feature(result, self.request_start_time)
+                        if self._is_event_stream(result):
+                            output_data = None
+                        elif isinstance(result, tuple):
+                            output_data = tuple(None if self._is_event_stream(item) else item for item in result)
+                        else:
+                            output_data = result
+                        run_id = self.extract_session_id(output_data if output_data is not None else input_log)
+                    elif output_data is not None:
                         output_data = self.handle_agent_feature(output_data, self.request_start_time)
                         run_id = self.extract_session_id(output_data[0])
                     else:
@@ -0,0 +1,46 @@
+"""
+Throughput benchmarks for process_trace_event, replayed from recorded traces.
+
+    pip install pytest pytest-benchmark
+    pytest benchmarks/ --benchmark-autosave
+    # after changing handlers.py or processors.py
+    pytest benchmarks/ --benchmark-compare --benchmark-compare-fail=mean:15%
+
+Uses the recordings in ../open-telemetry-instrumentation/replay_fixtures/.
+"""
+
+import glob
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from replay import get_in_memory_exporter, load_trace_events, replay_once  # noqa: E402
+
+RECORDINGS = sorted(glob.glob(
+    os.path.join(ROOT, "..", "open-telemetry-instrumentation", "replay_fixtures", "*.json")
+))
+
+
+@pytest.fixture
+def exporter():
+    exporter = get_in_memory_exporter()
+    exporter.clear()
+    yield exporter
+    exporter.clear()
+
+
+@pytest.mark.parametrize("recording", RECORDINGS, ids=os.path.basename)
+def test_replay_throughput(benchmark, exporter, recording):
+    events = load_trace_events(recording)
+    benchmark.extra_info["events"] = len(events)
+
+    durations = benchmark(replay_once, events)
+
+    assert len(durations) == len(events)
+    assert exporter.get_finished_spans(), "replay produced no spans"
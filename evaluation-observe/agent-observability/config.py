@@ -0,0 +1,94 @@
+"""
+Tracing backends for the Bedrock Agent instrumentation.
+
+Span exporters come from the shared registry in agent_telemetry.exporters (see
+evaluation-observe/agent-telemetry), so both agent samples support the same exporters
+(OTLP/HTTP, OTLP/gRPC, console, local JSONL/Parquet files) and can fan out to several
+of them. Set the keys of your backend as environment variables:
+- arize_cloud: ARIZE_SPACE_ID, ARIZE_API_KEY
+- langfuse:    LANGFUSE_PUBLIC_KEY, LANGFUSE_SECRET_KEY, LANGFUSE_HOST (optional)
+- arize_local: PHOENIX_COLLECTOR_ENDPOINT (optional, defaults to a local Phoenix)
+"""
+
+import os
+import sys
+import base64
+from typing import Any, Dict, List, Optional
+
+from opentelemetry import trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, SimpleSpanProcessor
+
+# shared agent telemetry (exporters), see evaluation-observe/agent-telemetry
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "agent-telemetry"))
+from agent_telemetry import exporters
+
+_tracer_provider: Optional[TracerProvider] = None
+
+
+def backend_exporters(provider: str) -> List[Dict[str, Any]]:
+    """Exporter specs for a named tracing backend; any other name is used as an exporter name"""
+    if provider == "arize_cloud":
+        return [{
+            "type": "otlp_grpc",
+            "endpoint": "https://otlp.arize.com/v1",
+            "headers": {
+                "space_id": os.environ.get("ARIZE_SPACE_ID", ""),
+                "api_key": os.environ.get("ARIZE_API_KEY", ""),
+            },
+        }]
+    if provider == "langfuse":
+        host = os.environ.get("LANGFUSE_HOST", "https://us.cloud.langfuse.com")
+        auth_token = base64.b64encode(
+            f"{os.environ.get('LANGFUSE_PUBLIC_KEY', '')}:{os.environ.get('LANGFUSE_SECRET_KEY', '')}".encode()
+        ).decode()
+        return [{
+            "type": "otlp_http",
+            "endpoint": f"{host}/api/public/otel/v1/traces",
+            "headers": {"Authorization": f"Basic {auth_token}"},
+        }]
+    if provider == "arize_local":
+        endpoint = os.environ.get("PHOENIX_COLLECTOR_ENDPOINT", "http://localhost:6006")
+        return [{"type": "otlp_http", "endpoint": f"{endpoint.rstrip('/')}/v1/traces"}]
+    return [{"type": provider}]
+
+
+def create_tracer_provider(
+    provider: Optional[str] = None,
+    exporters_config: Optional[List[Any]] = None,
+    project_name: Optional[str] = None,
+    use_batch_processor: bool = True,
+) -> TracerProvider:
+    """
+    Create the global TracerProvider, once per process.
+
+    Spans go to every exporter in `exporters_config` (names or {"type": name, **options}
+    dicts), else to the exporters in OTEL_TRACES_EXPORTER, else to the `provider` backend
+    (arize_cloud by default). OTEL_TRACES_EXPORTER=none or an empty list disables exporting.
+    """
+    global _tracer_provider
+    if _tracer_provider is not None:
+        return _tracer_provider
+
+    resource = Resource.create({
+        "service.name": os.environ.get("OTEL_SERVICE_NAME", "bedrock-agent"),
+        "openinference.project.name": project_name or os.environ.get("PROJECT_NAME", "default"),
+    })
+    tracer_provider = TracerProvider(resource=resource)
+
+    specs = exporters_config
+    if specs is None:
+        specs = exporters.exporters_from_env()
+    if specs is None:
+        specs = backend_exporters(provider or "arize_cloud")
+    processor_cls = BatchSpanProcessor if use_batch_processor else SimpleSpanProcessor
+    for spec in specs:
+        try:
+            tracer_provider.add_span_processor(processor_cls(exporters.create_exporter(spec)))
+        except Exception as e:
+            print(f"Failed to configure {spec} exporter: {str(e)}")
+
+    trace.set_tracer_provider(tracer_provider)
+    _tracer_provider = tracer_provider
+    return tracer_provider
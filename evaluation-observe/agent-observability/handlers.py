@@ -1,4 +1,5 @@
 import json
+import time
 from opentelemetry.trace import Status, StatusCode
 from datetime import datetime
 from opentelemetry import trace
@@ -9,7 +10,7 @@ from openinference.semconv.trace import (
     ToolCallAttributes,
 )
 
-from utils import ActionGroupTiming, timing_metrics, trace_context, enhance_span_attributes, safe_span_operation, set_common_attributes
+from utils import ActionGroupTiming, agent_metrics, timing_metrics, trace_context, enhance_span_attributes, safe_span_operation, set_common_attributes
 
 tracer = None
 def set_tracer(tracer_instance):
@@ -135,6 +136,8 @@ def handle_knowledge_base_output(obs, current_trace_data, tracer):
             kb_output = obs['knowledgeBaseLookupOutput']
             kb_span = current_trace_data['kb_span']            
             if kb_span:
+                if kb_span.start_time:
+                    agent_metrics.record_kb_duration((time.time_ns() - kb_span.start_time) / 1_000_000)
                 retrieved_refs = kb_output.get('retrievedReferences', [])
                 
                 # Process each retrieved document
@@ -207,6 +210,10 @@ def handle_action_group_output(obs, current_trace_data, tracer):
             # Add timing information to the span
             total_duration = action_group_timing.get_total_duration()
             tool_span.set_attribute("duration_ms", total_duration * 1000)  # Convert to milliseconds
+            agent_metrics.record_action_group_duration(
+                total_duration * 1000,
+                action_group=tool_span.attributes.get(SpanAttributes.TOOL_NAME)
+            )
             
             # Add detailed timing information
             timing_details = {
@@ -259,6 +266,7 @@ def handle_model_invocation_input(orch_trace, current_trace_data):
     with timing_metrics.measure("model_invocation_input"):
         if 'modelInvocationInput' in orch_trace:
             current_trace_data['llm_input'] = orch_trace['modelInvocationInput']
+            current_trace_data['llm_input_time'] = time.time()
 
 def handle_model_invocation_output(orch_trace, current_trace_data, current_span, tracer):
     """Handle model invocation output processing"""
@@ -280,6 +288,12 @@ def handle_model_invocation_output(orch_trace, current_trace_data, current_span,
                 ) as llm_span:
                     model_output = orch_trace['modelInvocationOutput']
                     enhance_span_attributes(llm_span, model_output)
+                    llm_input_time = current_trace_data.get('llm_input_time')
+                    agent_metrics.record_llm(
+                        (time.time() - llm_input_time) * 1000 if llm_input_time else None,
+                        model_output.get('metadata', {}).get('usage'),
+                        step="orchestration"
+                    )
                     
                     if 'metadata' in model_output and 'usage' in model_output['metadata']:
                         usage = model_output['metadata']['usage']
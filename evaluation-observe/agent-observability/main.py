@@ -1,3 +1,5 @@
+import os
+import sys
 import time
 import uuid
 import boto3
@@ -18,6 +20,10 @@ from config import create_tracer_provider
 from processors import process_trace_event, set_tracer as set_processors_tracer
 from handlers import set_tracer as set_handlers_tracer
 
+# shared agent telemetry (metrics), see evaluation-observe/agent-telemetry
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "agent-telemetry"))
+from agent_telemetry.metrics import agent_metrics, create_meter_provider
+
 # Initialize logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -29,10 +35,10 @@ class DateTimeEncoder(json.JSONEncoder):
             return obj.isoformat()
         return super().default(obj)
 
-def initialize_tracer(provider=None):
-    """Initialize and configure the tracer with the specified provider"""
-    # Get tracer provider based on the selected provider
-    tracer_provider = create_tracer_provider(provider)
+def initialize_tracer(provider=None, exporters=None):
+    """Initialize and configure the tracer with the specified provider or exporters"""
+    # Get tracer provider based on the selected provider (see config.py)
+    tracer_provider = create_tracer_provider(provider, exporters)
     
     # Create tracer from provider
     tracer = trace.get_tracer(__name__, tracer_provider=tracer_provider)
@@ -43,6 +49,20 @@ def initialize_tracer(provider=None):
     
     return tracer
 
+def initialize_meter(endpoint=None, metric_readers=None, export_interval_millis=60000):
+    """Initialize the global MeterProvider once, exporting over OTLP/HTTP when an endpoint is configured
+
+    Args:
+        endpoint (str, optional): OTLP metrics endpoint, defaults to OTEL_EXPORTER_OTLP_METRICS_ENDPOINT
+        metric_readers (list, optional): Additional metric readers, e.g. an InMemoryMetricReader
+        export_interval_millis (int): How often metrics are exported
+    """
+    return create_meter_provider(
+        endpoint=endpoint,
+        metric_readers=metric_readers,
+        export_interval_millis=export_interval_millis,
+    )
+
 # Default tracer - will be replaced during invocation
 tracer = None
 
@@ -52,15 +72,19 @@ def instrument_agent_invocation(func):
         # Extract and handle parameters that shouldn't be passed to the AWS API
         provider = kwargs.pop('provider', None)
         show_traces = kwargs.pop('show_traces', False)
+        exporters = kwargs.pop('exporters', None)
         
         # Initialize the tracer with the specified provider
         global tracer
-        tracer = initialize_tracer(provider)
+        tracer = initialize_tracer(provider, exporters)
+        initialize_meter()
         
         session_id = kwargs.get('sessionId', 'default-session')
         agent_id = kwargs.get('agentId', '')
         agent_alias_id = kwargs.get('agentAliasId', '')
         input_text = kwargs.get('inputText', '')
+        agent_metrics.set_invocation_attributes(agent_id, agent_alias_id)
+        invocation_start = time.time()
         
         # Enhanced metadata for better tracing
         metadata = {
@@ -127,10 +151,12 @@ def instrument_agent_invocation(func):
                     
                     # Set status to OK when successful
                     root_span.set_status(Status(StatusCode.OK))
+                    agent_metrics.record_agent_duration((time.time() - invocation_start) * 1000)
                     return response
 
                 except Exception as e:
                     logger.error(f"Error in agent invocation: {str(e)}")
+                    agent_metrics.record_error(e.__class__.__name__, step="invocation")
                     root_span.set_status(Status(StatusCode.ERROR))
                     root_span.record_exception(e)
                     root_span.set_attribute("error.message", str(e))
@@ -1,4 +1,5 @@
 import json
+import time
 import logging
 from opentelemetry import trace
 from typing import Dict, Any
@@ -9,7 +10,7 @@ from openinference.semconv.trace import (
     ToolCallAttributes,
 )
 
-from utils import trace_context, timing_metrics, safe_span_operation, enhance_span_attributes
+from utils import agent_metrics, trace_context, timing_metrics, safe_span_operation, enhance_span_attributes
 from handlers import (
     handle_model_invocation_input,
     handle_model_invocation_output,
@@ -138,6 +139,7 @@ def process_knowledge_base_span(kb_input, current_span):
 def process_guardrail_trace(trace_data, parent_span):
     guardrail = trace_data['guardrailTrace']
     guardrail_type = "pre" if "pre" in guardrail.get('traceId', '') else "post"
+    agent_metrics.record_guardrail_action(guardrail_type, guardrail.get('action', ''))
     
     with timing_metrics.measure("guardrail"):
         with tracer.start_as_current_span(
@@ -160,6 +162,7 @@ def process_guardrail_trace(trace_data, parent_span):
                 guardrail_span.set_status(Status(StatusCode.OK))
 
 def process_failure_trace(trace_data, parent_span):
+    agent_metrics.record_error("AgentProcessingFailure")
     with timing_metrics.measure("failure"):
         with tracer.start_as_current_span(
             name="failure",
@@ -237,12 +240,19 @@ def process_postprocessing_trace(trace_data, parent_span):
     if 'modelInvocationInput' in postProcessingTrace:
         model_input = postProcessingTrace['modelInvocationInput']
         current_trace_data['llm_input'] = model_input
+        current_trace_data['llm_input_time'] = time.time()
         trace_context.set(trace_id, current_trace_data)
     
     # Handle model invocation output (generation phase)
     elif 'modelInvocationOutput' in postProcessingTrace and current_trace_data.get('llm_input'):
         with safe_span_operation():
             model_output = postProcessingTrace['modelInvocationOutput']
+            llm_input_time = current_trace_data.get('llm_input_time')
+            agent_metrics.record_llm(
+                (time.time() - llm_input_time) * 1000 if llm_input_time else None,
+                model_output.get('metadata', {}).get('usage'),
+                step="postprocessing"
+            )
 
             with tracer.start_as_current_span(
                 name="llm",
@@ -0,0 +1,161 @@
+"""
+Offline replay of recorded Bedrock Agent trace events through process_trace_event.
+
+Spans are captured by an in-memory exporter, so the processors and handlers can be
+exercised and benchmarked without a live agent. Accepts the same recordings as
+open-telemetry-instrumentation/replay.py: `trace_logs.json` files written with
+SAVE_TRACE_LOGS (JSON objects separated by `---`), test-agent `json_trace` files,
+or a JSON list of trace events.
+
+Usage:
+    python replay.py ../open-telemetry-instrumentation/replay_fixtures/sample_trace_logs.json
+    python replay.py trace_logs.json --iterations 200 --allocations
+"""
+
+import argparse
+import copy
+import json
+import logging
+import statistics
+import time
+import tracemalloc
+from typing import Any, Dict, List
+
+from opentelemetry import trace
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+import processors
+from processors import process_trace_event, set_tracer as set_processors_tracer
+from handlers import set_tracer as set_handlers_tracer
+from utils import trace_context
+
+# Order in which test-agent json_trace step keys were emitted by the agent
+JSON_TRACE_STEP_KEYS = ["modelInvocationInput", "modelInvocationOutput", "rationale", "invocationInput", "observation"]
+
+_exporter = None
+_tracer = None
+
+
+def get_in_memory_exporter() -> InMemorySpanExporter:
+    """Attach an InMemorySpanExporter to the global TracerProvider and hand its tracer to the processors"""
+    global _exporter, _tracer
+    if _exporter is None:
+        provider = trace.get_tracer_provider()
+        if not isinstance(provider, TracerProvider):
+            provider = TracerProvider()
+            trace.set_tracer_provider(provider)
+        _exporter = InMemorySpanExporter()
+        provider.add_span_processor(SimpleSpanProcessor(_exporter))
+        _tracer = trace.get_tracer(__name__, tracer_provider=provider)
+        set_processors_tracer(_tracer)
+        set_handlers_tracer(_tracer)
+    return _exporter
+
+
+def load_trace_events(path: str) -> List[Dict[str, Any]]:
+    """Load recorded trace events in the format passed to process_trace_event"""
+    with open(path) as f:
+        content = f.read()
+
+    if "\n---\n" in content or content.rstrip().endswith("---"):
+        events = [json.loads(part) for part in content.split("\n---\n") if part.strip() and part.strip() != "---"]
+    else:
+        data = json.loads(content)
+        if isinstance(data, dict) and any(key.startswith("Step_") for key in data):
+            steps = sorted((key for key in data if key.startswith("Step_")), key=lambda key: int(key.split("_", 1)[1]))
+            return [
+                {"orchestrationTrace": {key: data[step][key]}}
+                for step in steps for key in JSON_TRACE_STEP_KEYS if key in data[step]
+            ]
+        if not isinstance(data, list):
+            raise ValueError(f"Unrecognized trace recording format: {path}")
+        events = [event["trace"] if "trace" in event and "trace" in event["trace"] else event
+                  for event in data if "chunk" not in event]
+
+    # process_trace_event takes the inner `trace` member of each trace event
+    return [event.get("trace", event) for event in events]
+
+
+def replay_once(events: List[Dict[str, Any]]) -> List[int]:
+    """Replay one recorded invocation and return the per-event processing time in ns"""
+    events = copy.deepcopy(events)
+    trace_context.clear_old_traces(max_age_seconds=0)
+    processors.pending_guardrail_post = None
+    durations = []
+
+    # The root span is made current as in main.py; safe_span_operation reads the current span's status
+    with _tracer.start_as_current_span(name="Bedrock Agent: replay", attributes={"agent.id": "replay"}) as root_span:
+        for event in events:
+            start = time.perf_counter_ns()
+            process_trace_event(event, root_span)
+            durations.append(time.perf_counter_ns() - start)
+    return durations
+
+
+def measure_allocations(events: List[Dict[str, Any]]) -> Dict[str, float]:
+    """Replay once under tracemalloc and report the memory retained per event and the peak traced memory"""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        replay_once(events)
+        after = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    retained = sum(stat.size_diff for stat in after.compare_to(before, "filename") if stat.size_diff > 0)
+    return {
+        "retained_kb_per_event": retained / 1024 / max(1, len(events)),
+        "peak_kb": peak / 1024,
+    }
+
+
+def run_replay(events: List[Dict[str, Any]], iterations: int = 100, warmup: int = 5,
+               allocations: bool = False) -> Dict[str, Any]:
+    """Replay the recording `iterations` times and summarize the per-event overhead"""
+    exporter = get_in_memory_exporter()
+    for _ in range(warmup):
+        replay_once(events)
+    exporter.clear()
+
+    durations = []
+    wall_start = time.perf_counter()
+    for _ in range(iterations):
+        durations.extend(replay_once(events))
+    wall_seconds = time.perf_counter() - wall_start
+
+    durations_us = sorted(d / 1000 for d in durations)
+    quantiles = statistics.quantiles(durations_us, n=100) if len(durations_us) > 1 else durations_us * 99
+    report = {
+        "events": len(durations),
+        "spans": len(exporter.get_finished_spans()),
+        "events_per_sec": len(durations) / wall_seconds if wall_seconds else 0.0,
+        "p50_us": quantiles[49],
+        "p99_us": quantiles[98],
+        "max_us": durations_us[-1] if durations_us else 0.0,
+    }
+    exporter.clear()
+    if allocations:
+        report.update(measure_allocations(events))
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded Bedrock Agent traces through process_trace_event")
+    parser.add_argument("recordings", nargs="+", help="Recorded trace files")
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--allocations", action="store_true", help="Also measure allocations with tracemalloc")
+    args = parser.parse_args()
+
+    logging.getLogger("opentelemetry.sdk.trace").setLevel(logging.ERROR)
+
+    for path in args.recordings:
+        events = load_trace_events(path)
+        report = run_replay(events, args.iterations, args.warmup, args.allocations)
+        print(f"{path}: {json.dumps({k: round(v, 2) for k, v in report.items()})}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,20 @@
 import json
 import logging
+import os
+import sys
 import time
 from contextlib import contextmanager
-from collections import defaultdict
+from collections import defaultdict, deque, OrderedDict
 from datetime import datetime
 from typing import Dict, Any, Optional
-from threading import Lock
+from threading import Event, Lock, Thread
 from opentelemetry import trace
 from opentelemetry.trace import Status, StatusCode
 
+# shared agent telemetry (metrics), see evaluation-observe/agent-telemetry
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "agent-telemetry"))
+from agent_telemetry.metrics import agent_metrics
+
 # Initialize logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -40,8 +46,9 @@ class ActionGroupTiming:
         return 0
     
 class TimingMetrics:
-    def __init__(self):
-        self.component_timings = defaultdict(list)
+    def __init__(self, max_samples_per_component: int = 1000):
+        # Recent samples for local inspection; the full distribution is exported as a histogram
+        self.component_timings = defaultdict(lambda: deque(maxlen=max_samples_per_component))
 
     @contextmanager
     def measure(self, component_name: str):
@@ -52,6 +59,7 @@ class TimingMetrics:
             end_time = time.time_ns() // 1_000_000
             duration = end_time - start_time
             self.component_timings[component_name].append(duration)
+            agent_metrics.record_processing_duration(duration, component_name)
             current_span = trace.get_current_span()
             if current_span:
                 current_span.set_attribute("duration_ms", duration)
@@ -59,72 +67,167 @@ class TimingMetrics:
 # Initialize timing metrics
 timing_metrics = TimingMetrics()
 
-# Thread-safe trace storage using context
-class TraceContext:
+class _TraceEntry:
+    """Everything stored for one trace_id, plus the monotonic time it was last written."""
+    __slots__ = ('data', 'metadata', 'session_data', 'touched_at')
+
+    def __init__(self, touched_at: float):
+        self.data: Optional[Dict[str, Any]] = None
+        self.metadata: Dict[str, Any] = {}
+        self.session_data: Dict[str, Dict[str, Any]] = {}
+        self.touched_at = touched_at
+
+class _TraceStripe:
+    """One lock-protected shard of the trace store, ordered from oldest to newest write."""
+    __slots__ = ('lock', 'entries')
+
     def __init__(self):
-        self._storage: Dict[str, Dict[str, Any]] = {}
-        self._metadata: Dict[str, Any] = {}
-        self._session_data: Dict[str, Dict[str, Any]] = {}
-        self._lock = Lock()  # Thread safety
-        
+        self.lock = Lock()
+        self.entries: "OrderedDict[str, _TraceEntry]" = OrderedDict()
+
+# Thread-safe, bounded trace storage using context
+class TraceContext:
+    """
+    Trace storage with TTL expiry and a max-entries cap.
+
+    Entries are spread over `num_stripes` shards, each with its own lock, so concurrent
+    writers on different traces rarely contend. Within a shard entries are kept in write
+    order; because every entry has the same TTL this is also expiry order, so expired
+    entries are always at the front and are evicted in O(1) each on every write (and
+    optionally from a daemon thread, see start_background_eviction).
+    """
+    def __init__(self, ttl_seconds: float = 3600, max_entries: int = 10000, num_stripes: int = 16):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._stripes = [_TraceStripe() for _ in range(max(1, num_stripes))]
+        self._max_entries_per_stripe = max(1, -(-max_entries // len(self._stripes)))
+        self._eviction_thread: Optional[Thread] = None
+        self._stop_eviction = Event()
+
+    def _stripe(self, trace_id: str) -> _TraceStripe:
+        return self._stripes[hash(trace_id) % len(self._stripes)]
+
+    def _evict(self, stripe: _TraceStripe, now: float, max_age_seconds: Optional[float] = None) -> int:
+        """Drop expired entries and entries over the cap. Caller must hold stripe.lock."""
+        max_age = self.ttl_seconds if max_age_seconds is None else max_age_seconds
+        entries = stripe.entries
+        evicted = 0
+        while entries:
+            trace_id, entry = next(iter(entries.items()))
+            if now - entry.touched_at <= max_age and len(entries) <= self._max_entries_per_stripe:
+                break
+            entries.popitem(last=False)
+            evicted += 1
+        return evicted
+
+    def _live_entry(self, stripe: _TraceStripe, trace_id: str, now: float) -> Optional[_TraceEntry]:
+        """Return the entry if it exists and has not expired. Caller must hold stripe.lock."""
+        entry = stripe.entries.get(trace_id)
+        if entry is not None and now - entry.touched_at > self.ttl_seconds:
+            del stripe.entries[trace_id]
+            return None
+        return entry
+
+    def _touch(self, stripe: _TraceStripe, trace_id: str, now: float) -> _TraceEntry:
+        """Get or create the entry and move it to the newest end. Caller must hold stripe.lock."""
+        entry = self._live_entry(stripe, trace_id, now)
+        if entry is None:
+            entry = _TraceEntry(now)
+            stripe.entries[trace_id] = entry
+        else:
+            entry.touched_at = now
+            stripe.entries.move_to_end(trace_id)
+        self._evict(stripe, now)
+        return entry
+
     def get(self, trace_id: str) -> Optional[Dict[str, Any]]:
-        with self._lock:
-            return self._storage.get(trace_id)
+        stripe = self._stripe(trace_id)
+        with stripe.lock:
+            entry = self._live_entry(stripe, trace_id, time.monotonic())
+            return entry.data if entry is not None else None
     
     def set(self, trace_id: str, data: Dict[str, Any]) -> None:
-        with self._lock:
-            self._storage[trace_id] = {
+        stripe = self._stripe(trace_id)
+        with stripe.lock:
+            entry = self._touch(stripe, trace_id, time.monotonic())
+            entry.data = {
                 **data,
                 'metadata': {
                     'timestamp': datetime.now().isoformat(),
                     'trace_version': '1.0',
-                    **self._metadata.get(trace_id, {})
+                    **entry.metadata
                 }
             }
     
     def delete(self, trace_id: str) -> None:
-        with self._lock:
-            self._storage.pop(trace_id, None)
-            self._metadata.pop(trace_id, None)
-            self._session_data.pop(trace_id, None)
+        stripe = self._stripe(trace_id)
+        with stripe.lock:
+            stripe.entries.pop(trace_id, None)
     
     def add_metadata(self, trace_id: str, metadata: Dict[str, Any]) -> None:
         """Add metadata to a specific trace"""
-        with self._lock:
-            if trace_id not in self._metadata:
-                self._metadata[trace_id] = {}
-            self._metadata[trace_id].update(metadata)
+        stripe = self._stripe(trace_id)
+        with stripe.lock:
+            self._touch(stripe, trace_id, time.monotonic()).metadata.update(metadata)
     
     def set_session_data(self, trace_id: str, session_id: str, data: Dict[str, Any]) -> None:
         """Store session-specific data"""
-        with self._lock:
-            if trace_id not in self._session_data:
-                self._session_data[trace_id] = {}
-            self._session_data[trace_id][session_id] = {
+        stripe = self._stripe(trace_id)
+        with stripe.lock:
+            entry = self._touch(stripe, trace_id, time.monotonic())
+            entry.session_data[session_id] = {
                 **data,
                 'last_updated': datetime.now().isoformat()
             }
     
     def get_session_data(self, trace_id: str, session_id: str) -> Optional[Dict[str, Any]]:
         """Retrieve session-specific data"""
-        with self._lock:
-            return self._session_data.get(trace_id, {}).get(session_id)
+        stripe = self._stripe(trace_id)
+        with stripe.lock:
+            entry = self._live_entry(stripe, trace_id, time.monotonic())
+            return entry.session_data.get(session_id) if entry is not None else None
     
     def get_trace_metadata(self, trace_id: str) -> Dict[str, Any]:
         """Get all metadata for a trace"""
-        with self._lock:
-            return self._metadata.get(trace_id, {})
+        stripe = self._stripe(trace_id)
+        with stripe.lock:
+            entry = self._live_entry(stripe, trace_id, time.monotonic())
+            return entry.metadata if entry is not None else {}
+
+    def __len__(self) -> int:
+        return sum(len(stripe.entries) for stripe in self._stripes)
     
-    def clear_old_traces(self, max_age_seconds: int = 3600) -> None:
-        """Clear traces older than max_age_seconds"""
-        with self._lock:
-            current_time = datetime.now()
-            for trace_id in list(self._storage.keys()):
-                trace_time = datetime.fromisoformat(
-                    self._storage[trace_id]['metadata']['timestamp']
-                )
-                if (current_time - trace_time).total_seconds() > max_age_seconds:
-                    self.delete(trace_id)
+    def clear_old_traces(self, max_age_seconds: Optional[float] = None) -> int:
+        """Clear traces not written to for more than max_age_seconds (defaults to the TTL)"""
+        now = time.monotonic()
+        evicted = 0
+        for stripe in self._stripes:
+            with stripe.lock:
+                evicted += self._evict(stripe, now, max_age_seconds)
+        return evicted
+
+    def start_background_eviction(self, interval_seconds: float = 60) -> None:
+        """Start a daemon thread that calls clear_old_traces every interval_seconds"""
+        if self._eviction_thread is not None and self._eviction_thread.is_alive():
+            return
+        self._stop_eviction.clear()
+
+        def run():
+            while not self._stop_eviction.wait(interval_seconds):
+                try:
+                    self.clear_old_traces()
+                except Exception:
+                    logger.exception("Error evicting old traces")
+
+        self._eviction_thread = Thread(target=run, name="trace-context-eviction", daemon=True)
+        self._eviction_thread.start()
+
+    def stop_background_eviction(self) -> None:
+        """Stop the eviction thread started by start_background_eviction"""
+        self._stop_eviction.set()
+        if self._eviction_thread is not None:
+            self._eviction_thread.join()
+            self._eviction_thread = None
 
 # Initialize trace context
 trace_context = TraceContext()
@@ -136,6 +239,7 @@ def safe_span_operation():
         yield
     except Exception as e:
         logger.exception("Error in span operation")
+        agent_metrics.record_error(e.__class__.__name__, step="trace_processing")
         current_span = trace.get_current_span()
         if current_span:
             current_span.set_status(Status(StatusCode.ERROR))
@@ -0,0 +1 @@
+from .metrics import AgentMetrics, MetricNames, agent_metrics, create_meter_provider, metric_views
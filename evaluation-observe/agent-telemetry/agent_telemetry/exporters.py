@@ -0,0 +1,308 @@
+"""
+Pluggable span exporters.
+
+Exporters are selected by name (or by a dict with a "type" key plus options) and
+create_tracer_provider adds one span processor per exporter, so spans can be fanned
+out to several destinations at once:
+
+    create_tracer_provider(exporters=[
+        "otlp_http",
+        {"type": "file", "directory": "trace_exports", "format": "parquet"},
+    ])
+
+Built-in exporters:
+- otlp_http: OTLP over HTTP/protobuf (the previous default)
+- otlp_grpc: OTLP over gRPC, gzip-compressed by default
+- console:   prints spans to stdout
+- file:      rotating local JSONL or Parquet files, one column per span attribute,
+             for offline analysis with DuckDB/pandas without a collector
+             ("jsonl" and "parquet" are shorthands for the two formats)
+
+This module only depends on the OpenTelemetry SDK (pyarrow is needed for Parquet and
+the gRPC exporter for otlp_grpc).
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+import weakref
+from typing import Any, Callable, Dict, List, Optional, Sequence, Union
+
+from opentelemetry.sdk.trace import ReadableSpan
+from opentelemetry.sdk.trace.export import ConsoleSpanExporter, SpanExporter, SpanExportResult
+
+# Initialize logging
+logger = logging.getLogger(__name__)
+
+ExporterSpec = Union[str, Dict[str, Any]]
+
+# Prefix of the per-attribute columns in the local span files
+ATTRIBUTE_PREFIX = "attributes."
+
+_EXPORTER_FACTORIES: Dict[str, Callable[..., SpanExporter]] = {}
+
+# Span processors don't flush their exporter, so buffered Parquet spans are written
+# on shutdown or by flush_file_exporters()
+_file_exporters: "weakref.WeakSet[LocalFileSpanExporter]" = weakref.WeakSet()
+
+
+def register_exporter(name: str, factory: Optional[Callable[..., SpanExporter]] = None):
+    """
+    Register a span exporter factory under `name`. Factories receive the options of
+    the exporter spec as keyword arguments. Can be used as a decorator.
+    """
+    def decorator(func):
+        _EXPORTER_FACTORIES[name] = func
+        return func
+
+    if factory is not None:
+        return decorator(factory)
+    return decorator
+
+
+def available_exporters() -> List[str]:
+    return sorted(_EXPORTER_FACTORIES)
+
+
+def create_exporter(spec: ExporterSpec, **defaults) -> SpanExporter:
+    """
+    Create an exporter from a name or a {"type": name, **options} dict.
+    `defaults` fill in options the spec doesn't set (e.g. the OTLP endpoint).
+    """
+    if isinstance(spec, str):
+        name, options = spec, {}
+    else:
+        options = dict(spec)
+        name = options.pop("type", None)
+    if name not in _EXPORTER_FACTORIES:
+        raise ValueError(f"Unknown exporter '{name}', available: {', '.join(available_exporters())}")
+    for key, value in defaults.items():
+        if value is not None:
+            options.setdefault(key, value)
+    return _EXPORTER_FACTORIES[name](**options)
+
+
+def exporters_from_env() -> Optional[List[ExporterSpec]]:
+    """
+    Exporter specs from OTEL_TRACES_EXPORTER (comma separated, e.g. "otlp,file,console").
+    "otlp" resolves to otlp_grpc or otlp_http from OTEL_EXPORTER_OTLP_(TRACES_)PROTOCOL.
+    Returns None when the variable isn't set.
+    """
+    value = os.environ.get("OTEL_TRACES_EXPORTER")
+    if value is None:
+        return None
+    protocol = os.environ.get("OTEL_EXPORTER_OTLP_TRACES_PROTOCOL",
+               os.environ.get("OTEL_EXPORTER_OTLP_PROTOCOL", "http/protobuf"))
+    specs = []
+    for name in (part.strip() for part in value.split(",")):
+        if not name or name == "none":
+            continue
+        if name == "otlp":
+            name = "otlp_grpc" if protocol == "grpc" else "otlp_http"
+        specs.append(name)
+    return specs
+
+
+@register_exporter("otlp_http")
+def _otlp_http_exporter(endpoint=None, headers=None, timeout=30, compression=None, **kwargs):
+    from opentelemetry.exporter.otlp.proto.http import Compression
+    from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+
+    if compression:
+        kwargs["compression"] = Compression(compression)
+    return OTLPSpanExporter(endpoint=endpoint, headers=headers, timeout=timeout, **kwargs)
+
+
+@register_exporter("otlp_grpc")
+def _otlp_grpc_exporter(endpoint=None, headers=None, timeout=30, compression="gzip", insecure=None, **kwargs):
+    from grpc import Compression
+    from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+
+    grpc_compression = {
+        "gzip": Compression.Gzip,
+        "deflate": Compression.Deflate,
+        "none": Compression.NoCompression,
+    }[compression or "none"]
+    return OTLPSpanExporter(
+        endpoint=endpoint, headers=headers, timeout=timeout,
+        compression=grpc_compression, insecure=insecure, **kwargs
+    )
+
+
+@register_exporter("console")
+def _console_exporter(**kwargs):
+    return ConsoleSpanExporter(**kwargs)
+
+
+@register_exporter("file")
+def _file_exporter(**kwargs):
+    return LocalFileSpanExporter(**kwargs)
+
+
+register_exporter("jsonl", lambda **kwargs: LocalFileSpanExporter(format="jsonl", **kwargs))
+register_exporter("parquet", lambda **kwargs: LocalFileSpanExporter(format="parquet", **kwargs))
+
+
+def _format_id(value: Optional[int], width: int) -> Optional[str]:
+    return format(value, f"0{width}x") if value else None
+
+
+def span_to_record(span: ReadableSpan) -> Dict[str, Any]:
+    """Flatten a finished span into one row, with a column per span attribute"""
+    start, end = span.start_time, span.end_time
+    record = {
+        "trace_id": _format_id(span.context.trace_id, 32),
+        "span_id": _format_id(span.context.span_id, 16),
+        "parent_span_id": _format_id(span.parent.span_id, 16) if span.parent else None,
+        "name": span.name,
+        "kind": span.kind.name,
+        "start_time_unix_nano": start,
+        "end_time_unix_nano": end,
+        "duration_ms": (end - start) / 1e6 if start and end else None,
+        "status_code": span.status.status_code.name,
+        "status_description": span.status.description,
+        "service_name": span.resource.attributes.get("service.name") if span.resource else None,
+        "events": json.dumps([
+            {"name": event.name, "timestamp": event.timestamp, "attributes": dict(event.attributes or {})}
+            for event in span.events
+        ], default=str) if span.events else None,
+    }
+    for key, value in (span.attributes or {}).items():
+        record[ATTRIBUTE_PREFIX + key] = list(value) if isinstance(value, tuple) else value
+    return record
+
+
+def _columnar_table(records: Sequence[Dict[str, Any]]):
+    """Build a pyarrow Table from span records, one column per key"""
+    import pyarrow as pa
+
+    keys = list(dict.fromkeys(key for record in records for key in record))
+    columns = {}
+    for key in keys:
+        values = [record.get(key) for record in records]
+        types = {type(value) for value in values if value is not None}
+        if types == {int, float}:
+            values = [float(value) if value is not None else None for value in values]
+        elif len(types) > 1:
+            # The same attribute was recorded with different types; keep it as text
+            values = [
+                value if value is None or isinstance(value, str) else json.dumps(value, default=str)
+                for value in values
+            ]
+        columns[key] = values
+    return pa.table(columns)
+
+
+class LocalFileSpanExporter(SpanExporter):
+    """
+    Writes finished spans to rotating local files in `directory`.
+
+    JSONL files get one span per line and rotate after `max_spans_per_file` spans or
+    `max_file_bytes`. Parquet files are written when `max_spans_per_file` spans have
+    been buffered (and on flush/shutdown), compressed with `compression`.
+    Every file can be queried directly, e.g. in DuckDB:
+        SELECT name, avg(duration_ms) FROM 'trace_exports/*.parquet' GROUP BY name
+    """
+
+    def __init__(
+        self,
+        directory: str = "trace_exports",
+        format: str = "jsonl",
+        max_spans_per_file: int = 50000,
+        max_file_bytes: int = 64 * 1024 * 1024,
+        compression: str = "zstd",
+        prefix: str = "spans",
+    ):
+        if format not in ("jsonl", "parquet"):
+            raise ValueError(f"Unsupported span file format '{format}', use 'jsonl' or 'parquet'")
+        if format == "parquet":
+            import pyarrow.parquet  # noqa: F401 - fail at configuration time, not on first export
+
+        self.directory = directory
+        self.format = format
+        self.max_spans_per_file = max_spans_per_file
+        self.max_file_bytes = max_file_bytes
+        self.compression = compression
+        self.prefix = prefix
+
+        self._lock = threading.Lock()
+        self._sequence = 0
+        self._file = None
+        self._file_spans = 0
+        self._file_bytes = 0
+        self._buffer: List[Dict[str, Any]] = []
+        self._shutdown = False
+        os.makedirs(directory, exist_ok=True)
+        _file_exporters.add(self)
+
+    def _next_path(self) -> str:
+        self._sequence += 1
+        timestamp = time.strftime("%Y%m%dT%H%M%S")
+        name = f"{self.prefix}-{timestamp}-{os.getpid()}-{self._sequence:05d}.{self.format}"
+        return os.path.join(self.directory, name)
+
+    def _write_jsonl(self, records: List[Dict[str, Any]]) -> None:
+        for record in records:
+            if self._file is None:
+                self._file = open(self._next_path(), "w", encoding="utf-8")
+                self._file_spans = self._file_bytes = 0
+            line = json.dumps(record, default=str) + "\n"
+            self._file.write(line)
+            self._file_spans += 1
+            self._file_bytes += len(line)
+            if self._file_spans >= self.max_spans_per_file or self._file_bytes >= self.max_file_bytes:
+                self._file.close()
+                self._file = None
+        if self._file is not None:
+            self._file.flush()
+
+    def _write_parquet(self) -> None:
+        import pyarrow.parquet as pq
+
+        if self._buffer:
+            pq.write_table(_columnar_table(self._buffer), self._next_path(), compression=self.compression)
+            self._buffer = []
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        if self._shutdown:
+            return SpanExportResult.FAILURE
+        try:
+            records = [span_to_record(span) for span in spans]
+            with self._lock:
+                if self.format == "jsonl":
+                    self._write_jsonl(records)
+                else:
+                    self._buffer.extend(records)
+                    if len(self._buffer) >= self.max_spans_per_file:
+                        self._write_parquet()
+            return SpanExportResult.SUCCESS
+        except Exception as e:
+            logger.error(f"Failed to write spans to {self.directory}: {str(e)}")
+            return SpanExportResult.FAILURE
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        try:
+            with self._lock:
+                if self.format == "parquet":
+                    self._write_parquet()
+                elif self._file is not None:
+                    self._file.flush()
+            return True
+        except Exception as e:
+            logger.error(f"Failed to flush spans to {self.directory}: {str(e)}")
+            return False
+
+    def shutdown(self) -> None:
+        self.force_flush()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self._shutdown = True
+
+
+def flush_file_exporters() -> bool:
+    """Write out spans buffered by every LocalFileSpanExporter"""
+    return all([exporter.force_flush() for exporter in list(_file_exporters)])
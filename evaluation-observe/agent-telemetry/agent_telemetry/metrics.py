@@ -0,0 +1,261 @@
+"""
+OpenTelemetry metrics for Bedrock Agent invocations.
+
+Spans carry the full detail of every invocation; these instruments carry the
+pre-aggregated numbers dashboards need (latency distributions, token usage,
+error and guardrail counts) so they don't have to scan spans. All attributes
+are low-cardinality: agent/alias ids, the agent step, guardrail type/action
+and error type. Trace ids, session ids, prompts and tool parameters are never
+used as metric attributes.
+
+The agent/alias ids of the invocation being processed live in a ContextVar, so
+concurrent invocations on different threads or asyncio tasks never see each
+other's ids.
+"""
+
+import os
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from typing import Dict, Iterator, Optional, Any
+
+from opentelemetry import metrics
+from opentelemetry.sdk.metrics import MeterProvider
+from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
+from opentelemetry.sdk.metrics.view import ExplicitBucketHistogramAggregation, View
+from opentelemetry.sdk.resources import Resource
+
+# Initialize logging
+logger = logging.getLogger(__name__)
+
+METER_NAME = "bedrock-agent-metrics"
+
+
+class MetricNames:
+    """Metric instrument names"""
+    AGENT_DURATION = "bedrock_agent.invocation.duration"
+    LLM_DURATION = "bedrock_agent.llm.duration"
+    KB_DURATION = "bedrock_agent.knowledge_base.duration"
+    ACTION_GROUP_DURATION = "bedrock_agent.action_group.duration"
+    PROCESSING_DURATION = "bedrock_agent.trace_processing.duration"
+    INPUT_TOKENS = "bedrock_agent.llm.input_tokens"
+    OUTPUT_TOKENS = "bedrock_agent.llm.output_tokens"
+    ERRORS = "bedrock_agent.errors"
+    GUARDRAIL_ACTIONS = "bedrock_agent.guardrail.actions"
+
+
+# Bucket boundaries: latencies in milliseconds, token counts in tokens
+LATENCY_BUCKETS_MS = (
+    10, 25, 50, 100, 250, 500, 750, 1000, 1500, 2500, 5000, 7500,
+    10000, 15000, 30000, 60000, 120000,
+)
+TOKEN_BUCKETS = (
+    16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536,
+    131072, 200000,
+)
+
+
+def metric_views():
+    """Views applying explicit bucket boundaries to the agent histograms"""
+    latency = ExplicitBucketHistogramAggregation(boundaries=LATENCY_BUCKETS_MS)
+    tokens = ExplicitBucketHistogramAggregation(boundaries=TOKEN_BUCKETS)
+    return [
+        View(instrument_name=MetricNames.AGENT_DURATION, aggregation=latency),
+        View(instrument_name=MetricNames.LLM_DURATION, aggregation=latency),
+        View(instrument_name=MetricNames.KB_DURATION, aggregation=latency),
+        View(instrument_name=MetricNames.ACTION_GROUP_DURATION, aggregation=latency),
+        View(instrument_name=MetricNames.PROCESSING_DURATION, aggregation=latency),
+        View(instrument_name=MetricNames.INPUT_TOKENS, aggregation=tokens),
+        View(instrument_name=MetricNames.OUTPUT_TOKENS, aggregation=tokens),
+    ]
+
+
+def _parse_headers(headers_str: str) -> Dict[str, str]:
+    """Parse an OTEL headers string (format: key1=value1,key2=value2)"""
+    headers = {}
+    for header_pair in headers_str.split(","):
+        if "=" in header_pair:
+            key, value = header_pair.split("=", 1)
+            headers[key.strip()] = value.strip()
+    return headers
+
+
+_meter_provider: Optional[MeterProvider] = None
+
+
+def create_meter_provider(
+    service_name: Optional[str] = None,
+    environment: Optional[str] = None,
+    resource_attributes: Optional[Dict[str, Any]] = None,
+    endpoint: Optional[str] = None,
+    headers: Optional[Dict[str, str]] = None,
+    export_interval_millis: int = 60000,
+    metric_readers: Optional[list] = None,
+) -> MeterProvider:
+    """
+    Create the global MeterProvider, once per process.
+
+    Metrics are exported over OTLP/HTTP to `endpoint` or OTEL_EXPORTER_OTLP_METRICS_ENDPOINT.
+    OTEL_EXPORTER_OTLP_ENDPOINT is deliberately not used, since it often points at a
+    traces-only path (e.g. Langfuse). Extra readers (e.g. an InMemoryMetricReader in tests)
+    can be passed with `metric_readers`.
+    """
+    global _meter_provider
+    if _meter_provider is not None:
+        return _meter_provider
+
+    service_name = service_name or os.environ.get("OTEL_SERVICE_NAME",
+                   os.environ.get("SERVICE_NAME", "opentelemetry-service"))
+    environment = environment or os.environ.get("DEPLOYMENT_ENVIRONMENT", "production")
+
+    attributes = {
+        "service.name": service_name,
+        "deployment.environment": environment
+    }
+    if resource_attributes:
+        attributes.update(resource_attributes)
+
+    readers = list(metric_readers or [])
+    final_endpoint = endpoint or os.environ.get("OTEL_EXPORTER_OTLP_METRICS_ENDPOINT")
+    if not headers:
+        headers_str = os.environ.get("OTEL_EXPORTER_OTLP_METRICS_HEADERS",
+                      os.environ.get("OTEL_EXPORTER_OTLP_HEADERS", ""))
+        headers = _parse_headers(headers_str)
+
+    if final_endpoint:
+        try:
+            from opentelemetry.exporter.otlp.proto.http.metric_exporter import OTLPMetricExporter
+
+            exporter = OTLPMetricExporter(endpoint=final_endpoint, headers=headers, timeout=30)
+            readers.append(
+                PeriodicExportingMetricReader(exporter, export_interval_millis=export_interval_millis)
+            )
+        except Exception as e:
+            print(f"Failed to configure OTLP metric exporter: {str(e)}")
+    elif not readers:
+        print("No metrics endpoint configured, metrics will not be exported")
+
+    _meter_provider = MeterProvider(
+        resource=Resource.create(attributes),
+        metric_readers=readers,
+        views=metric_views(),
+    )
+    metrics.set_meter_provider(_meter_provider)
+    return _meter_provider
+
+
+# Attributes of the invocation being processed by the current thread or asyncio task
+_invocation_attributes: ContextVar[Dict[str, Any]] = ContextVar(
+    "agent_invocation_attributes", default={}
+)
+
+
+class AgentMetrics:
+    """
+    Histograms and counters recorded while processing agent traces.
+
+    Every record_* method takes an optional `attributes` dict with the invocation
+    attributes to use; when omitted, those set for the current context with
+    set_invocation_attributes are used.
+    """
+
+    def __init__(self, meter=None):
+        # The API hands out proxy instruments until a MeterProvider is set, so this
+        # can be created at import time and still export once create_meter_provider runs.
+        meter = meter or metrics.get_meter(METER_NAME)
+        self.agent_duration = meter.create_histogram(
+            MetricNames.AGENT_DURATION, unit="ms",
+            description="End-to-end Bedrock Agent invocation latency",
+        )
+        self.llm_duration = meter.create_histogram(
+            MetricNames.LLM_DURATION, unit="ms",
+            description="Latency of each LLM step inside an agent invocation",
+        )
+        self.kb_duration = meter.create_histogram(
+            MetricNames.KB_DURATION, unit="ms",
+            description="Knowledge base retrieval latency",
+        )
+        self.action_group_duration = meter.create_histogram(
+            MetricNames.ACTION_GROUP_DURATION, unit="ms",
+            description="Action group (tool) execution latency",
+        )
+        self.processing_duration = meter.create_histogram(
+            MetricNames.PROCESSING_DURATION, unit="ms",
+            description="Time spent processing each trace component",
+        )
+        self.input_tokens = meter.create_histogram(
+            MetricNames.INPUT_TOKENS, unit="{token}",
+            description="Input tokens per LLM step",
+        )
+        self.output_tokens = meter.create_histogram(
+            MetricNames.OUTPUT_TOKENS, unit="{token}",
+            description="Output tokens per LLM step",
+        )
+        self.errors = meter.create_counter(
+            MetricNames.ERRORS, unit="{error}",
+            description="Agent invocation and trace processing errors",
+        )
+        self.guardrail_actions = meter.create_counter(
+            MetricNames.GUARDRAIL_ACTIONS, unit="{action}",
+            description="Guardrail evaluations by type and action",
+        )
+
+    def set_invocation_attributes(self, agent_id: str, agent_alias_id: str) -> Token:
+        """Set the attributes of the invocation running in the current thread/task"""
+        return _invocation_attributes.set(
+            {"agent.id": agent_id, "agent.alias_id": agent_alias_id}
+        )
+
+    def invocation_attributes(self) -> Dict[str, Any]:
+        """Snapshot of the current invocation attributes, e.g. to record them later"""
+        return dict(_invocation_attributes.get())
+
+    @contextmanager
+    def use_invocation_attributes(self, attributes: Dict[str, Any]) -> Iterator[None]:
+        """Record with `attributes` as the invocation attributes inside the block"""
+        token = _invocation_attributes.set(dict(attributes))
+        try:
+            yield
+        finally:
+            _invocation_attributes.reset(token)
+
+    def attributes(self, attributes: Optional[Dict[str, Any]] = None, **extra) -> Dict[str, Any]:
+        result = dict(_invocation_attributes.get() if attributes is None else attributes)
+        result.update({k: v for k, v in extra.items() if v is not None})
+        return result
+
+    def record_agent_duration(self, duration_ms, streaming=False, attributes=None):
+        self.agent_duration.record(duration_ms, self.attributes(attributes, streaming=streaming))
+
+    def record_llm(self, duration_ms, usage, step, attributes=None):
+        attributes = self.attributes(attributes, step=step)
+        if duration_ms is not None:
+            self.llm_duration.record(duration_ms, attributes)
+        if usage:
+            self.input_tokens.record(usage.get("inputTokens", 0), attributes)
+            self.output_tokens.record(usage.get("outputTokens", 0), attributes)
+
+    def record_kb_duration(self, duration_ms, attributes=None):
+        if duration_ms is not None:
+            self.kb_duration.record(duration_ms, self.attributes(attributes))
+
+    def record_action_group_duration(self, duration_ms, action_group=None, attributes=None):
+        if duration_ms is not None:
+            self.action_group_duration.record(
+                duration_ms, self.attributes(attributes, action_group=action_group or None)
+            )
+
+    def record_processing_duration(self, duration_ms, component, attributes=None):
+        self.processing_duration.record(duration_ms, self.attributes(attributes, component=component))
+
+    def record_error(self, error_type, step=None, attributes=None):
+        self.errors.add(1, self.attributes(attributes, **{"error.type": error_type, "step": step}))
+
+    def record_guardrail_action(self, guardrail_type, action, attributes=None):
+        self.guardrail_actions.add(
+            1, self.attributes(attributes, **{"guardrail.type": guardrail_type, "guardrail.action": action or "NONE"})
+        )
+
+
+# Create a global instance for easy import
+agent_metrics = AgentMetrics()
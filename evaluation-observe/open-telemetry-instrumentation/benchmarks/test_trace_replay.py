@@ -0,0 +1,45 @@
+"""
+Throughput benchmarks for trace processing, replayed from recorded traces.
+
+    pip install pytest pytest-benchmark
+    pytest benchmarks/ --benchmark-autosave
+    # after changing core/handlers.py
+    pytest benchmarks/ --benchmark-compare --benchmark-compare-fail=mean:15%
+
+Extra recordings can be dropped into replay_fixtures/ and are picked up automatically.
+"""
+
+import glob
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from replay import get_in_memory_exporter, load_trace_events, replay_once  # noqa: E402
+
+RECORDINGS = sorted(glob.glob(os.path.join(ROOT, "replay_fixtures", "*.json")))
+
+
+@pytest.fixture
+def exporter():
+    exporter = get_in_memory_exporter()
+    exporter.clear()
+    yield exporter
+    exporter.clear()
+
+
+@pytest.mark.parametrize("streaming", [False, True], ids=["batch", "streaming"])
+@pytest.mark.parametrize("recording", RECORDINGS, ids=os.path.basename)
+def test_replay_throughput(benchmark, exporter, recording, streaming):
+    events = load_trace_events(recording)
+    benchmark.extra_info["events"] = len(events)
+
+    durations = benchmark(replay_once, events, streaming)
+
+    assert len(durations) == len(events)
+    assert exporter.get_finished_spans(), "replay produced no spans"
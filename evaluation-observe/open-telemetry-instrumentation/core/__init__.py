@@ -2,5 +2,11 @@
 Core module for Bedrock Agent OpenTelemetry integration.
 """
 
+import os
+import sys
+
+# shared agent telemetry (metrics, exporters), see evaluation-observe/agent-telemetry
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "agent-telemetry"))
+
 from .agent import instrument_agent_invocation
 from .tracing import flush_telemetry
\ No newline at end of file
@@ -14,6 +14,7 @@ from opentelemetry import trace
 from opentelemetry.trace import Status, StatusCode, SpanKind
 from .configuration import create_tracer_provider
 from .constants import SpanAttributes, SpanKindValues
+from agent_telemetry.metrics import create_meter_provider, agent_metrics
 
 # Initialize logging
 logger = logging.getLogger(__name__)
@@ -407,9 +408,13 @@ def instrument_agent_invocation(func):
         streaming = kwargs.get("streaming", False)
         model_id = kwargs.pop("model_id", None)
         save_trace_logs = kwargs.pop("SAVE_TRACE_LOGS", False)
+        exporters = kwargs.pop("exporters", None)
 
-        # Create tracer provider:
-        create_tracer_provider()
+        # Create tracer provider (only configured once per process):
+        create_tracer_provider(exporters=exporters)
+        # Create meter provider (only configured once per process):
+        create_meter_provider()
+        agent_metrics.set_invocation_attributes(agentId, agentAliasId)
 
         # Import handlers and set tracer
         from .handlers import set_tracer
@@ -552,6 +557,9 @@ def instrument_agent_invocation(func):
                             try:
                                 process_trace_event(trace_data, root_span)
                             except Exception as e:
+                                agent_metrics.record_error(
+                                    e.__class__.__name__, step="trace_processing"
+                                )
                                 logger.error(
                                     f"Error processing trace event: {str(e)}",
                                     exc_info=True,
@@ -601,10 +609,12 @@ def instrument_agent_invocation(func):
                 root_span.set_attribute(SpanAttributes.SPAN_DURATION, duration_ms)
                 root_span.set_attribute("total_time_ms", duration_ms)
                 root_span.set_status(Status(StatusCode.OK))
+                agent_metrics.record_agent_duration(duration_ms, streaming=False)
 
                 return response
             except Exception as e:
                 # Handle exceptions
+                agent_metrics.record_error(e.__class__.__name__, step="invocation")
                 root_span.record_exception(e)
                 root_span.set_attribute("error.message", str(e))
                 root_span.set_attribute("error.type", e.__class__.__name__)
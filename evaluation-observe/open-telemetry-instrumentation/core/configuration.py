@@ -1,13 +1,16 @@
 """Generic configuration for OpenTelemetry with any OTLP-compatible backend."""
 
 import os
-from typing import Dict, Optional, Any
+from typing import Dict, List, Optional, Any
 from opentelemetry import trace
 from opentelemetry.sdk.trace import TracerProvider
 from opentelemetry.sdk.resources import Resource
-from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
 from opentelemetry.sdk.trace.export import BatchSpanProcessor, SimpleSpanProcessor
 
+from agent_telemetry.exporters import ExporterSpec, create_exporter, exporters_from_env
+
+_tracer_provider: Optional[TracerProvider] = None
+
 def create_tracer_provider(
     service_name: Optional[str] = None,
     environment: Optional[str] = None,
@@ -15,10 +18,21 @@ def create_tracer_provider(
     endpoint: Optional[str] = None,
     headers: Optional[Dict[str, str]] = None,
     use_batch_processor: bool = True,
+    exporters: Optional[List[ExporterSpec]] = None,
 ) -> TracerProvider:
     """
-    Create a generic OpenTelemetry TracerProvider configurable for any backend
+    Create a generic OpenTelemetry TracerProvider configurable for any backend,
+    once per process.
+
+    `exporters` is a list of exporter names or {"type": name, **options} dicts from
+    agent_telemetry.exporters (e.g. ["otlp_grpc", {"type": "file", "format": "parquet"}]).
+    Without it, OTEL_TRACES_EXPORTER is used, and otherwise OTLP/HTTP to `endpoint`
+    or OTEL_EXPORTER_OTLP_ENDPOINT as before.
     """
+    global _tracer_provider
+    if _tracer_provider is not None:
+        return _tracer_provider
+
     service_name = service_name or os.environ.get("OTEL_SERVICE_NAME", 
                    os.environ.get("SERVICE_NAME", "opentelemetry-service"))
     environment = environment or os.environ.get("DEPLOYMENT_ENVIRONMENT", "production")
@@ -49,24 +63,30 @@ def create_tracer_provider(
                 key, value = header_pair.split("=", 1)
                 headers[key.strip()] = value.strip()
     
-    # Configure OTLP exporter if endpoint is available
-    if final_endpoint:
+    # Select exporters: parameter, then OTEL_TRACES_EXPORTER, then OTLP/HTTP if an endpoint is set
+    if exporters is None:
+        exporters = exporters_from_env()
+    if exporters is None:
+        exporters = ["otlp_http"] if final_endpoint else []
+    
+    # Add one span processor per exporter so spans fan out to all of them
+    processor_cls = BatchSpanProcessor if use_batch_processor else SimpleSpanProcessor
+    for spec in exporters:
         try:
-            # Create OTLP exporter
-            otlp_exporter = OTLPSpanExporter(
-                endpoint=final_endpoint,
-                headers=headers,
-                timeout=30
-            )
-            
-            # Add appropriate span processor
-            processor_cls = BatchSpanProcessor if use_batch_processor else SimpleSpanProcessor
-            tracer_provider.add_span_processor(processor_cls(otlp_exporter))            
+            # OTLP exporters without their own endpoint/headers use the ones above
+            defaults = {"endpoint": final_endpoint, "headers": headers} if _is_otlp(spec) else {}
+            tracer_provider.add_span_processor(processor_cls(create_exporter(spec, **defaults)))
         except Exception as e:
-            print(f"Failed to configure OTLP exporter: {str(e)}")
-    else:
-        print("No telemetry endpoint configured, spans will not be exported")
+            print(f"Failed to configure {spec} exporter: {str(e)}")
+    if not exporters:
+        print("No telemetry endpoint or exporters configured, spans will not be exported")
     
     # Set as global tracer provider
     trace.set_tracer_provider(tracer_provider)
-    return tracer_provider
\ No newline at end of file
+    _tracer_provider = tracer_provider
+    return tracer_provider
+
+
+def _is_otlp(spec: ExporterSpec) -> bool:
+    name = spec if isinstance(spec, str) else spec.get("type", "")
+    return name.startswith("otlp")
@@ -33,6 +33,7 @@ from .tracing import set_span_attributes
 from typing import Dict, Any
 from .timer_lib import timer
 from .agent import extract_trace_id
+from agent_telemetry.metrics import agent_metrics
 import time
 
 # Initialize logging
@@ -171,6 +172,9 @@ def update_preprocessing_span(trace_data: Dict[str, Any], preprocessing_span):
     ) as llm_span:
         # Set and protect LLM span timing
         set_span_timing(llm_span, start_time, end_time, duration, llm_span_key)
+        agent_metrics.record_llm(
+            duration, model_output.get("metadata", {}).get("usage"), "preprocessing"
+        )
         # Add token usage information
         if "metadata" in model_output and "usage" in model_output["metadata"]:
             usage = model_output["metadata"]["usage"]
@@ -306,6 +310,9 @@ def handle_llm_invocation(
             context=parent_context,
         ) as current_llm_span:
             llm_span = current_llm_span
+            agent_metrics.record_llm(
+                duration, model_output.get("metadata", {}).get("usage"), parent_component
+            )
             # Add token usage information
             if "metadata" in model_output and "usage" in model_output["metadata"]:
                 usage = model_output["metadata"]["usage"]
@@ -512,6 +519,7 @@ def handle_knowledge_base(trace_data: Dict[str, Any], parent_span):
         and "knowledgeBaseLookupOutput" in orchestration_trace["observation"]
     ):
         kb_output = orchestration_trace["observation"]["knowledgeBaseLookupOutput"]
+        agent_metrics.record_kb_duration(duration)
         # Retrieve the previously created kb_span
         from .agent import active_spans
         kb_span = active_spans.get("kb_span")
@@ -712,6 +720,10 @@ def handle_action_group(trace_data: Dict[str, Any], parent_span):
                     SpanAttributes.LLM_COMPLETIONS, action_output["text"]
                 )
 
+        agent_metrics.record_action_group_duration(
+            duration, action_span.attributes.get("tool.action_group_name")
+        )
+
         # Set status on action_span
         action_span.set_status(Status(StatusCode.OK))
 
@@ -870,6 +882,7 @@ def process_guardrail_buffer(guardrail_buffer: Dict[str, list], parent_span):
         first_trace_data = first_event["trace_data"]
         guardrail_trace = first_trace_data.get("trace", {}).get("guardrailTrace", {})
         action = guardrail_trace.get("action", "NONE")
+        agent_metrics.record_guardrail_action("post", action)
 
         # Get first and last timestamp
         first_timestamp = first_event.get("timestamp", datetime.now().isoformat())
@@ -1001,6 +1014,7 @@ def handle_failure(trace_data: Dict[str, Any], parent_span):
     failure_trace = trace_data.get("trace", {}).get("failureTrace", {})
     trace_id = failure_trace.get("traceId", "unknown")
     failure_reason = failure_trace.get("failureReason", "Unknown failure")
+    agent_metrics.record_error("AgentProcessingFailure")
 
     # Create L2 failure span
     with tracer.start_as_current_span(
@@ -1103,6 +1117,7 @@ def handle_guardrail_intervention(trace_data: Dict[str, Any], parent_span):
     guardrail_trace = trace_data.get("trace", {}).get("guardrailTrace", {})
     trace_id = guardrail_trace.get("traceId", "unknown")
     action = guardrail_trace.get("action", "UNKNOWN")
+    agent_metrics.record_guardrail_action("pre" if "pre" in trace_id else "post", action)
 
     # Create L2 guardrail intervention span
     with tracer.start_as_current_span(
@@ -1355,6 +1370,7 @@ def handle_guardrail_pre(trace_data: Dict[str, Any], parent_span):
     guardrail_trace = trace_data.get("trace", {}).get("guardrailTrace", {})
     trace_id = guardrail_trace.get("traceId", "unknown")
     action = guardrail_trace.get("action", "NONE")
+    agent_metrics.record_guardrail_action("pre", action)
 
     # Create L2 guardrail_pre span - completely separate from preprocessing
     with tracer.start_as_current_span(
@@ -1407,6 +1423,7 @@ def handle_guardrail_post(trace_data: Dict[str, Any], parent_span):
     guardrail_trace = trace_data.get("trace", {}).get("guardrailTrace", {})
     trace_id = guardrail_trace.get("traceId", "unknown")
     action = guardrail_trace.get("action", "NONE")
+    agent_metrics.record_guardrail_action("post", action)
 
     # Create L2 guardrail_post span
     with tracer.start_as_current_span(
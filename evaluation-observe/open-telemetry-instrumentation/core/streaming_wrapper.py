@@ -15,6 +15,7 @@ from opentelemetry import trace
 from opentelemetry.trace import Status, StatusCode
 
 from .constants import SpanAttributes
+from agent_telemetry.metrics import agent_metrics
 
 # Add this import
 from .agent import process_trace_event
@@ -46,6 +47,9 @@ class AgentStreamingWrapper(ObjectProxy):
         self._completion_data = {"chunks": [], "traces": []}
         self._chunk_count = 0
         self._current_chunk = ""  # Current chunk for association with traces
+        # The stream is consumed after the invocation returns, possibly while another
+        # invocation runs on this thread, so keep this invocation's metric attributes
+        self._metric_attributes = agent_metrics.invocation_attributes()
 
         # Record metadata in root span
         if self._root_span:
@@ -58,11 +62,13 @@ class AgentStreamingWrapper(ObjectProxy):
     def __iter__(self):
         """Process events while yielding them."""
         for event in self.__wrapped__:
-            self._process_event(event)
+            with agent_metrics.use_invocation_attributes(self._metric_attributes):
+                self._process_event(event)
             yield event
 
         # After all events are processed, handle end of stream
-        self._handle_end_of_stream()
+        with agent_metrics.use_invocation_attributes(self._metric_attributes):
+            self._handle_end_of_stream()
 
     def _handle_end_of_stream(self):
         """Handle the end of the stream."""
@@ -156,6 +162,11 @@ class AgentStreamingWrapper(ObjectProxy):
                     try:
                         process_trace_event(event["trace"], self._root_span)
                     except Exception as e:
+                        agent_metrics.record_error(
+                            e.__class__.__name__,
+                            step="trace_processing",
+                            attributes=self._metric_attributes,
+                        )
                         logger.error(
                             f"Error processing trace event in streaming: {str(e)}",
                             exc_info=True,
@@ -179,6 +190,9 @@ def wrap_streaming_response(response, root_span=None):
     if not isinstance(response, dict) or "completion" not in response:
         return response
 
+    # Captured now, while still inside the invocation that produced this stream
+    metric_attributes = agent_metrics.invocation_attributes()
+
     def on_stream_complete(completion_data):
         """Callback when stream is complete."""
         try:
@@ -203,7 +217,16 @@ def wrap_streaming_response(response, root_span=None):
                     time.time(),
                     datetime.now(timezone.utc).replace(tzinfo=None).isoformat(),
                 )
-                root_span.set_attribute(SpanAttributes.LANGFUSE_END_TIME, end_time_iso)
+                root_span.set_attribute(SpanAttributes.SPAN_END_TIME, end_time_iso)
+
+                # Record end-to-end latency, measured from the invocation start
+                invoke_started = root_span.attributes.get("invoke_started_timestamp")
+                if invoke_started:
+                    agent_metrics.record_agent_duration(
+                        round((end_timestamp - invoke_started) * 1000, 2),
+                        streaming=True,
+                        attributes=metric_attributes,
+                    )
 
                 # Set final status
                 root_span.set_status(Status(StatusCode.OK))
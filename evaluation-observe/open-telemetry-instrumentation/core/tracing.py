@@ -129,5 +129,19 @@ def flush_telemetry():
                     processor.force_flush(300)
                 except Exception as e:
                     logger.warning(f"Error during explicit processor flush: {e}")
+
+        # Write out spans buffered by local file exporters (e.g. Parquet)
+        from agent_telemetry.exporters import flush_file_exporters
+
+        if not flush_file_exporters():
+            logger.warning("🔶 Writing local span files failed")
+
+        # Flush metrics as well, if a MeterProvider was configured
+        from opentelemetry import metrics
+
+        meter_provider = metrics.get_meter_provider()
+        if hasattr(meter_provider, "force_flush"):
+            if not meter_provider.force_flush(timeout_millis=30000):
+                logger.warning("🔶 Metrics flush timed out or failed")
     except Exception as e:
         logger.error(f"🔴 Error flushing telemetry: {str(e)}", exc_info=True)
\ No newline at end of file
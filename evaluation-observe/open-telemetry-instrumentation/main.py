@@ -121,6 +121,7 @@ if __name__ == "__main__":
         langfuse_api_url=langfuse_api_url,
         streaming=streaming,
         model_id=agent_model_id,
+        exporters=config.get("exporters"),  # e.g. ["otlp_http", {"type": "file", "format": "parquet"}]
     )
 
     # Handle the response appropriately based on streaming mode
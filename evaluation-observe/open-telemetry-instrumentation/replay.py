@@ -0,0 +1,246 @@
+"""
+Offline replay of recorded Bedrock Agent trace events through the instrumentation.
+
+Feeds recorded `invoke_agent` trace events through `process_trace_event` (batch mode)
+or `AgentStreamingWrapper` (streaming mode) with spans captured by an in-memory
+exporter, so the instrumentation can be exercised and benchmarked without a live agent.
+
+Supported recordings:
+- `trace_logs.json` written with `SAVE_TRACE_LOGS=True` (JSON objects separated by `---`)
+- the `json_trace` files written by `agents-and-function-calling/bedrock-agents/test-agent`
+- a JSON list of trace events, or of `invoke_agent` completion events
+
+Usage:
+    python replay.py replay_fixtures/sample_trace_logs.json --iterations 200
+    python replay.py trace_logs.json --streaming --allocations
+"""
+
+import argparse
+import copy
+import json
+import logging
+import statistics
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Any, Dict, List
+
+from opentelemetry import trace
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+from core import agent
+from core.agent import process_trace_event, span_manager, guardrail_buffer
+from core.handlers import process_guardrail_buffer, set_tracer
+from core.streaming_wrapper import AgentStreamingWrapper
+from core.timer_lib import timer
+
+# Order in which test-agent json_trace step keys were emitted by the agent
+JSON_TRACE_STEP_KEYS = ["modelInvocationInput", "modelInvocationOutput", "rationale", "invocationInput", "observation"]
+
+_exporter = None
+
+
+def get_in_memory_exporter() -> InMemorySpanExporter:
+    """Attach an InMemorySpanExporter to the global TracerProvider (created if needed)"""
+    global _exporter
+    if _exporter is None:
+        provider = trace.get_tracer_provider()
+        if not isinstance(provider, TracerProvider):
+            provider = TracerProvider()
+            trace.set_tracer_provider(provider)
+        _exporter = InMemorySpanExporter()
+        provider.add_span_processor(SimpleSpanProcessor(_exporter))
+        set_tracer(agent.tracer)
+    return _exporter
+
+
+def _restore_event_time(trace_event: Dict[str, Any]) -> Dict[str, Any]:
+    """Recordings store eventTime as an ISO string; the instrumentation expects a datetime"""
+    event_time = trace_event.get("eventTime")
+    if isinstance(event_time, str):
+        try:
+            trace_event["eventTime"] = datetime.fromisoformat(event_time)
+        except ValueError:
+            del trace_event["eventTime"]
+    return trace_event
+
+
+def _from_json_trace(json_trace: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Convert a test-agent json_trace ({"Step_0": {...}, ...}) into orchestration trace events"""
+    events = []
+    steps = sorted(
+        (key for key in json_trace if key.startswith("Step_")),
+        key=lambda key: int(key.split("_", 1)[1]),
+    )
+    for step in steps:
+        for key in JSON_TRACE_STEP_KEYS:
+            if key in json_trace[step]:
+                events.append({"trace": {"orchestrationTrace": {key: json_trace[step][key]}}})
+    return events
+
+
+def load_trace_events(path: str) -> List[Dict[str, Any]]:
+    """
+    Load recorded trace events in the format passed to process_trace_event
+    (the `trace` member of each invoke_agent completion event).
+    """
+    with open(path) as f:
+        content = f.read()
+
+    if "\n---\n" in content or content.rstrip().endswith("---"):
+        events = [json.loads(part) for part in content.split("\n---\n") if part.strip() and part.strip() != "---"]
+    else:
+        data = json.loads(content)
+        if isinstance(data, dict) and any(key.startswith("Step_") for key in data):
+            events = _from_json_trace(data)
+        elif isinstance(data, list):
+            # Full completion events carry the trace event under "trace"; skip chunks
+            events = [
+                event["trace"] if "trace" in event and "trace" in event["trace"] else event
+                for event in data
+                if "chunk" not in event
+            ]
+        else:
+            raise ValueError(f"Unrecognized trace recording format: {path}")
+
+    return [_restore_event_time(event) for event in events]
+
+
+class RecordedEventStream:
+    """Stands in for the botocore EventStream that AgentStreamingWrapper proxies"""
+
+    def __init__(self, events: List[Dict[str, Any]]):
+        self._events = events
+
+    def __iter__(self):
+        return iter(self._events)
+
+
+def _reset_state():
+    span_manager.reset()
+    guardrail_buffer.clear()
+    timer.reset_all()
+
+
+def _root_span(streaming: bool):
+    return agent.tracer.start_span(
+        name="Bedrock Agent: replay",
+        attributes={
+            "agent.id": "replay",
+            "agent.alias_id": "replay",
+            "stream_mode": streaming,
+            "metadata.streaming": streaming,
+        },
+    )
+
+
+def replay_once(events: List[Dict[str, Any]], streaming: bool = False) -> List[int]:
+    """
+    Replay one recorded invocation and return the per-event processing time in ns.
+
+    The events are deep-copied first since processing annotates them in place.
+    """
+    events = copy.deepcopy(events)
+    _reset_state()
+    durations = []
+    root_span = _root_span(streaming)
+
+    if streaming:
+        wrapper = AgentStreamingWrapper(
+            RecordedEventStream([{"trace": event} for event in events]), root_span=root_span
+        )
+        iterator = iter(wrapper)
+        while True:
+            start = time.perf_counter_ns()
+            try:
+                next(iterator)
+            except StopIteration:
+                break
+            durations.append(time.perf_counter_ns() - start)
+    else:
+        for event in events:
+            start = time.perf_counter_ns()
+            process_trace_event(event, root_span)
+            durations.append(time.perf_counter_ns() - start)
+        process_guardrail_buffer(guardrail_buffer, root_span)
+
+    span_manager.reset()
+    root_span.end()
+    return durations
+
+
+def measure_allocations(events: List[Dict[str, Any]], streaming: bool = False) -> Dict[str, float]:
+    """Replay once under tracemalloc and report the memory retained per event and the peak traced memory"""
+    events = copy.deepcopy(events)
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        replay_once(events, streaming)
+        after = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    retained = sum(stat.size_diff for stat in after.compare_to(before, "filename") if stat.size_diff > 0)
+    return {
+        "retained_kb_per_event": retained / 1024 / max(1, len(events)),
+        "peak_kb": peak / 1024,
+    }
+
+
+def run_replay(
+    events: List[Dict[str, Any]],
+    iterations: int = 100,
+    warmup: int = 5,
+    streaming: bool = False,
+    allocations: bool = False,
+) -> Dict[str, Any]:
+    """Replay the recording `iterations` times and summarize the per-event overhead"""
+    exporter = get_in_memory_exporter()
+    for _ in range(warmup):
+        replay_once(events, streaming)
+    exporter.clear()
+
+    durations = []
+    wall_start = time.perf_counter()
+    for _ in range(iterations):
+        durations.extend(replay_once(events, streaming))
+    wall_seconds = time.perf_counter() - wall_start
+
+    durations_us = sorted(d / 1000 for d in durations)
+    quantiles = statistics.quantiles(durations_us, n=100) if len(durations_us) > 1 else durations_us * 99
+    report = {
+        "events": len(durations),
+        "spans": len(exporter.get_finished_spans()),
+        "events_per_sec": len(durations) / wall_seconds if wall_seconds else 0.0,
+        "p50_us": quantiles[49],
+        "p99_us": quantiles[98],
+        "max_us": durations_us[-1] if durations_us else 0.0,
+    }
+    exporter.clear()
+    if allocations:
+        report.update(measure_allocations(events, streaming))
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded Bedrock Agent traces through the instrumentation")
+    parser.add_argument("recordings", nargs="+", help="Recorded trace files")
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--streaming", action="store_true", help="Replay through AgentStreamingWrapper")
+    parser.add_argument("--allocations", action="store_true", help="Also measure allocations with tracemalloc")
+    args = parser.parse_args()
+
+    # The instrumentation re-starts spans on purpose; keep the SDK's warnings out of the report
+    logging.getLogger("opentelemetry.sdk.trace").setLevel(logging.ERROR)
+
+    for path in args.recordings:
+        events = load_trace_events(path)
+        report = run_replay(events, args.iterations, args.warmup, args.streaming, args.allocations)
+        print(f"{path}: {json.dumps({k: round(v, 2) for k, v in report.items()})}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,15 @@
 from pydantic import BaseModel, Field, ConfigDict
 from typing import List, Optional, Union
 from enum import Enum
+from string import Formatter
 import pandas as pd
 import json
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 
 class ModelType(Enum):
     CLAUDE = "claude"
@@ -171,13 +177,60 @@ def generate_record_id(index: int, prefix: str = "REC") -> str:
     """Generate an 11 character alphanumeric record ID."""
     return f"{prefix}{str(index).zfill(8)}"
 
+RECORD_ID_PLACEHOLDER = "\x00record_id\x00"
+TEXT_PLACEHOLDER = "\x00text\x00"
+
+
+def _dumps(obj) -> bytes:
+    return orjson.dumps(obj) if orjson is not None else json.dumps(obj).encode()
+
+
+def _record_fragments(model_type: ModelType, config: BaseGenerationConfig) -> Optional[List[bytes]]:
+    """
+    Serialize a record once with placeholder id/text and split it into the bytes around them,
+    so records sharing `config` can be built by concatenation. None if the split isn't possible.
+    """
+    record = {
+        "recordId": RECORD_ID_PLACEHOLDER,
+        "modelInput": get_request_body(text=TEXT_PLACEHOLDER, model_type=model_type, config=config),
+    }
+    body = _dumps(record)
+    record_id, text = _dumps(RECORD_ID_PLACEHOLDER), _dumps(TEXT_PLACEHOLDER)
+    if body.count(record_id) != 1 or body.count(text) != 1 or body.index(record_id) > body.index(text):
+        return None
+    head, rest = body.split(record_id)
+    middle, tail = rest.split(text)
+    return [head, middle, tail + b"\n"]
+
+
+def render_prompts(df: pd.DataFrame, template: str) -> pd.Series:
+    """
+    Format `template` (str.format syntax) with the columns of `df`. The template is parsed once and whole
+    columns are concatenated; conversions/format specs (e.g. {x!r}, {x:>5}) fall back to formatting per row.
+    """
+    parts = list(Formatter().parse(template))
+    if any(field is not None and (spec or conversion or not field.isidentifier())
+           for _, field, spec, conversion in parts):
+        return pd.Series([template.format(**r) for r in df.to_dict("records")], index=df.index)
+
+    result = pd.Series("", index=df.index, dtype=object)
+    for literal, field, _, _ in parts:
+        if literal:
+            result = result + literal
+        if field is not None:
+            result = result + df[field].map(str)
+    return result
+
+
 def dataframe_to_jsonl(
     df: pd.DataFrame,
     model_type: ModelType,
     output_file: str,
     text_column: str = "text",
     record_id_column: Optional[str] = None,
-    base_config: Optional[BaseGenerationConfig] = None
+    base_config: Optional[BaseGenerationConfig] = None,
+    prompt_template: Optional[str] = None,
+    chunk_size: int = 10_000,
 ) -> None:
     """
     Convert a DataFrame to a JSONL file for batch inference.
@@ -189,32 +242,59 @@ def dataframe_to_jsonl(
         text_column: Name of the column containing input text
         record_id_column: Optional column name containing record IDs
         base_config: Default configuration to use for missing values
+        prompt_template: Optional str.format template filled from the DataFrame's columns, used instead of text_column
+        chunk_size: Number of records serialized and written at a time
+
+    Rows without per-row configuration values share one request body built from base_config, so only their
+    record ID and text are serialized; rows that override configuration columns are validated individually.
     """
     if base_config is None:
         base_config = BaseGenerationConfig()
-    
-    with open(output_file, 'w') as f:
-        for idx, row in df.iterrows():
-            # Get or generate record ID
-            record_id = str(row[record_id_column]) if record_id_column and record_id_column in row else generate_record_id(idx)
-            
-            # Create config from row data, falling back to base_config for missing values
-            config_dict = base_config.model_dump()
-            for field in config_dict.keys():
-                if field in row and pd.notna(row[field]):
-                    config_dict[field] = row[field]
-            
-            row_config = BaseGenerationConfig(**config_dict)
-            
-            # Create batch inference record
-            record = {
-                "recordId": record_id,
-                "modelInput": get_request_body(
-                    text=str(row[text_column]),
-                    model_type=model_type,
-                    config=row_config
-                )
-            }
-            
-            # Write to JSONL file
-            f.write(json.dumps(record) + '\n')
+
+    if prompt_template is not None:
+        texts = render_prompts(df, prompt_template)
+    else:
+        texts = df[text_column].map(str)
+
+    if record_id_column and record_id_column in df.columns:
+        record_ids = df[record_id_column].map(str)
+    else:
+        record_ids = pd.Series([generate_record_id(idx) for idx in df.index], index=df.index)
+
+    # rows with any configuration column set need their own (validated) config
+    base_dict = base_config.model_dump()
+    config_columns = [field for field in base_dict if field in df.columns]
+    overridden = df[config_columns].notna().any(axis=1) if config_columns else pd.Series(False, index=df.index)
+
+    fragments = _record_fragments(model_type, base_config)
+
+    with open(output_file, "wb") as f:
+        for start in range(0, len(df), chunk_size):
+            chunk = slice(start, start + chunk_size)
+            lines = []
+            for position, row_overridden, record_id, text in zip(
+                range(start, min(start + chunk_size, len(df))),
+                overridden.iloc[chunk], record_ids.iloc[chunk], texts.iloc[chunk]
+            ):
+                if not row_overridden and fragments is not None:
+                    head, middle, tail = fragments
+                    lines.append(head + _dumps(record_id) + middle + _dumps(text) + tail)
+                    continue
+
+                # Create config from row data, falling back to base_config for missing values
+                config_dict = dict(base_dict)
+                row = df.iloc[position]
+                for field in config_columns:
+                    if pd.notna(row[field]):
+                        config_dict[field] = row[field]
+                record = {
+                    "recordId": record_id,
+                    "modelInput": get_request_body(
+                        text=text,
+                        model_type=model_type,
+                        config=BaseGenerationConfig(**config_dict)
+                    )
+                }
+                lines.append(_dumps(record) + b"\n")
+
+            f.write(b"".join(lines))
@@ -7,4 +7,6 @@ const app = new cdk.App();
 new BedrockBatchOrchestratorStack(app, 'BedrockBatchOrchestratorStack', {
     bedrockBatchInferenceMaxConcurrency: app.node.tryGetContext('bedrockBatchInferenceMaxConcurrency')!,  // required in cdk.json
     bedrockBatchInferenceTimeoutHours: app.node.tryGetContext('bedrockBatchInferenceTimeoutHours'),
+    bedrockBatchInferenceMaxRetryRounds: app.node.tryGetContext('bedrockBatchInferenceMaxRetryRounds'),
+    bedrockBatchInferenceMaxConcurrentJobs: app.node.tryGetContext('bedrockBatchInferenceMaxConcurrentJobs'),
 });
@@ -40,8 +40,17 @@ class JobConfig(TypedDict):
 
 
 class JobConfigList(TypedDict):
-    """A collection of configurations for multiple batch processing jobs."""
+    """
+    A collection of configurations for multiple batch processing jobs.
+    Output from preprocess.py and regroup_retries.py; the remaining keys are passed through the step function
+    so that failed records can be regrouped into retry jobs.
+    """
     jobs: List[JobConfig]
+    job_name_prefix: str
+    model_id: str
+    max_records_per_job: int
+    retry_round: int
+    output_parquet_paths: Optional[List[str]]
 
 
 class TaskItem(TypedDict):
@@ -56,6 +65,8 @@ class TaskItem(TypedDict):
     """
     job_arn: str
     model_id: str
+    # model id from the job input; model_id is replaced by the model ARN on status updates
+    requested_model_id: str
     input_parquet_path: str
     s3_uri_output: str
     status: Optional[Literal['Submitted', 'InProgress', 'Completed', 'Failed', 'Stopping', 'Stopped', 'PartiallyCompleted', 'Expired', 'Validating', 'Scheduled']]
@@ -68,4 +79,15 @@ class CompletedJobsList(TypedDict):
     completed_jobs: List[TaskItem]
 
 
+class PostprocessOutput(TypedDict):
+    """
+    Output from postprocess.py for each job.
+    retry_path points to a parquet manifest of the job's failed input records (None if all succeeded).
+    """
+    output_path: Optional[str]
+    retry_path: Optional[str]
+    num_succeeded: int
+    num_failed: int
+
+
 
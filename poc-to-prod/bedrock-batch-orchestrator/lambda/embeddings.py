@@ -0,0 +1,127 @@
+import json
+from typing import Dict, List, Literal, Optional, Sequence
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+"""
+Compact columnar storage for embedding outputs.
+
+Vectors are stored as an Arrow FixedSizeList column of float32 (or float16 / int8) values instead of
+lists of Python floats, and the schema metadata records the column, dimension and dtype so readers can
+reshape the values buffer directly into a NumPy (n, d) array.
+
+int8 vectors are quantized symmetrically per vector: q = round(v / max(|v|) * 127), with max(|v|) stored
+in a float32 `<column>_scale` column. `read_embeddings` dequantizes them unless `dequantize=False`.
+"""
+
+EmbeddingDType = Literal['float32', 'float16', 'int8']
+
+METADATA_KEY = b'embeddings'
+INT8_MAX = 127
+
+
+def quantize_int8(vectors: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Symmetric per-vector int8 quantization. Returns (int8 values, float32 scales)"""
+    scales = np.abs(vectors).max(axis=1).astype(np.float32)
+    safe_scales = np.where(scales > 0, scales, 1.0).astype(np.float32)
+    quantized = np.rint(vectors / safe_scales[:, None] * INT8_MAX).astype(np.int8)
+    return quantized, scales
+
+
+def embeddings_to_arrow(
+    embeddings: Sequence[Optional[Sequence[float]]],
+    dtype: EmbeddingDType = 'float32',
+) -> tuple[pa.FixedSizeListArray, Optional[pa.Array], int]:
+    """
+    Convert a sequence of vectors (None for missing) to a FixedSizeList array.
+    Returns (vectors, int8 scales or None, dimension).
+    """
+    present = [i for i, vector in enumerate(embeddings) if vector is not None]
+    dim = len(embeddings[present[0]]) if present else 0
+    matrix = np.zeros((len(embeddings), dim), dtype=np.float32)
+    if present:
+        matrix[present] = np.asarray([embeddings[i] for i in present], dtype=np.float32)
+    mask = None
+    if len(present) < len(embeddings):
+        mask = np.ones(len(embeddings), dtype=bool)
+        mask[present] = False
+
+    scales = None
+    if dtype == 'int8':
+        matrix, scale_values = quantize_int8(matrix)
+        scales = pa.array(scale_values, mask=mask)
+    elif dtype == 'float16':
+        matrix = matrix.astype(np.float16)
+    elif dtype != 'float32':
+        raise ValueError(f'Unsupported embedding dtype: {dtype}')
+
+    vectors = pa.FixedSizeListArray.from_arrays(
+        pa.array(matrix.ravel()), dim, mask=pa.array(mask) if mask is not None else None
+    )
+    return vectors, scales, dim
+
+
+def embedding_table(records: List[Dict], column: str = 'embedding', dtype: EmbeddingDType = 'float32') -> pa.Table:
+    """Build a table from processed output records, storing `column` as a FixedSizeList with dimension metadata"""
+    vectors, scales, dim = embeddings_to_arrow([r.get(column) for r in records], dtype)
+    others = {key: [r.get(key) for r in records] for key in records[0] if key != column} if records else {}
+
+    table = pa.table(others)
+    table = table.append_column(column, vectors)
+    if scales is not None:
+        table = table.append_column(f'{column}_scale', scales)
+    metadata = {'column': column, 'dim': dim, 'dtype': dtype}
+    return table.replace_schema_metadata({METADATA_KEY: json.dumps(metadata).encode()})
+
+
+def embedding_metadata(schema: pa.Schema) -> Dict:
+    """The column/dim/dtype metadata written by embedding_table"""
+    if not schema.metadata or METADATA_KEY not in schema.metadata:
+        raise ValueError('No embedding metadata in schema')
+    return json.loads(schema.metadata[METADATA_KEY])
+
+
+def read_embeddings(path: str, dequantize: bool = True) -> np.ndarray:
+    """
+    Read the embedding column of a local Parquet or Arrow IPC file into a NumPy (n, d) array.
+
+    Arrow IPC files (see `parquet_to_ipc`) are memory-mapped and returned without copying. Parquet files are
+    memory-mapped and decoded straight into Arrow buffers; neither path creates per-row Python objects.
+    Rows with missing vectors are zero-filled.
+    """
+    if path.endswith(('.arrow', '.feather', '.ipc')):
+        with pa.memory_map(path) as source:
+            table = pa.ipc.open_file(source).read_all()
+    else:
+        schema = pq.read_schema(path)
+        meta = embedding_metadata(schema)
+        columns = [meta['column']] + ([f"{meta['column']}_scale"] if meta['dtype'] == 'int8' else [])
+        table = pq.read_table(path, columns=columns, memory_map=True)
+
+    meta = embedding_metadata(table.schema)
+    dim = meta['dim']
+    column = table.column(meta['column'])
+    # .values keeps the slots of null vectors (unlike flatten), so rows stay aligned
+    chunks = [chunk.values.slice(chunk.offset * dim, len(chunk) * dim) for chunk in column.chunks]
+    values = chunks[0] if len(chunks) == 1 else pa.concat_arrays(chunks)
+    matrix = values.to_numpy(zero_copy_only=False).reshape(-1, dim)
+    if column.null_count:
+        matrix = matrix.copy()
+        matrix[column.is_null().to_numpy(zero_copy_only=False)] = 0
+
+    if meta['dtype'] == 'int8' and dequantize:
+        scales = table.column(f"{meta['column']}_scale").to_numpy(zero_copy_only=False)
+        matrix = matrix.astype(np.float32) * (np.nan_to_num(scales).astype(np.float32)[:, None] / INT8_MAX)
+    return matrix
+
+
+def parquet_to_ipc(parquet_path: str, ipc_path: str) -> None:
+    """Convert an embeddings Parquet file to an uncompressed Arrow IPC file that read_embeddings can memory-map"""
+    parquet_file = pq.ParquetFile(parquet_path)
+    with pa.OSFile(ipc_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, parquet_file.schema_arrow) as writer:
+            for batch in parquet_file.iter_batches():
+                writer.write_batch(batch)
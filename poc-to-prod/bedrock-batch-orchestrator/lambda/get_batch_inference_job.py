@@ -14,7 +14,9 @@ task_table = dynamodb.Table(os.environ['TASK_TABLE'])
 
 sfn_client = boto3.client('stepfunctions')
 
-BATCH_INFERENCE_ERROR_STATES = ['Failed', 'Stopped', 'PartiallyCompleted', 'Expired']
+BATCH_INFERENCE_ERROR_STATES = ['Failed', 'Stopped', 'Expired']
+# jobs where some records failed: successful records are harvested by postprocess, failures go to a retry manifest
+BATCH_INFERENCE_PARTIAL_STATES = ['PartiallyCompleted']
 
 
 def lambda_handler(event, context) -> TaskItem:
@@ -25,7 +27,8 @@ def lambda_handler(event, context) -> TaskItem:
     Status updates fall into 3 categories:
     - In-Progress changes (e.g. Submitted -> Validating -> Running): these send "heartbeats" back to the SFN task
     - Failures (e.g. Failed, Stopped, Expired): these send task errors back to the task
-    - Success: sends a success back to the SFN
+    - Success (Completed, PartiallyCompleted): sends a success back to the SFN. Failed records of partially
+      completed jobs are written to a retry manifest by postprocess.py
 
     Also updates the DDB record with the latest status for visibility/monitoring purposes.
     """
@@ -51,6 +54,9 @@ def lambda_handler(event, context) -> TaskItem:
     task_item: TaskItem = {
         'job_arn': job_arn,
         'model_id': job_details['modelId'],
+        # model id the job was submitted with, counted by planner.count_in_flight_jobs
+        # (items written before it was added still hold it in model_id until their first update)
+        'requested_model_id': task_item_ddb.get('requested_model_id', task_item_ddb['model_id']),
         'input_parquet_path': task_item_ddb['input_parquet_path'],
         's3_uri_output': task_item_ddb['s3_uri_output'],
         'status': job_status,
@@ -58,8 +64,8 @@ def lambda_handler(event, context) -> TaskItem:
         'task_token': task_token,
     }
     # send task response to async step function state
-    if job_status == 'Completed':
-        logger.info('Job completed successfully. Sending task success to step function.')
+    if job_status == 'Completed' or job_status in BATCH_INFERENCE_PARTIAL_STATES:
+        logger.info(f'Job finished with status {job_status}. Sending task success to step function.')
         sfn_client.send_task_success(
             taskToken=task_token,
             output=json.dumps(task_item),
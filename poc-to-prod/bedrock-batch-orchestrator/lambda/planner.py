@@ -0,0 +1,147 @@
+import math
+import os
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional, Tuple
+
+from boto3.dynamodb.conditions import Key
+
+
+"""
+Sizing of batch inference jobs and admission control for submitting them.
+
+Shards are sized from the estimated size of each request (bytes and tokens of the rendered JSONL records), the
+per-model batch inference quotas, and the number of jobs already in flight for the model in the DynamoDB task
+table, instead of fixed `max_records_per_job` chunks:
+- a job never exceeds the records / bytes (/ optional tokens) quotas for the model
+- when there are free concurrency slots, work is spread over more (smaller, but >= min records) jobs so the
+  dataset finishes sooner instead of waiting on a few large jobs
+
+Quotas default to the Bedrock defaults and can be overridden per account with environment variables.
+"""
+
+# rough token estimate for English text, used only for sizing
+CHARS_PER_TOKEN = 4
+
+# task table index on (requested_model_id, status), for counting the jobs in flight per model
+IN_FLIGHT_INDEX = 'requested_model_id-status-index'
+
+# job states that occupy a concurrency slot
+ACTIVE_JOB_STATES = ['Submitted', 'Validating', 'Scheduled', 'InProgress', 'Stopping']
+
+
+@dataclass
+class BatchQuota:
+    """Batch inference quotas for a model (see the Bedrock service quotas console for your account's values)"""
+    max_records_per_job: int = 50_000
+    min_records_per_job: int = 100
+    max_bytes_per_job: int = 1024 ** 3  # input file size
+    max_concurrent_jobs: int = 10
+    max_tokens_per_job: Optional[int] = None
+
+
+# per-model overrides of the defaults, matched by substring of the model id
+MODEL_QUOTAS: Dict[str, Dict] = {
+    'amazon.titan-embed-text-v2:0': {'max_bytes_per_job': 200 * 1024 ** 2},
+}
+
+
+def get_quota(model_id: str) -> BatchQuota:
+    quota = BatchQuota()
+    for model_key, overrides in MODEL_QUOTAS.items():
+        if model_key in model_id:
+            for key, value in overrides.items():
+                setattr(quota, key, value)
+
+    # account-level overrides
+    for field, env_var in [
+        ('max_records_per_job', 'QUOTA_MAX_RECORDS_PER_JOB'),
+        ('min_records_per_job', 'QUOTA_MIN_RECORDS_PER_JOB'),
+        ('max_bytes_per_job', 'QUOTA_MAX_BYTES_PER_JOB'),
+        ('max_concurrent_jobs', 'MAX_CONCURRENT_JOBS'),
+        ('max_tokens_per_job', 'QUOTA_MAX_TOKENS_PER_JOB'),
+    ]:
+        if os.getenv(env_var):
+            setattr(quota, field, int(os.environ[env_var]))
+    return quota
+
+
+@dataclass
+class RecordStats:
+    """Average size of the rendered JSONL records, estimated from a sample"""
+    avg_bytes: float
+    avg_tokens: float
+    num_sampled: int
+
+
+def estimate_record_stats(chunks: Iterable[Tuple[bytes, int]]) -> RecordStats:
+    """Estimate from (JSONL bytes, number of records) chunks of a rendered sample, see request_builder"""
+    total_bytes = 0
+    num_sampled = 0
+    for data, num_records in chunks:
+        total_bytes += len(data)
+        num_sampled += num_records
+    avg_bytes = total_bytes / max(num_sampled, 1)
+    return RecordStats(avg_bytes=avg_bytes, avg_tokens=avg_bytes / CHARS_PER_TOKEN, num_sampled=num_sampled)
+
+
+@dataclass
+class ShardPlan:
+    records_per_job: int
+    num_jobs: Optional[int]
+    free_slots: int
+
+
+def plan_shards(
+    quota: BatchQuota,
+    stats: RecordStats,
+    in_flight_jobs: int = 0,
+    num_records: Optional[int] = None,
+    max_records_per_job: Optional[int] = None,
+) -> ShardPlan:
+    """
+    Number of records per job for a dataset of `num_records` (None if unknown, e.g. for CSV inputs).
+
+    `max_records_per_job` (from the job input) is an upper bound on top of the quotas.
+    """
+    # 5% headroom on byte/token quotas since sizes are estimated from a sample
+    limits = [quota.max_records_per_job, math.floor(quota.max_bytes_per_job * 0.95 / max(stats.avg_bytes, 1))]
+    if quota.max_tokens_per_job:
+        limits.append(math.floor(quota.max_tokens_per_job * 0.95 / max(stats.avg_tokens, 1)))
+    if max_records_per_job:
+        limits.append(max_records_per_job)
+    records_per_job = max(min(limits), quota.min_records_per_job)
+
+    free_slots = max(quota.max_concurrent_jobs - in_flight_jobs, 1)
+    if num_records is None:
+        return ShardPlan(records_per_job=records_per_job, num_jobs=None, free_slots=free_slots)
+
+    num_jobs = math.ceil(num_records / records_per_job)
+    if num_jobs < free_slots:
+        # spread over the free slots, as long as each job keeps the minimum number of records
+        num_jobs = max(num_jobs, min(free_slots, num_records // quota.min_records_per_job))
+    num_jobs = max(num_jobs, 1)
+    records_per_job = math.ceil(num_records / num_jobs)
+    return ShardPlan(records_per_job=records_per_job, num_jobs=num_jobs, free_slots=free_slots)
+
+
+def count_in_flight_jobs(task_table, model_id: str) -> int:
+    """
+    Number of jobs for `model_id` in the task table that are still occupying a concurrency slot.
+
+    Counted on the (requested_model_id, status) index, with one COUNT query per active state: `model_id` is
+    overwritten by the model ARN on status updates, `requested_model_id` keeps the model id the job was submitted with.
+    """
+    count = 0
+    for status in ACTIVE_JOB_STATES:
+        query_kwargs = {
+            'IndexName': IN_FLIGHT_INDEX,
+            'KeyConditionExpression': Key('requested_model_id').eq(model_id) & Key('status').eq(status),
+            'Select': 'COUNT',
+        }
+        while True:
+            response = task_table.query(**query_kwargs)
+            count += response['Count']
+            if 'LastEvaluatedKey' not in response:
+                break
+            query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    return count
@@ -1,79 +1,228 @@
-from custom_types import TaskItem
-from processor import get_processor_for_model_id
+from custom_types import PostprocessOutput, TaskItem
+from processor import BaseProcessor, get_processor_for_model_id
 import utils
-from typing import List, Dict
+from typing import Dict, Iterable, Iterator, List, Optional
 import awswrangler as wr
-import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import orjson
+import s3fs
 import boto3
-import json
 import os
 
 
 logger = utils.get_logger()
 BUCKET_NAME = os.getenv('BUCKET_NAME')
+# number of output records parsed, joined and written per parquet row group
+OUTPUT_BATCH_SIZE: int = int(os.getenv('OUTPUT_BATCH_SIZE', 5000))
+# record-level error codes worth retrying (throttling, timeouts, server errors); others are kept for inspection only
+RETRYABLE_ERROR_CODES = {408, 424, 429, 500, 502, 503, 504}
 
 s3_client = boto3.client('s3')
+s3_fs = s3fs.S3FileSystem()
 
 
-def read_jsonl_from_s3(s3_uri: str) -> List[Dict]:
+def iter_jsonl_from_s3(s3_uri: str, chunk_size: int = 1024 * 1024) -> Iterator[Dict]:
+    """Stream a JSONL object from S3, parsing one line at a time"""
     bucket, key = utils.split_s3_uri(s3_uri)
-    object_body = s3_client.get_object(
+    body = s3_client.get_object(
         Bucket=bucket,
         Key=key,
-    )['Body'].read().decode('utf-8')
-
-    # Split on '}\n{' and restore the delimiters
-    chunks = object_body.split('}\n{')
-
-    # Restore the JSON structure for each chunk
-    if len(chunks) > 1:
-        chunks = [chunks[0] + '}'] + ['{' + chunk + '}' for chunk in chunks[1:-1]] + ['{' + chunks[-1]]
-
-    # Parse each chunk
-    data = [json.loads(chunk) for chunk in chunks]
+    )['Body']
+    for line in body.iter_lines(chunk_size=chunk_size):
+        if line.strip():
+            yield orjson.loads(line)
 
-    return data
 
-
-def lambda_handler(event: TaskItem, context):
+def read_jsonl_from_s3(s3_uri: str) -> List[Dict]:
+    return list(iter_jsonl_from_s3(s3_uri))
+
+
+def batched(records: Iterable[Dict], batch_size: int) -> Iterator[List[Dict]]:
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class RecordIndex:
+    """Input records held as an Arrow table with a record_id -> row hash index, for joining outputs batch by batch"""
+
+    def __init__(self, table: pa.Table):
+        self.table = table
+        # first occurrence wins if a record_id is duplicated
+        self.index: Dict[str, int] = {}
+        for row, record_id in enumerate(table.column('record_id').to_pylist()):
+            self.index.setdefault(record_id, row)
+        self.joined = bytearray(table.num_rows)
+
+    def unjoined_rows(self) -> List[int]:
+        """Rows of the input that no successful output was joined to"""
+        return [row for row in self.index.values() if not self.joined[row]]
+
+    def join(self, outputs: pa.Table) -> pa.Table:
+        """Inner join of processed outputs with the input rows on record_id"""
+        record_ids = outputs.column('record_id').to_pylist()
+        rows = [self.index.get(record_id) for record_id in record_ids]
+        matched = [i for i, row in enumerate(rows) if row is not None]
+        if len(matched) < len(rows):
+            logger.warning(f'{len(rows) - len(matched)} output records have no matching input record_id')
+            outputs = outputs.take(matched)
+            rows = [rows[i] for i in matched]
+
+        for row in rows:
+            self.joined[row] = 1
+        inputs = self.table.drop_columns(['record_id']).take(rows)
+        for name, column in zip(inputs.column_names, inputs.columns):
+            if name not in outputs.column_names:
+                outputs = outputs.append_column(name, column)
+        return outputs
+
+
+def is_failed_output(record: Dict) -> bool:
+    """Records that failed inside a batch job carry an `error` instead of a `modelOutput`"""
+    return 'error' in record or 'modelOutput' not in record
+
+
+def successful_outputs(records: Iterable[Dict], failures: Dict[str, Dict]) -> Iterator[Dict]:
+    """Yield successful output records, collecting the failed ones into `failures` by record id"""
+    for record in records:
+        if is_failed_output(record):
+            error = record.get('error') or {}
+            failures[record['recordId']] = {
+                'model_input': orjson.dumps(record['modelInput']).decode() if 'modelInput' in record else None,
+                'error_code': error.get('errorCode'),
+                'error_message': error.get('errorMessage', 'missing modelOutput'),
+            }
+        else:
+            yield record
+
+
+def retry_manifest(index: RecordIndex, failures: Dict[str, Dict]) -> Optional[pa.Table]:
+    """
+    Input rows without a successful output, with the original model input (as echoed in the job output) and
+    the error. Records missing from the output entirely have no model_input and are not retried.
+    """
+    rows = index.unjoined_rows()
+    if not rows:
+        return None
+    manifest = index.table.take(rows)
+    errors = [failures.get(record_id, {}) for record_id in manifest.column('record_id').to_pylist()]
+    error_codes = [error.get('error_code') for error in errors]
+    manifest = manifest.append_column('model_input', pa.array([e.get('model_input') for e in errors], pa.string()))
+    manifest = manifest.append_column('error_code', pa.array(error_codes, pa.int64()))
+    manifest = manifest.append_column(
+        'error_message', pa.array([e.get('error_message', 'missing from output') for e in errors], pa.string())
+    )
+    return manifest.append_column('retryable', pa.array(
+        [e.get('model_input') is not None and (code is None or code in RETRYABLE_ERROR_CODES)
+         for e, code in zip(errors, error_codes)],
+        pa.bool_(),
+    ))
+
+
+def _output_schema(table: pa.Table) -> pa.Schema:
+    """Schema of the first batch, with all-null columns widened to string so later batches can be cast to it"""
+    return pa.schema([
+        field.with_type(pa.string()) if pa.types.is_null(field.type) else field
+        for field in table.schema
+    ], metadata=table.schema.metadata)
+
+
+def write_joined_parquet(
+    output_records: Iterable[Dict],
+    processor: BaseProcessor,
+    index: RecordIndex,
+    sink,
+    batch_size: int = OUTPUT_BATCH_SIZE,
+) -> int:
+    """
+    Process model outputs incrementally, join them to the input records and write one parquet row group per batch.
+    Returns the number of rows written.
+    """
+    writer: Optional[pq.ParquetWriter] = None
+    schema: Optional[pa.Schema] = None
+    num_rows = 0
+    try:
+        for batch in batched(output_records, batch_size):
+            processed = [processor.process_output(r) for r in batch]
+            outputs = processor.outputs_to_arrow(processed, schema)
+            if schema is None:
+                schema = _output_schema(outputs)
+                outputs = outputs.cast(schema)
+
+            joined = index.join(outputs)
+            if writer is None:
+                writer = pq.ParquetWriter(sink, joined.schema, compression='snappy')
+            writer.write_table(joined.cast(writer.schema))
+            num_rows += joined.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+    return num_rows
+
+
+def lambda_handler(event: TaskItem, context) -> PostprocessOutput:
     """
     Bedrock batch inference jobs are returned as JSONL files. This postprocessing step is necessary for parsing
     the output files AND joining the result back to the original input record via a join with the record_id.
 
+    The output file is streamed line by line and processed, joined and written in batches of OUTPUT_BATCH_SIZE
+    records, so memory is bounded by the input table plus one batch.
+
+    Records that failed inside the job (e.g. of a PartiallyCompleted job) are left out of the output and written
+    with their error to a retry manifest, which regroup_retries.py turns into new batch jobs.
+
     Final outputs are saved as Parquet files at the returned S3 paths.
     """
 
     logger.info(f'Postprocessing job:\n{event}')
 
-    if not event['error_message']:
-        processor = get_processor_for_model_id(event['model_id'])
-        input_df = wr.s3.read_parquet(event['input_parquet_path'])
-
-        output_prefix = os.path.join(event['s3_uri_output'], event['job_arn'].split('/')[-1])
-        logger.info(f'Retrieving model output from {output_prefix}')
-        model_output_uri = next(iter(wr.s3.list_objects(
-            path=output_prefix,
-            suffix='.jsonl.out',
-        )))
-        logger.info(f'Output URI: {model_output_uri}')
-        output_records = read_jsonl_from_s3(model_output_uri)
-        processed_outputs = [processor.process_output(r) for r in output_records]
-
-        output_df = pd.DataFrame(processed_outputs).merge(input_df, on='record_id')
-        output_parquet_path = os.path.join(f's3://{BUCKET_NAME}/batch_output_parquet/', *event['input_parquet_path'].split('/')[-2:])
-        logger.info(f'Saving output parquet to {output_parquet_path}')
-
-        wr.s3.to_parquet(
-            output_df,
-            output_parquet_path,
-            index=False,
-            compression='snappy',
-        )
-    else:
-        # if an error occurred, skip processing
+    if event['error_message']:
+        # if the job failed as a whole, skip processing
+        return {'output_path': None, 'retry_path': None, 'num_succeeded': 0, 'num_failed': 0}
+
+    processor = get_processor_for_model_id(event['model_id'])
+    with s3_fs.open(event['input_parquet_path'], 'rb') as f:
+        index = RecordIndex(pq.read_table(f))
+
+    output_prefix = os.path.join(event['s3_uri_output'], event['job_arn'].split('/')[-1])
+    logger.info(f'Retrieving model output from {output_prefix}')
+    model_output_uri = next(iter(wr.s3.list_objects(
+        path=output_prefix,
+        suffix='.jsonl.out',
+    )))
+    logger.info(f'Output URI: {model_output_uri}')
+
+    job_path = event['input_parquet_path'].split('/')[-2:]
+    output_parquet_path = os.path.join(f's3://{BUCKET_NAME}/batch_output_parquet/', *job_path)
+    logger.info(f'Saving output parquet to {output_parquet_path}')
+
+    failures: Dict[str, Dict] = {}
+    with s3_fs.open(output_parquet_path, 'wb') as sink:
+        outputs = successful_outputs(iter_jsonl_from_s3(model_output_uri), failures)
+        num_succeeded = write_joined_parquet(outputs, processor, index, sink)
+    logger.info(f'Wrote {num_succeeded} records')
+    if not num_succeeded:
+        s3_fs.rm(output_parquet_path)
         output_parquet_path = None
 
+    # harvest failed records (e.g. from PartiallyCompleted jobs) into a retry manifest
+    retry_path = None
+    manifest = retry_manifest(index, failures)
+    if manifest is not None:
+        retry_path = os.path.join(f's3://{BUCKET_NAME}/retry_manifests/', *job_path)
+        logger.info(f'{manifest.num_rows} records failed, saving retry manifest to {retry_path}')
+        with s3_fs.open(retry_path, 'wb') as sink:
+            pq.write_table(manifest, sink, compression='snappy')
+
     return {
         'output_path': output_parquet_path,
+        'retry_path': retry_path,
+        'num_succeeded': num_succeeded,
+        'num_failed': manifest.num_rows if manifest is not None else 0,
     }
-
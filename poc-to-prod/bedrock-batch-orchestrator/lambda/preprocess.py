@@ -1,30 +1,153 @@
 import utils
 from custom_types import JobInput, JobConfig, JobConfigList
 from processor import get_processor_for_model_id
+import planner
 import prompt_templates as pt
+import request_builder
 import awswrangler as wr
 import boto3
-from typing import List, Dict
+import itertools
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 import os
-import json
 from uuid import uuid4
 from datasets import load_dataset
 import pandas as pd
 
 
-MAX_RECORDS_PER_JOB: int = os.getenv('MAX_RECORDS_PER_JOB', 1000)
+MAX_RECORDS_PER_JOB: int = int(os.getenv('MAX_RECORDS_PER_JOB', 1000))
 BUCKET_NAME = os.getenv('BUCKET_NAME')
+# multipart upload part size for the JSONL job inputs; bounds preprocessing memory together with the chunk size
+JSONL_PART_SIZE_MB: int = int(os.getenv('JSONL_PART_SIZE_MB', 8))
+# number of input rows rendered to estimate the size of each request when planning jobs
+PLANNER_SAMPLE_SIZE: int = int(os.getenv('PLANNER_SAMPLE_SIZE', 1000))
+# number of job input chunks templated and uploaded concurrently (and fetched ahead of them)
+PREPROCESS_CONCURRENCY: int = int(os.getenv('PREPROCESS_CONCURRENCY', 4))
 
 s3_client = boto3.client('s3')
+dynamodb = boto3.resource('dynamodb')
 
 logger = utils.get_logger()
 
 
-def write_jsonl_to_s3(records: List[Dict], key: str) -> str:
-    """write a JSONL file to S3 from a list of dicts. Returns the S3 URI"""
-    jsonl_data = '\n'.join(json.dumps(item) for item in records)
-    s3_client.put_object(Bucket=BUCKET_NAME, Key=key, Body=jsonl_data)
-    return f's3://{BUCKET_NAME}/{key}'
+def write_jsonl_to_s3(chunks: Iterable[Tuple[bytes, int]], key: str) -> str:
+    """
+    Stream a JSONL file to S3 from chunks of serialized records (see request_builder.build_batch_inputs).
+    Returns the S3 URI
+    """
+    with utils.S3JsonlWriter(s3_client, BUCKET_NAME, key, part_size=JSONL_PART_SIZE_MB * 1024 * 1024) as writer:
+        for data, num_records in chunks:
+            writer.write_lines(data, num_records)
+    return writer.uri
+
+
+def batch_input_chunks(input_df: pd.DataFrame, processor, prompt_id: str = None) -> Iterator[Tuple[bytes, int]]:
+    """Serialized batch inference records for a chunk of input rows"""
+    # for text models, the input df must have columns that match the formatting keys in the prompt
+    template = pt.prompt_id_to_template[prompt_id] if processor.model_type != 'embedding' else None
+    return request_builder.build_batch_inputs(input_df, processor, template)
+
+
+def with_record_ids(input_df: pd.DataFrame) -> pd.DataFrame:
+    """Add a record_id to each row to allow for joining with outputs later"""
+    if 'record_id' not in input_df.columns:
+        input_df['record_id'] = [str(uuid4()) for _ in range(len(input_df))]
+    if 'Unnamed: 0' in input_df.columns:
+        input_df = input_df.drop(columns=['Unnamed: 0'])
+    return input_df
+
+
+def plan_jobs(
+    sample_df: pd.DataFrame,
+    num_records: Optional[int],
+    processor,
+    model_id: str,
+    prompt_id: str,
+    max_records_per_job: int,
+) -> planner.ShardPlan:
+    """Size the jobs from a rendered sample of the input, the model's batch quotas and the jobs already in flight"""
+    stats = planner.estimate_record_stats(batch_input_chunks(with_record_ids(sample_df), processor, prompt_id))
+
+    in_flight_jobs = 0
+    if task_table_name := os.getenv('TASK_TABLE'):
+        in_flight_jobs = planner.count_in_flight_jobs(dynamodb.Table(task_table_name), model_id)
+
+    plan = planner.plan_shards(
+        quota=planner.get_quota(model_id),
+        stats=stats,
+        in_flight_jobs=in_flight_jobs,
+        num_records=num_records,
+        max_records_per_job=max_records_per_job,
+    )
+    logger.info(
+        f'Planned {plan.num_jobs or "?"} jobs of {plan.records_per_job} records '
+        f'(~{stats.avg_bytes:.0f} bytes / ~{stats.avg_tokens:.0f} tokens per record, '
+        f'{num_records or "unknown"} records, {in_flight_jobs} jobs in flight)'
+    )
+    return plan
+
+
+def hf_num_records(dataset, split: str) -> Optional[int]:
+    """Number of rows of a streamed huggingface split, if the dataset card declares it"""
+    splits = getattr(dataset.info, 'splits', None) or {}
+    return splits[split].num_examples if split in splits else None
+
+
+def prepare_job(idx: int, input_df: pd.DataFrame, event: JobInput, processor) -> JobConfig:
+    """Write the parquet sidecar and the JSONL batch input of one job from an in-memory chunk of input rows"""
+    job_name_prefix = event['job_name_prefix']
+    input_parquet_path = f's3://{BUCKET_NAME}/batch_inputs_parquet/{job_name_prefix}/{str(idx).zfill(4)}.snappy.parquet'
+    input_key = f'batch_inputs_json/{job_name_prefix}/{str(idx).zfill(4)}.jsonl'
+    output_path = f's3://{BUCKET_NAME}/batch_outputs_json/{job_name_prefix}/{str(idx).zfill(4)}/'
+
+    input_df = with_record_ids(input_df)
+    # save this file and keep in the config to allow for joins to the output by record id
+    wr.s3.to_parquet(input_df, path=input_parquet_path, index=False, compression='snappy')
+    s3_uri_input = write_jsonl_to_s3(batch_input_chunks(input_df, processor, event.get('prompt_id')), input_key)
+
+    return {
+        'model_id': event['model_id'],
+        'job_name': utils.create_job_name(job_name_prefix, index=idx),
+        'input_parquet_path': input_parquet_path,
+        's3_uri_input': s3_uri_input,
+        's3_uri_output': output_path,
+    }
+
+
+def prepare_jobs(
+    chunks: Iterable[Tuple[int, pd.DataFrame]],
+    event: JobInput,
+    processor,
+    concurrency: int = PREPROCESS_CONCURRENCY,
+) -> List[JobConfig]:
+    """
+    Pipeline the job inputs: chunks are fetched ahead in a background thread while up to `concurrency` chunks are
+    templated and uploaded (JSONL + parquet) in parallel. Memory is bounded by ~2 x `concurrency` chunks.
+    """
+    jobs: Dict[int, JobConfig] = {}
+    pending = {}
+
+    def collect(futures):
+        for future in futures:
+            jobs[pending.pop(future)] = future.result()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        try:
+            for idx, input_df in utils.prefetch(chunks, max_prefetch=concurrency):
+                if len(pending) >= concurrency:
+                    collect(wait(pending, return_when=FIRST_COMPLETED).done)
+                pending[executor.submit(prepare_job, idx, input_df, event, processor)] = idx
+            collect(wait(pending).done)
+        except BaseException:
+            for future in pending:
+                future.cancel()
+            raise
+    return [jobs[idx] for idx in sorted(jobs)]
+
+
+def iter_hf_chunks(dataset, records_per_job: int) -> Iterator[Tuple[int, pd.DataFrame]]:
+    for idx, batch in enumerate(dataset.batch(batch_size=records_per_job)):
+        yield idx, pd.DataFrame(batch)
 
 
 def lambda_handler(event: JobInput, context) -> JobConfigList:
@@ -50,6 +173,12 @@ def lambda_handler(event: JobInput, context) -> JobConfigList:
       "prompt_id": "joke_about_topic"
     }
 
+    Job sizes are planned by planner.py from a rendered sample of the input, the model's batch inference quotas and
+    the jobs already in flight (max_records_per_job is an upper bound).
+
+    Huggingface datasets (`dataset_id`, optional `split`) are streamed straight into job inputs. For both sources,
+    fetching the next chunk, prompt templating and the JSONL/parquet uploads overlap (see `prepare_jobs`).
+
     Returns a list of job configs which will be passed to the start_batch_inference_job.py function via a step function
     map, which manages concurrency of the requests.
     """
@@ -63,81 +192,42 @@ def lambda_handler(event: JobInput, context) -> JobConfigList:
     max_num_jobs = event.get('max_num_jobs')
     max_records_per_job = event.get('max_records_per_job', MAX_RECORDS_PER_JOB)
 
-    # huggingface datasets - load and import to S3
     if dataset_id := event.get('dataset_id'):
-        logger.info(f"Writing huggingface dataset {dataset_id} to S3")
-
-        s3_uri = f"s3://{BUCKET_NAME}/hf/{dataset_id}"
-        file_type = "parquet"
-
-        batched_ds = load_dataset(dataset_id, split=event.get('split', 'train'), streaming=True).batch(batch_size=max_records_per_job)
-        for idx, batch in enumerate(batched_ds):
-            df = pd.DataFrame(batch)
-            wr.s3.to_parquet(df, path=f"{s3_uri}/{str(idx).zfill(4)}.snappy.parquet", index=False, compression="snappy")
-
-            if max_num_jobs:
-                if idx >= max_num_jobs:
-                    break
+        # huggingface datasets - stream batches directly into job inputs
+        split = event.get('split', 'train')
+        logger.info(f"Streaming huggingface dataset {dataset_id} ({split})")
+        dataset = load_dataset(dataset_id, split=split, streaming=True)
+        sample_df = pd.DataFrame(list(dataset.take(PLANNER_SAMPLE_SIZE)))
+        plan = plan_jobs(
+            sample_df, hf_num_records(dataset, split), processor, model_id, event.get('prompt_id'), max_records_per_job
+        )
+        chunks = iter_hf_chunks(dataset, plan.records_per_job)
     else:
         # load directly from S3
         s3_uri = event['s3_uri']
         file_type = s3_uri.split('.')[-1]
         assert file_type in ['csv', 'parquet'], "File type must be csv or parquet"
         logger.info(f"Using S3 dataset at {s3_uri}")
+        # csv row counts are unknown without reading the whole file
+        num_records = utils.count_parquet_rows(s3_uri) if file_type == 'parquet' else None
+        plan = plan_jobs(
+            utils.sample_input(s3_uri, file_type, num_rows=PLANNER_SAMPLE_SIZE),
+            num_records, processor, model_id, event.get('prompt_id'), max_records_per_job,
+        )
+        chunks = utils.load_files_in_chunks(s3_uri, file_type, chunk_size=plan.records_per_job)
 
-    # load input in chunks
-    jobs_list: List[JobConfig] = []
+    if max_num_jobs:
+        chunks = itertools.islice(chunks, max_num_jobs)
 
     logger.info("Preparing batch inference job inputs (JSONL files)...")
-    for idx, input_df in utils.load_files_in_chunks(s3_uri, file_type, chunk_size=max_records_per_job):
-
-        if max_num_jobs:
-            if idx >= max_num_jobs:
-                logger.info(f"Reached max_num_jobs: {max_num_jobs}. Stopping here.")
-                break
-
-        # add a record_id to each row to allow for joining with outputs later
-        if 'record_id' not in input_df.columns:
-            input_df['record_id'] = [str(uuid4()) for _ in range(len(input_df))]
-
-        input_records = input_df.to_dict('records')
-        # transformation function
-        if processor.model_type == 'embedding':
-            records = [
-                processor.process_input(
-                    input_text=r['input_text'], record_id=r['record_id']
-                ) for r in input_records
-            ]
-
-        else:
-            # format the prompt - input df must have columns that match the formatting keys in the prompt
-            records = [
-                processor.process_input(
-                    input_text=pt.prompt_id_to_template[event['prompt_id']].format(**r),
-                    record_id=r['record_id']
-                ) for r in input_records
-            ]
-
-        job_name = utils.create_job_name(event['job_name_prefix'], index=idx)
-
-        input_parquet_path = f's3://{BUCKET_NAME}/batch_inputs_parquet/{event["job_name_prefix"]}/{str(idx).zfill(4)}.snappy.parquet'
-        input_key = f'batch_inputs_json/{event["job_name_prefix"]}/{str(idx).zfill(4)}.jsonl'
-        output_path = f's3://{BUCKET_NAME}/batch_outputs_json/{event["job_name_prefix"]}/{str(idx).zfill(4)}/'
-
-        if 'Unnamed: 0' in input_df.columns:
-            input_df = input_df.drop(columns=['Unnamed: 0'])
-        # save this file and keep in the config to allow for joins to the output by record id
-        wr.s3.to_parquet(input_df, path=input_parquet_path, index=False, compression='snappy')
-
-        job_config: JobConfig = {
-            'model_id': model_id,
-            'job_name': job_name,
-            'input_parquet_path': input_parquet_path,
-            's3_uri_input': write_jsonl_to_s3(records, input_key),
-            's3_uri_output': output_path,
-        }
-        jobs_list.append(job_config)
+    jobs_list = prepare_jobs(chunks, event, processor)
+    if max_num_jobs and len(jobs_list) == max_num_jobs:
+        logger.info(f"Reached max_num_jobs: {max_num_jobs}. Stopping here.")
 
     return {
-        'jobs': jobs_list
+        'jobs': jobs_list,
+        'job_name_prefix': event['job_name_prefix'],
+        'model_id': model_id,
+        'max_records_per_job': plan.records_per_job,
+        'retry_round': 0,
     }
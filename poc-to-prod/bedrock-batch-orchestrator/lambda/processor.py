@@ -1,7 +1,11 @@
 from abc import ABC, abstractmethod
-from typing import Dict, Literal
+from typing import Dict, List, Literal, Optional
+import os
+
+import pyarrow as pa
 
 from custom_types import BatchInferenceRecord
+from embeddings import EmbeddingDType, embedding_table
 
 
 """
@@ -34,6 +38,10 @@ class BaseProcessor(ABC):
         """Process model output JSON document"""
         pass
 
+    def outputs_to_arrow(self, outputs: List[Dict], schema: Optional[pa.Schema] = None) -> pa.Table:
+        """Convert a batch of process_output results to an Arrow table for the output parquet file"""
+        return pa.Table.from_pylist(outputs, schema=schema)
+
 
 class AnthropicProcessor(BaseProcessor):
     """Processor for Anthropic Models that use the Messages API"""
@@ -75,6 +83,9 @@ class TitanV2Processor(BaseProcessor):
 
     model_type = 'embedding'
 
+    def __init__(self, embedding_dtype: EmbeddingDType = 'float32'):
+        self.embedding_dtype = embedding_dtype
+
     def process_input(self, input_text: str, record_id: str, **kwargs) -> BatchInferenceRecord:
         """Prepare input according to V2 embedding request structure"""
         return {
@@ -92,13 +103,17 @@ class TitanV2Processor(BaseProcessor):
             'embedding': output_data['modelOutput']['embedding']
         }
 
+    def outputs_to_arrow(self, outputs: List[Dict], schema: Optional[pa.Schema] = None) -> pa.Table:
+        """Store embeddings as a FixedSizeList column (float32, float16 or int8) instead of lists of Python floats"""
+        return embedding_table(outputs, column='embedding', dtype=self.embedding_dtype)
+
 
 def get_processor_for_model_id(model_id: str) -> BaseProcessor:
     """Utility for getting the relevant BaseProcessor based on the model_id"""
     if 'anthropic' in model_id:
         return AnthropicProcessor()
     elif 'amazon.titan-embed-text-v2:0' in model_id:
-        return TitanV2Processor()
+        return TitanV2Processor(embedding_dtype=os.getenv('EMBEDDING_DTYPE', 'float32'))
     # add logic for additional providers here, e.g.
     # elif 'llama3' in model_id:
     #     return Llama3Processor()
@@ -0,0 +1,123 @@
+import utils
+from custom_types import JobConfig, JobConfigList
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import boto3
+import orjson
+import s3fs
+import math
+import os
+from typing import List
+
+
+logger = utils.get_logger()
+
+BUCKET_NAME = os.getenv('BUCKET_NAME')
+# how many times failed records are regrouped and resubmitted
+MAX_RETRY_ROUNDS: int = int(os.getenv('MAX_RETRY_ROUNDS', 1))
+# Bedrock rejects batch jobs below the per-model minimum number of records
+MIN_RECORDS_PER_JOB: int = int(os.getenv('MIN_RECORDS_PER_JOB', 100))
+
+# retry manifest columns added by postprocess.retry_manifest, not part of the original input
+MANIFEST_COLUMNS = ['model_input', 'error_code', 'error_message', 'retryable']
+
+s3_client = boto3.client('s3')
+s3_fs = s3fs.S3FileSystem()
+
+
+def read_retry_manifests(retry_paths: List[str]) -> pa.Table:
+    tables = []
+    for path in retry_paths:
+        with s3_fs.open(path, 'rb') as f:
+            tables.append(pq.read_table(f))
+    return pa.concat_tables(tables, promote_options='default')
+
+
+def lambda_handler(event, context) -> JobConfigList:
+    """
+    Regroups the failed records of all jobs in a run into fresh, evenly sized batch inference jobs.
+
+    Triggered by the step function after postprocessing, with the preprocess output (or the previous
+    regroup output) plus the postprocess results in `output_paths`, e.g.
+    {
+      "jobs": [...],
+      "job_name_prefix": "test-joke-job1",
+      "model_id": "anthropic.claude-3-haiku-20240307-v1:0",
+      "max_records_per_job": 1000,
+      "retry_round": 0,
+      "output_paths": [{"output_path": "...", "retry_path": "s3://.../retry_manifests/test-joke-job1/0000.snappy.parquet", ...}]
+    }
+
+    Only retryable records (throttled/timed out/server errors with a known model input) are resubmitted, so a
+    rerun costs only what failed. Returns a JobConfigList in the same format as preprocess.py; `jobs` is empty
+    when nothing is left to retry, MAX_RETRY_ROUNDS is reached, or there are fewer than MIN_RECORDS_PER_JOB
+    retryable records (those stay in the retry manifests). `output_parquet_paths` accumulates the output files
+    of every round.
+    """
+    retry_round = event.get('retry_round', 0) + 1
+    output_paths = [o for o in event.get('output_paths', []) if o]
+    retry_paths = [o['retry_path'] for o in output_paths if o.get('retry_path')]
+    result: JobConfigList = {
+        'jobs': [],
+        'job_name_prefix': event['job_name_prefix'],
+        'model_id': event['model_id'],
+        'max_records_per_job': event['max_records_per_job'],
+        'retry_round': retry_round,
+        # output parquet files of all rounds so far, returned as the step function output
+        'output_parquet_paths': event.get('output_parquet_paths', []) + [
+            o['output_path'] for o in output_paths if o.get('output_path')
+        ],
+    }
+
+    if not retry_paths:
+        logger.info('No failed records to retry.')
+        return result
+    if retry_round > MAX_RETRY_ROUNDS:
+        logger.info(f'Reached MAX_RETRY_ROUNDS ({MAX_RETRY_ROUNDS}). Failed records remain in {retry_paths}')
+        return result
+
+    manifest = read_retry_manifests(retry_paths)
+    retryable = manifest.filter(pc.field('retryable'))
+    logger.info(f'{manifest.num_rows} failed records, {retryable.num_rows} retryable')
+    if retryable.num_rows < MIN_RECORDS_PER_JOB:
+        logger.info(f'Fewer than MIN_RECORDS_PER_JOB ({MIN_RECORDS_PER_JOB}) retryable records, not resubmitting.')
+        return result
+
+    # spread the records evenly instead of leaving a small remainder job
+    num_jobs = math.ceil(retryable.num_rows / event['max_records_per_job'])
+    job_size = math.ceil(retryable.num_rows / num_jobs)
+    job_name_prefix = f"{event['job_name_prefix']}-retry{retry_round}"
+    input_columns = [c for c in retryable.column_names if c not in MANIFEST_COLUMNS]
+
+    for idx in range(num_jobs):
+        chunk = retryable.slice(idx * job_size, job_size)
+
+        input_parquet_path = f's3://{BUCKET_NAME}/batch_inputs_parquet/{job_name_prefix}/{str(idx).zfill(4)}.snappy.parquet'
+        input_key = f'batch_inputs_json/{job_name_prefix}/{str(idx).zfill(4)}.jsonl'
+        output_path = f's3://{BUCKET_NAME}/batch_outputs_json/{job_name_prefix}/{str(idx).zfill(4)}/'
+
+        with s3_fs.open(input_parquet_path, 'wb') as sink:
+            pq.write_table(chunk.select(input_columns), sink, compression='snappy')
+
+        # the model inputs are resubmitted as they were echoed in the original job output
+        records = (
+            {'recordId': record_id, 'modelInput': orjson.loads(model_input)}
+            for record_id, model_input in zip(
+                chunk.column('record_id').to_pylist(), chunk.column('model_input').to_pylist()
+            )
+        )
+        with utils.S3JsonlWriter(s3_client, BUCKET_NAME, input_key) as writer:
+            writer.write_all(records)
+
+        job_config: JobConfig = {
+            'model_id': event['model_id'],
+            'job_name': utils.create_job_name(job_name_prefix, index=idx),
+            'input_parquet_path': input_parquet_path,
+            's3_uri_input': writer.uri,
+            's3_uri_output': output_path,
+        }
+        result['jobs'].append(job_config)
+
+    logger.info(f'Regrouped {retryable.num_rows} records into {num_jobs} retry jobs')
+    return result
@@ -0,0 +1,137 @@
+from functools import lru_cache
+from string import Formatter
+from typing import Iterator, List, Optional, Tuple
+
+import orjson
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from processor import BaseProcessor
+
+
+"""
+Vectorized construction of batch inference records.
+
+Instead of formatting a prompt and building a request dict per row, a prompt template is compiled once into its
+literal and field parts and whole columns are joined with Arrow string kernels. Request bodies are serialized once
+per processor with placeholder values and split into byte fragments, so each JSONL line is just
+fragments + orjson-encoded record id and text, produced in chunks of rows.
+
+Templates with conversions, format specs or attribute/index lookups (e.g. `{x!r}`, `{x:>10}`, `{x.y}`) fall back to
+`str.format` per row, and processors whose request body can't be split fall back to serializing each record.
+"""
+
+RECORD_ID_PLACEHOLDER = '\x00record_id\x00'
+TEXT_PLACEHOLDER = '\x00input_text\x00'
+
+
+class CompiledTemplate:
+    """A prompt template parsed once into literal text and field names"""
+
+    def __init__(self, template: str):
+        self.template = template
+        self.parts: List[Tuple[str, Optional[str]]] = []
+        self.vectorizable = True
+        for literal, field, spec, conversion in Formatter().parse(template):
+            if field is not None and (spec or conversion or not field.isidentifier()):
+                self.vectorizable = False
+            self.parts.append((literal, field))
+
+    @property
+    def fields(self) -> List[str]:
+        return [field for _, field in self.parts if field is not None]
+
+    def render(self, df: pd.DataFrame) -> pa.Array:
+        """Format the template for every row of `df`, returning a string array"""
+        if not self.vectorizable:
+            return pa.array([self.template.format(**r) for r in df.to_dict('records')], pa.string())
+
+        columns = {field: _as_str_array(df[field]) for field in set(self.fields)}
+        pieces = []
+        for literal, field in self.parts:
+            if literal:
+                pieces.append(pa.scalar(literal))
+            if field is not None:
+                pieces.append(columns[field])
+        if not any(isinstance(piece, pa.Array) for piece in pieces):
+            return pa.array([self.template.format()] * len(df), pa.string())
+        if len(pieces) == 1:
+            return pieces[0]
+        return pc.binary_join_element_wise(*pieces, '')
+
+
+@lru_cache(maxsize=None)
+def compile_template(template: str) -> CompiledTemplate:
+    return CompiledTemplate(template)
+
+
+def _as_str_array(series: pd.Series, keep_nulls: bool = False) -> pa.Array:
+    """
+    String array matching str(value) per row, as str.format would render it. With `keep_nulls`, missing values
+    stay null (serialized as JSON null) instead of becoming 'None' / 'nan'.
+    """
+    try:
+        array = pa.array(series, from_pandas=keep_nulls)
+        if pa.types.is_string(array.type) and (keep_nulls or not array.null_count):
+            return array
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        pass
+    if keep_nulls:
+        return pa.array(series.map(str).where(series.notna(), None), pa.string())
+    return pa.array(series.map(str), pa.string())
+
+
+def _split_body(processor: BaseProcessor) -> Optional[List[bytes]]:
+    """
+    Byte fragments of a serialized record around the record id and text, i.e. [before id, between, after text],
+    or None if the placeholders don't each appear exactly once in that order.
+    """
+    record = processor.process_input(input_text=TEXT_PLACEHOLDER, record_id=RECORD_ID_PLACEHOLDER)
+    body = orjson.dumps(record)
+    record_id, text = orjson.dumps(RECORD_ID_PLACEHOLDER), orjson.dumps(TEXT_PLACEHOLDER)
+    if body.count(record_id) != 1 or body.count(text) != 1 or body.index(record_id) > body.index(text):
+        return None
+    head, rest = body.split(record_id)
+    middle, tail = rest.split(text)
+    return [head, middle, tail + b'\n']
+
+
+def iter_jsonl_chunks(
+    processor: BaseProcessor,
+    record_ids: pa.Array,
+    texts: pa.Array,
+    chunk_size: int = 10_000,
+) -> Iterator[Tuple[bytes, int]]:
+    """Yield (JSONL bytes, number of records) for chunks of `chunk_size` records"""
+    fragments = _split_body(processor)
+    dumps = orjson.dumps
+    for start in range(0, len(texts), chunk_size):
+        ids = record_ids[start:start + chunk_size].to_pylist()
+        chunk_texts = texts[start:start + chunk_size].to_pylist()
+        if fragments is None:
+            lines = [
+                dumps(processor.process_input(input_text=text, record_id=record_id)) + b'\n'
+                for record_id, text in zip(ids, chunk_texts)
+            ]
+        else:
+            head, middle, tail = fragments
+            lines = [head + dumps(record_id) + middle + dumps(text) + tail for record_id, text in zip(ids, chunk_texts)]
+        yield b''.join(lines), len(lines)
+
+
+def build_batch_inputs(
+    input_df: pd.DataFrame,
+    processor: BaseProcessor,
+    template: Optional[str] = None,
+    chunk_size: int = 10_000,
+) -> Iterator[Tuple[bytes, int]]:
+    """
+    JSONL batch input chunks for a DataFrame with a `record_id` column: `input_text` is used as is for embedding
+    models, otherwise the prompt `template` is formatted with the DataFrame's columns.
+    """
+    if processor.model_type == 'embedding' or template is None:
+        texts = _as_str_array(input_df['input_text'], keep_nulls=True)
+    else:
+        texts = compile_template(template).render(input_df)
+    return iter_jsonl_chunks(processor, _as_str_array(input_df['record_id']), texts, chunk_size=chunk_size)
@@ -3,20 +3,32 @@ import os
 from custom_types import JobConfig, TaskItem
 import boto3
 from botocore.config import Config
+from botocore.exceptions import ClientError
 
+import planner
 import utils
 
 
 logger = utils.get_logger()
 
-# increase the retries - can experience throttling when starting too many batch inference jobs at the same time
+# only a few client-side retries - sustained throttling is retried by the step function with jittered backoff
 config = Config(
     retries = {
-        'max_attempts': 100,
-        'mode': 'standard'
+        'max_attempts': 3,
+        'mode': 'adaptive'
     }
 )
 
+THROTTLING_ERROR_CODES = ['ThrottlingException', 'TooManyRequestsException', 'ServiceQuotaExceededException']
+
+
+class BatchJobQueueFull(Exception):
+    """The model already has its maximum number of concurrent batch inference jobs in flight"""
+
+
+class BatchJobThrottled(Exception):
+    """CreateModelInvocationJob was throttled or rejected by a service quota"""
+
 bedrock_client = boto3.client('bedrock', config=config)
 dynamodb = boto3.resource('dynamodb')
 task_table = dynamodb.Table(os.environ['TASK_TABLE'])
@@ -28,6 +40,10 @@ def lambda_handler(event, context) -> TaskItem:
     (including the task token from the step function) in a DynamoDB table.
 
     As jobs are updated, they will use the task token to send their status back to the step function.
+
+    Submission is admission-controlled: if the model already has MAX_CONCURRENT_JOBS jobs in flight (per the task
+    table), or the API call is throttled, BatchJobQueueFull / BatchJobThrottled is raised and the step function
+    retries the task with jittered exponential backoff.
     """
     task_token = event['taskToken']
     logger.info(f'Got task token {task_token}')
@@ -40,24 +56,36 @@ def lambda_handler(event, context) -> TaskItem:
     if job_timeout_hours > 0:
         additional_kwargs['timeoutDurationInHours'] = job_timeout_hours
 
+    quota = planner.get_quota(payload['model_id'])
+    in_flight_jobs = planner.count_in_flight_jobs(task_table, payload['model_id'])
+    if in_flight_jobs >= quota.max_concurrent_jobs:
+        raise BatchJobQueueFull(
+            f'{in_flight_jobs} jobs in flight for {payload["model_id"]} (max {quota.max_concurrent_jobs})'
+        )
+
     # kick off the async job
-    job_arn = bedrock_client.create_model_invocation_job(
-        jobName=payload['job_name'],
-        roleArn=os.environ['BEDROCK_ROLE_ARN'],
-        modelId=payload['model_id'],
-        inputDataConfig={
-            's3InputDataConfig': {
-                's3InputFormat': 'JSONL',
-                's3Uri': payload['s3_uri_input'],
-            }
-        },
-        outputDataConfig={
-            's3OutputDataConfig': {
-                's3Uri': payload['s3_uri_output'],
-            }
-        },
-        **additional_kwargs,
-    )['jobArn']
+    try:
+        job_arn = bedrock_client.create_model_invocation_job(
+            jobName=payload['job_name'],
+            roleArn=os.environ['BEDROCK_ROLE_ARN'],
+            modelId=payload['model_id'],
+            inputDataConfig={
+                's3InputDataConfig': {
+                    's3InputFormat': 'JSONL',
+                    's3Uri': payload['s3_uri_input'],
+                }
+            },
+            outputDataConfig={
+                's3OutputDataConfig': {
+                    's3Uri': payload['s3_uri_output'],
+                }
+            },
+            **additional_kwargs,
+        )['jobArn']
+    except ClientError as e:
+        if e.response['Error']['Code'] in THROTTLING_ERROR_CODES:
+            raise BatchJobThrottled(str(e)) from e
+        raise
     logger.info(f'Started job: {job_arn}')
 
     # make sure it was submitted successfully
@@ -70,6 +98,7 @@ def lambda_handler(event, context) -> TaskItem:
     task_item: TaskItem = {
         'job_arn': job_arn,
         'model_id': payload['model_id'],
+        'requested_model_id': payload['model_id'],
         'input_parquet_path': payload['input_parquet_path'],
         's3_uri_output': payload['s3_uri_output'],
         'status': job_details['status'],
@@ -1,8 +1,15 @@
+import queue
 import re
+import threading
 from uuid import uuid4
 import logging
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 import awswrangler as wr
-from typing import Literal
+import orjson
+import pandas as pd
+import pyarrow.parquet as pq
+import s3fs
+from typing import Dict, Iterable, Iterator, Literal
 
 
 def create_job_name(job_name_prefix: str, index: int) -> str:
@@ -67,3 +74,183 @@ def load_files_in_chunks(
 
     else:
         raise ValueError(f"Unsupported file type: {file_type}")
+
+
+def sample_input(s3_uri: str, file_type: Literal["csv", "parquet"], num_rows: int = 1000) -> pd.DataFrame:
+    """The first `num_rows` rows of an input file, used to estimate record sizes"""
+    return next(load_files_in_chunks(s3_uri, file_type, chunk_size=num_rows))[1]
+
+
+def count_parquet_rows(s3_uri: str) -> int:
+    """Total number of rows of a parquet file or prefix, from the file footers only"""
+    fs = s3fs.S3FileSystem()
+    paths = [p for p in fs.find(s3_uri) if p.endswith('.parquet')] if fs.isdir(s3_uri) else [s3_uri]
+    num_rows = 0
+    for path in paths:
+        with fs.open(path, 'rb') as f:
+            num_rows += pq.ParquetFile(f).metadata.num_rows
+    return num_rows
+
+
+def prefetch(iterable: Iterable, max_prefetch: int = 2) -> Iterator:
+    """
+    Iterate over `iterable` in a background thread, keeping up to `max_prefetch` items ready, so that
+    fetching the next item (e.g. a dataset download) overlaps with processing the current one.
+    """
+    items: queue.Queue = queue.Queue(maxsize=max_prefetch)
+    done = object()
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for item in iterable:
+                if stop.is_set():
+                    return
+                items.put((item, None))
+        except Exception as e:
+            items.put((None, e))
+        finally:
+            items.put((done, None))
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            item, error = items.get()
+            if error is not None:
+                raise error
+            if item is done:
+                return
+            yield item
+    finally:
+        stop.set()
+        # unblock the producer if it is waiting on a full queue
+        while producer.is_alive():
+            try:
+                items.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+
+class S3JsonlWriter:
+    """Stream JSON lines to S3 without holding the whole file in memory.
+
+    Records are serialized with orjson as they are written and uploaded in `part_size` parts through an S3
+    multipart upload. At most `max_pending_parts` parts are uploading while the next one is filled, so memory
+    is bounded by roughly (max_pending_parts + 1) * part_size regardless of the number of records.
+    Files smaller than one part are written with a single put_object.
+
+    Usage:
+        with S3JsonlWriter(s3_client, bucket, key) as writer:
+            writer.write_all(records)
+    """
+
+    MIN_PART_SIZE = 5 * 1024 * 1024  # S3 minimum for every part but the last
+
+    def __init__(self, s3_client, bucket: str, key: str, part_size: int = 8 * 1024 * 1024, max_pending_parts: int = 2):
+        if part_size < self.MIN_PART_SIZE:
+            raise ValueError(f'part_size must be at least {self.MIN_PART_SIZE} bytes')
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.max_pending_parts = max_pending_parts
+        self.num_records = 0
+
+        self._buffer: list[bytes] = []
+        self._buffer_size = 0
+        self._upload_id = None
+        self._part_number = 0
+        self._pending = set()
+        self._parts = []
+        self._executor = None
+
+    @property
+    def uri(self) -> str:
+        return f's3://{self.bucket}/{self.key}'
+
+    def write(self, record: Dict) -> None:
+        line = orjson.dumps(record, option=orjson.OPT_SERIALIZE_NUMPY) + b'\n'
+        self._buffer.append(line)
+        self._buffer_size += len(line)
+        self.num_records += 1
+        if self._buffer_size >= self.part_size:
+            self._upload_part()
+
+    def write_all(self, records: Iterable[Dict]) -> None:
+        for record in records:
+            self.write(record)
+
+    def write_lines(self, data: bytes, num_records: int) -> None:
+        """Write a chunk of already serialized, newline-terminated JSON lines"""
+        self._buffer.append(data)
+        self._buffer_size += len(data)
+        self.num_records += num_records
+        if self._buffer_size >= self.part_size:
+            self._upload_part()
+
+    def _upload_part(self) -> None:
+        if self._upload_id is None:
+            self._upload_id = self.s3_client.create_multipart_upload(Bucket=self.bucket, Key=self.key)['UploadId']
+            self._executor = ThreadPoolExecutor(max_workers=self.max_pending_parts)
+
+        # wait for a free slot before handing over the next part
+        while len(self._pending) >= self.max_pending_parts:
+            done, self._pending = wait(self._pending, return_when=FIRST_COMPLETED)
+            self._collect(done)
+
+        self._part_number += 1
+        body = b''.join(self._buffer)
+        self._buffer, self._buffer_size = [], 0
+        self._pending.add(self._executor.submit(self._put_part, self._part_number, body))
+
+    def _put_part(self, part_number: int, body: bytes) -> Dict:
+        response = self.s3_client.upload_part(
+            Bucket=self.bucket, Key=self.key, UploadId=self._upload_id, PartNumber=part_number, Body=body,
+        )
+        return {'PartNumber': part_number, 'ETag': response['ETag']}
+
+    def _collect(self, futures) -> None:
+        for future in futures:
+            self._parts.append(future.result())
+
+    def close(self) -> str:
+        """Upload the remaining data and complete the upload. Returns the S3 URI"""
+        if self._upload_id is None:
+            # the last line has no trailing newline, matching the previous '\n'.join() output
+            self.s3_client.put_object(Bucket=self.bucket, Key=self.key, Body=b''.join(self._buffer).rstrip(b'\n'))
+            self._buffer, self._buffer_size = [], 0
+            return self.uri
+
+        try:
+            if self._buffer:
+                self._upload_part()
+            self._collect(wait(self._pending).done)
+            self._pending = set()
+            self._executor.shutdown()
+            self.s3_client.complete_multipart_upload(
+                Bucket=self.bucket, Key=self.key, UploadId=self._upload_id,
+                MultipartUpload={'Parts': sorted(self._parts, key=lambda part: part['PartNumber'])},
+            )
+        except Exception:
+            # don't leave an incomplete multipart upload (and its stored parts) behind
+            self.abort()
+            raise
+        return self.uri
+
+    def abort(self) -> None:
+        """Discard the upload, e.g. after an error while generating records"""
+        if self._upload_id is not None:
+            wait(self._pending)
+            self._executor.shutdown()
+            self.s3_client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
@@ -16,6 +16,8 @@ import * as targets from 'aws-cdk-lib/aws-events-targets';
 export interface BedrockBatchOrchestratorStackProps extends cdk.StackProps {
   bedrockBatchInferenceMaxConcurrency: number;
   bedrockBatchInferenceTimeoutHours?: number;
+  bedrockBatchInferenceMaxRetryRounds?: number;
+  bedrockBatchInferenceMaxConcurrentJobs?: number;
 }
 
 
@@ -32,6 +34,12 @@ export class BedrockBatchOrchestratorStack extends cdk.Stack {
     const taskTable = new dynamodb.TableV2(this, 'taskTable', {
       partitionKey: { name: 'job_arn', type: dynamodb.AttributeType.STRING },
       removalPolicy: cdk.RemovalPolicy.DESTROY,
+      // jobs in flight per model, for admission control (lambda/planner.py)
+      globalSecondaryIndexes: [{
+        indexName: 'requested_model_id-status-index',
+        partitionKey: { name: 'requested_model_id', type: dynamodb.AttributeType.STRING },
+        sortKey: { name: 'status', type: dynamodb.AttributeType.STRING },
+      }],
     });
 
     // service role for bedrock batch inference
@@ -52,6 +60,12 @@ export class BedrockBatchOrchestratorStack extends cdk.Stack {
       ],
     }));
 
+    // concurrent batch inference jobs per model (account quota), used to plan and admit jobs
+    const maxConcurrentJobs = (props.bedrockBatchInferenceMaxConcurrentJobs ?? 10).toString();
+    // map iterations beyond the admitted jobs would only wait for a slot, so don't start more than that
+    const batchMapConcurrency = Math.min(
+        props.bedrockBatchInferenceMaxConcurrency, props.bedrockBatchInferenceMaxConcurrentJobs ?? 10);
+
     // lambda functions
     const preprocessFunction = new lambda.DockerImageFunction(this, 'preprocessFunction', {
       description: 'Prepare the bedrock batch input files',
@@ -61,13 +75,16 @@ export class BedrockBatchOrchestratorStack extends cdk.Stack {
       }),
       environment: {
         BUCKET_NAME: bucket.bucketName,
-        HF_HOME: '/tmp/huggingface'
+        HF_HOME: '/tmp/huggingface',
+        TASK_TABLE: taskTable.tableName,
+        MAX_CONCURRENT_JOBS: maxConcurrentJobs,
       },
       timeout: cdk.Duration.minutes(15),
       memorySize: 10240,  // recommend a large amount of memory if using max. batch sizes (50k records)
       ephemeralStorageSize: cdk.Size.mebibytes(512),
     });
     bucket.grantReadWrite(preprocessFunction);
+    taskTable.grantReadData(preprocessFunction);
 
     const startBatchInferenceFunction = new lambda.DockerImageFunction(this, 'startBatchInferenceFunction', {
       description: 'Starts the bedrock batch inference jobs',
@@ -79,6 +96,7 @@ export class BedrockBatchOrchestratorStack extends cdk.Stack {
         BEDROCK_ROLE_ARN: bedrockServiceRole.roleArn,
         TASK_TABLE: taskTable.tableName,
         JOB_TIMEOUT_HOURS: (props.bedrockBatchInferenceTimeoutHours ?? -1).toString(),
+        MAX_CONCURRENT_JOBS: maxConcurrentJobs,
       },
       timeout: cdk.Duration.minutes(5),
     });
@@ -135,6 +153,21 @@ export class BedrockBatchOrchestratorStack extends cdk.Stack {
     });
     bucket.grantReadWrite(postprocessFunction);
 
+    const regroupRetriesFunction = new lambda.DockerImageFunction(this, 'regroupRetriesFunction', {
+      description: 'Regroup failed records into new bedrock batch inference jobs',
+      code: lambda.DockerImageCode.fromImageAsset(path.join(__dirname, '../lambda'), {
+        platform: assets.Platform.LINUX_AMD64,
+        cmd: ['regroup_retries.lambda_handler']
+      }),
+      memorySize: 3008,
+      environment: {
+        BUCKET_NAME: bucket.bucketName,
+        MAX_RETRY_ROUNDS: (props.bedrockBatchInferenceMaxRetryRounds ?? 1).toString(),
+      },
+      timeout: cdk.Duration.minutes(15),
+    });
+    bucket.grantReadWrite(regroupRetriesFunction);
+
     // step function tasks
     const preprocessTask = new tasks.LambdaInvoke(this, 'preprocessTask', {
       lambdaFunction: preprocessFunction,
@@ -150,11 +183,31 @@ export class BedrockBatchOrchestratorStack extends cdk.Stack {
       }),
     });
 
-    // explicit retries to handle throttling errors in particular
+    // jobs are only submitted while the model has free concurrency slots; wait for a slot (or for throttling to
+    // clear) with jittered exponential backoff, so concurrent map iterations don't retry in lockstep
+    startBatchInferenceTask.addRetry({
+      errors: ['BatchJobQueueFull', 'BatchJobThrottled'],
+      interval: cdk.Duration.seconds(30),
+      backoffRate: 2,
+      maxDelay: cdk.Duration.minutes(15),
+      jitterStrategy: sfn.JitterType.FULL,
+      maxAttempts: 50,
+    });
     startBatchInferenceTask.addRetry({
       maxAttempts: 3,
     });
 
+    // slots can stay taken for as long as a job runs (other executions, jobs started outside the step function),
+    // which outlasts the retries above: once they run out, wait and try again instead of failing the execution
+    const waitForJobSlot = new sfn.Wait(this, 'waitForJobSlot', {
+      time: sfn.WaitTime.duration(cdk.Duration.minutes(15)),
+    });
+    startBatchInferenceTask.addCatch(waitForJobSlot, {
+      errors: ['BatchJobQueueFull', 'BatchJobThrottled'],
+      resultPath: sfn.JsonPath.DISCARD,
+    });
+    waitForJobSlot.next(startBatchInferenceTask);
+
     const postprocessMap = new sfn.Map(this, 'postprocessMap', {
       maxConcurrency: props.bedrockBatchInferenceMaxConcurrency,
       itemsPath: sfn.JsonPath.stringAt('$.completed_jobs'),
@@ -168,14 +221,26 @@ export class BedrockBatchOrchestratorStack extends cdk.Stack {
 
     // step function
     const batchProcessingMap = new sfn.Map(this, 'batchProcessingMap', {
-      maxConcurrency: props.bedrockBatchInferenceMaxConcurrency,
+      maxConcurrency: batchMapConcurrency,
       itemsPath: sfn.JsonPath.stringAt('$.jobs'),
       resultPath: '$.completed_jobs',
     });
 
+    // failed records of partially completed jobs are regrouped into new jobs, which loop back to the batch map
+    const regroupRetriesTask = new tasks.LambdaInvoke(this, 'regroupRetriesTask', {
+      lambdaFunction: regroupRetriesFunction,
+      outputPath: '$.Payload',
+    });
+
+    const retryChoice = new sfn.Choice(this, 'retryFailedRecords')
+        .when(sfn.Condition.isPresent('$.jobs[0]'), batchProcessingMap)
+        .otherwise(new sfn.Succeed(this, 'done'));
+
     const chain = preprocessTask
         .next(batchProcessingMap.itemProcessor(startBatchInferenceTask))
-        .next(postprocessMap.itemProcessor(postprocessTask));
+        .next(postprocessMap.itemProcessor(postprocessTask))
+        .next(regroupRetriesTask)
+        .next(retryChoice);
 
     // state machine
     const stepFunction = new sfn.StateMachine(this, 'bedrockBatchOrchestratorSfn', {